@@ -0,0 +1,261 @@
+"""
+Micro benchmarks for the dots_ocr pipeline.
+
+    python -m dots_ocr.benchmark encoding sample.pdf --pages 0 1 2
+    python -m dots_ocr.benchmark encoding sample.pdf --ocr --ip localhost --port 6006
+    python -m dots_ocr.benchmark clean --cases 50
+    python -m dots_ocr.benchmark clean --layout_json output/doc/doc_page_0.json --jsonl failcases.jsonl
+"""
+import argparse
+import base64
+import contextlib
+import difflib
+import json
+import os
+import random
+import time
+
+from dots_ocr.utils.doc_utils import iter_images_from_pdf
+from dots_ocr.utils.image_utils import encode_model_input
+from dots_ocr.utils.output_cleaner import OutputCleaner
+from dots_ocr.utils.prompts import dict_promptmode_to_prompt
+
+
+# (image_format, quality): quality None means lossless for WEBP
+ENCODING_CONFIGS = [
+    ('PNG', None),
+    ('JPEG', 95),
+    ('JPEG', 85),
+    ('JPEG', 75),
+    ('WEBP', None),
+    ('WEBP', 90),
+    ('WEBP', 80),
+]
+
+
+def _load_pages(pdf_path, pages=None, dpi=200):
+    wanted = set(pages) if pages else None
+    last = max(wanted) if wanted else None
+    return [
+        image for page_idx, image in iter_images_from_pdf(pdf_path, dpi=dpi, end_page_id=last)
+        if wanted is None or page_idx in wanted
+    ]
+
+
+def benchmark_encoding(pdf_path, pages=None, dpi=200, configs=ENCODING_CONFIGS, repeat=3, parser=None,
+                       prompt_mode='prompt_ocr'):
+    """
+    Compare page image encodings for the OCR request.
+
+    For every (format, quality) the pages are pre-sized to the smart_resize target and
+    encoded `repeat` times; the mean encode time and payload size per page are reported.
+    With a DotsOCRParser, every page is also OCR'd with each encoding and the text is
+    compared against the lossless PNG output (1 - difflib ratio, averaged over pages).
+
+    Returns:
+        list of dicts, one per config.
+    """
+    images = _load_pages(pdf_path, pages, dpi)
+    print(f"{len(images)} pages from {pdf_path} at {dpi} dpi")
+    prompt = dict_promptmode_to_prompt[prompt_mode]
+
+    rows = []
+    baseline_texts = None
+    for image_format, quality in configs:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            urls = [encode_model_input(image, image_format=image_format, quality=quality) for image in images]
+        encode_ms = (time.perf_counter() - start) / (repeat * len(images)) * 1000
+        payload_kb = sum(len(base64.b64decode(url.split('base64,', 1)[1])) for url in urls) / len(urls) / 1024
+
+        row = {
+            'format': image_format,
+            'quality': quality if quality is not None else 'lossless',
+            'encode_ms': round(encode_ms, 1),
+            'payload_kb': round(payload_kb, 1),
+            'request_kb': round(sum(len(url) for url in urls) / len(urls) / 1024, 1),
+        }
+        if parser is not None:
+            texts = [parser._inference_with_vllm(url, prompt) or '' for url in urls]
+            if baseline_texts is None:
+                baseline_texts = texts
+            deltas = [1 - difflib.SequenceMatcher(None, base, text).ratio()
+                      for base, text in zip(baseline_texts, texts)]
+            row['ocr_delta'] = round(sum(deltas) / len(deltas), 4)
+        rows.append(row)
+
+    columns = list(rows[0])
+    print(' | '.join(f"{c:>10}" for c in columns))
+    for row in rows:
+        print(' | '.join(f"{row[c]!s:>10}" for c in columns))
+    return rows
+
+
+def _synthetic_page(rng, n_cells=60, plain=False):
+    """Plain pages have no braces, quotes or backslashes in their text."""
+    vocabulary = ['layout', 'model', 'page', 'the', 'of', 'cell']
+    if not plain:
+        vocabulary += ['"quoted"', 'a\\b']
+    cells = []
+    y = 10
+    for i in range(n_cells):
+        height = rng.randint(20, 80)
+        category = rng.choice(['Text', 'Text', 'Text', 'Section-header', 'Formula', 'List-item'])
+        words = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(5, 60)))
+        if category == 'Formula' and not plain:
+            words = f"$$\\frac{{{i}}}{{x_{{{i}}}}} + \\sum_{{k}} a_{{k}}$$"
+        cells.append({"bbox": [50, y, 1600, y + height], "category": category, "text": words})
+        y += height + 5
+    return cells
+
+
+def _dumps(cells):
+    return json.dumps(cells, ensure_ascii=False)
+
+
+def make_broken_outputs(pages, cases_per_kind=20, seed=0):
+    """
+    Breaks valid cell lists the way model outputs break.
+
+    Returns:
+        list of (kind, output) pairs.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(cases_per_kind):
+        cells = rng.choice(pages)
+        text = _dumps(cells)
+        # hit max tokens somewhere after the first cell
+        cases.append(('truncated', text[:rng.randint(len(_dumps(cells[:1])), len(text) - 2)]))
+        # missing delimiters between some cells, output otherwise complete
+        cases.append(('missing_comma', text.replace('}, {', '}{', rng.randint(1, 5))))
+        # repetition loop on the last cell (same bbox), cut by max tokens
+        loop = cells[:rng.randint(1, len(cells))]
+        looped = _dumps(loop + [loop[-1]] * rng.randint(5, 200))
+        cases.append(('bbox_loop', looped[:len(looped) - rng.randint(1, 40)]))
+        # repetition loop of one text with drifting boxes
+        pair = dict(loop[-1])
+        drift = [dict(pair, bbox=[b + k for b in pair['bbox']]) for k in range(1, rng.randint(6, 200))]
+        looped = _dumps(loop + drift)
+        cases.append(('text_loop', looped[:len(looped) - rng.randint(1, 40)]))
+        # trailing junk after the array
+        cases.append(('garbage_tail', text + rng.choice(['\n\nassistant', ']]', '<|endoftext|>{"bb'])))
+        # a single cell cut inside its text
+        single = _dumps(cells[:1])
+        cases.append(('single_partial', single[:rng.randint(single.index('"text"') + 10, len(single) - 3)]))
+    return cases
+
+
+def _is_subsequence(short, long):
+    it = iter(long)
+    return all(any(item == other for other in it) for item in short)
+
+
+def benchmark_cleaner(pages=None, cases=None, cases_per_kind=20, repeat=3, seed=0):
+    """
+    Compare OutputCleaner.clean_model_output (single-pass streaming parser) against the
+    old multi-pass regex cleaner on a corpus of broken outputs.
+
+    Per kind of breakage: how often both return the same cells (`agree`), the same boxes
+    with different text (`same_boxes`: the old cleaner rewrites `}{` inside strings and
+    keeps raw escapes in a partial text), the new result only adding cells the old one
+    lost (`superset`: its regex fallback skips cells with braces in the text), anything
+    else (`other`), and the mean time per case. Stdout of both cleaners is discarded
+    while timing.
+
+    Args:
+        pages: valid cell lists to break; synthetic pages if None.
+        cases: extra (kind, output) pairs, e.g. real failures.
+    """
+    rng = random.Random(seed)
+    pages = pages or [_synthetic_page(rng, plain=k % 2 == 0) for k in range(6)]
+    corpus = make_broken_outputs(pages, cases_per_kind, seed) + list(cases or [])
+    cleaner = OutputCleaner()
+
+    stats = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for kind, output in corpus:
+            row = stats.setdefault(kind, {'kind': kind, 'cases': 0, 'agree': 0, 'same_boxes': 0, 'superset': 0,
+                                          'other': 0, 'old_ms': 0.0, 'new_ms': 0.0})
+            timings = {}
+            for name, clean in (('old', cleaner.clean_model_output_regex), ('new', cleaner.clean_model_output)):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    result = clean(output)
+                timings[name] = (time.perf_counter() - start) / repeat * 1000
+                if name == 'old':
+                    old = result
+            new = result
+            row['cases'] += 1
+            row['old_ms'] += timings['old']
+            row['new_ms'] += timings['new']
+            if new == old:
+                row['agree'] += 1
+            elif isinstance(old, list) and [c.get('bbox') for c in old] == [c.get('bbox') for c in new]:
+                row['same_boxes'] += 1
+            elif isinstance(old, list) and _is_subsequence([c.get('bbox') for c in old], [c.get('bbox') for c in new]):
+                row['superset'] += 1
+            else:
+                row['other'] += 1
+
+    rows = []
+    for row in stats.values():
+        row['old_ms'] = round(row['old_ms'] / row['cases'], 3)
+        row['new_ms'] = round(row['new_ms'] / row['cases'], 3)
+        row['speedup'] = round(row['old_ms'] / max(row['new_ms'], 1e-6), 1)
+        rows.append(row)
+    columns = list(rows[0])
+    print(' | '.join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print(' | '.join(f"{row[c]!s:>14}" for c in columns))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dots_ocr benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    encoding = sub.add_parser('encoding', help="page image encoding: time, payload size, ocr delta")
+    encoding.add_argument('pdf_path')
+    encoding.add_argument('--pages', type=int, nargs='*', default=None, help="page indices, default all")
+    encoding.add_argument('--dpi', type=int, default=200)
+    encoding.add_argument('--repeat', type=int, default=3)
+    encoding.add_argument('--ocr', action='store_true', help="also compare OCR output against PNG")
+    encoding.add_argument('--ip', default='localhost')
+    encoding.add_argument('--port', type=int, default=6006)
+    encoding.add_argument('--model_name', default='dots_ocr')
+
+    clean = sub.add_parser('clean', help="broken output repair: old regex cleaner vs streaming parser")
+    clean.add_argument('--layout_json', nargs='*', default=None, help="cell lists to break, default synthetic")
+    clean.add_argument('--jsonl', default=None, help="real failures, one json per line with a 'predict' field")
+    clean.add_argument('--cases', type=int, default=20, help="cases per kind of breakage")
+    clean.add_argument('--repeat', type=int, default=3)
+    clean.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'encoding':
+        ocr_parser = None
+        if args.ocr:
+            from dots_ocr.parser import DotsOCRParser
+            ocr_parser = DotsOCRParser(ip=args.ip, port=args.port, model_name=args.model_name, dpi=args.dpi)
+        try:
+            benchmark_encoding(args.pdf_path, pages=args.pages, dpi=args.dpi, repeat=args.repeat, parser=ocr_parser)
+        finally:
+            if ocr_parser is not None:
+                ocr_parser.close()
+    elif args.command == 'clean':
+        pages = None
+        if args.layout_json:
+            pages = []
+            for path in args.layout_json:
+                with open(path, encoding='utf-8') as f:
+                    pages.append(json.load(f))
+        cases = []
+        if args.jsonl:
+            with open(args.jsonl, encoding='utf-8') as f:
+                cases = [('jsonl', json.loads(line)['predict']) for line in f if line.strip()]
+        benchmark_cleaner(pages, cases, cases_per_kind=args.cases, repeat=args.repeat, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
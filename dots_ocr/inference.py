@@ -2,48 +2,165 @@ import json
 import io
 import base64
 import math
+import asyncio
+import random
+import threading
 from PIL import Image
-import requests
+import httpx
 from dots_ocr.utils.image_utils import PILimage_to_base64
-from openai import OpenAI
+from dots_ocr.utils.output_cleaner import StreamingCellParser
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, RateLimitError, InternalServerError
 import os
 
 
-def inference_with_vllm(
-        image,
-        prompt,
-        ip="localhost",
-        port=6006,
-        temperature=0.1,
-        top_p=0.9,
-        max_completion_tokens=32768,
-        model_name='dots_ocr',
-):
-    addr = f"http://{ip}:{port}/v1"
-    client = OpenAI(api_key="{}".format(os.environ.get("API_KEY", "0")), base_url=addr)
-    messages = []
-    messages.append(
+# errors worth retrying: connection resets / timeouts (also mid-stream), server overload, 5xx
+TRANSIENT_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, httpx.TransportError)
+
+
+def build_messages(image, prompt):
+    return [
         {
             "role": "user",
             "content": [
                 {
                     "type": "image_url",
-                    "image_url": {"url": PILimage_to_base64(image)},
+                    # image may already be encoded as a data url (e.g. in a worker process)
+                    "image_url": {"url": image if isinstance(image, str) else PILimage_to_base64(image)},
                 },
                 {"type": "text", "text": f"<|img|><|imgpad|><|endofimg|>{prompt}"}
                 # if no "<|img|><|imgpad|><|endofimg|>" here,vllm v1 will add "\n" here
             ],
         }
-    )
-    try:
-        response = client.chat.completions.create(
+    ]
+
+
+class VllmClient:
+    """
+    Async client for an OpenAI-compatible vLLM server.
+
+    Created once per parser and shared by all pages: one keep-alive connection pool,
+    at most max_in_flight concurrent requests, a per-request timeout, and retries with
+    exponential backoff on transient errors. Non-transient errors are raised.
+    """
+
+    def __init__(
+            self,
+            ip="localhost",
+            port=6006,
+            model_name='dots_ocr',
+            temperature=0.1,
+            top_p=0.9,
+            max_completion_tokens=32768,
+            max_in_flight=64,
+            timeout=600.0,
+            max_retries=3,
+            backoff=1.0,
+    ):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_completion_tokens = max_completion_tokens
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.client = AsyncOpenAI(
+            api_key="{}".format(os.environ.get("API_KEY", "0")),
+            base_url=f"http://{ip}:{port}/v1",
+            timeout=timeout,
+            max_retries=0,  # retried below, so backoff and logging stay in one place
+            http_client=httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+            ),
+        )
+
+    async def chat(self, image, prompt, repeat_limit=0):
+        """
+        Args:
+            repeat_limit: for prompts answered with a json list of cells. When > 0 the
+                completion is streamed and parsed as it arrives; once repeat_limit cells in
+                a row are duplicates (a repetition loop, see StreamingCellParser) the request
+                is cancelled and the de-duplicated cells so far are returned as a json list.
+        """
+        messages = build_messages(image, prompt)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    if repeat_limit > 0:
+                        return await self._stream_cells(messages, repeat_limit)
+                    response = await self.client.chat.completions.create(
+                        messages=messages,
+                        model=self.model_name,
+                        max_completion_tokens=self.max_completion_tokens,
+                        temperature=self.temperature,
+                        top_p=self.top_p)
+                    return response.choices[0].message.content
+                except TRANSIENT_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    wait = self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+                    print(f"request error: {e}, retry {attempt + 1}/{self.max_retries} in {wait:.1f}s")
+                    await asyncio.sleep(wait)
+
+    async def _stream_cells(self, messages, repeat_limit):
+        stream = await self.client.chat.completions.create(
             messages=messages,
-            model=model_name,
-            max_completion_tokens=max_completion_tokens,
-            temperature=temperature,
-            top_p=top_p)
-        response = response.choices[0].message.content
-        return response
-    except requests.exceptions.RequestException as e:
-        print(f"request error: {e}")
-        return None
\ No newline at end of file
+            model=self.model_name,
+            max_completion_tokens=self.max_completion_tokens,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            stream=True)
+        parser = StreamingCellParser()
+        parts = []
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                parser.feed(delta)
+                if parser.repeat_run >= repeat_limit:
+                    cells = parser.close()
+                    print(f"repetition loop: {parser.repeat_run} duplicate cells in a row, request stopped after "
+                          f"{sum(len(part) for part in parts):,} chars, keeping {len(cells)} cells")
+                    return json.dumps(cells, ensure_ascii=False)
+        finally:
+            # closing the response makes the server abort the generation
+            await stream.close()
+        return ''.join(parts)
+
+    async def aclose(self):
+        await self.client.close()
+
+
+# sync clients are cached per server so repeated calls reuse the keep-alive connection pool
+_sync_clients = {}
+_sync_clients_lock = threading.Lock()
+
+
+def _get_sync_client(addr):
+    with _sync_clients_lock:
+        if addr not in _sync_clients:
+            _sync_clients[addr] = OpenAI(api_key="{}".format(os.environ.get("API_KEY", "0")), base_url=addr)
+        return _sync_clients[addr]
+
+
+def inference_with_vllm(
+        image,
+        prompt,
+        ip="localhost",
+        port=6006,
+        temperature=0.1,
+        top_p=0.9,
+        max_completion_tokens=32768,
+        model_name='dots_ocr',
+):
+    addr = f"http://{ip}:{port}/v1"
+    client = _get_sync_client(addr)
+    response = client.chat.completions.create(
+        messages=build_messages(image, prompt),
+        model=model_name,
+        max_completion_tokens=max_completion_tokens,
+        temperature=temperature,
+        top_p=top_p)
+    return response.choices[0].message.content
@@ -1,19 +1,241 @@
 import os
 import json
+import asyncio
+import threading
+from functools import partial
 from typing import Optional, Tuple
 
+import fitz
+
 from tqdm import tqdm
-from multiprocessing.pool import ThreadPool, Pool
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 
 
-from dots_ocr.inference import inference_with_vllm
+from dots_ocr.inference import VllmClient
 from dots_ocr.utils.consts import image_extensions, MIN_PIXELS, MAX_PIXELS
-from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize
-from dots_ocr.utils.doc_utils import fitz_doc_to_image, load_images_from_pdf
+from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize, encode_model_input
+from dots_ocr.utils.doc_utils import fitz_doc_to_image, iter_images_from_pdf, analyze_pdf, scale_cells, SupportedPdfParseMethod
 from dots_ocr.utils.prompts import dict_promptmode_to_prompt
 from dots_ocr.utils.layout_utils import post_process_output, draw_layout_on_image, pre_process_bboxes
 from dots_ocr.utils.format_transformer import layoutjson2md
+from dots_ocr.utils.ocr_cache import OcrResponseCache, file_sha256
+from dots_ocr.utils.page_journal import PageJournal
+
+
+# sub directory of a document's output dir holding the picture crops its markdown links to
+PAGE_IMAGE_DIR = 'images'
+
+
+def postprocess_page(
+    response,
+    prompt_mode,
+    save_dir,
+    save_name,
+    origin_image,
+    image,
+    min_pixels,
+    max_pixels,
+    input_height,
+    input_width,
+    source="image",
+    page_idx=0,
+    cells=None,
+    save_layout_image=False,
+    ):
+    """
+    Turn a model response into page artifacts (json / layout image / markdown) on disk.
+
+    Module level so it can run in a worker process as well as in the calling thread.
+    cells: layout cells in origin image coordinates that replace the model response
+    (pages parsed from the pdf text layer).
+    save_layout_image: also write <save_name>.jpg with the layout drawn on the page (debug artifact).
+    """
+    # 确保目录存在（多进程环境下需要）
+    os.makedirs(save_dir, exist_ok=True)
+
+    result = {'page_no': page_idx,
+        "input_height": input_height,
+        "input_width": input_width
+    }
+    if source == 'pdf':
+        save_name = f"{save_name}_page_{page_idx}"
+    if prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_grounding_ocr']:
+        if cells is not None:
+            filtered = False
+        else:
+            cells, filtered = post_process_output(
+                response, 
+                prompt_mode, 
+                origin_image, 
+                image,
+                min_pixels=min_pixels, 
+                max_pixels=max_pixels,
+                )
+        if filtered and prompt_mode != 'prompt_layout_only_en':  # model output json failed, use filtered process
+            json_file_path = os.path.join(save_dir, f"{save_name}.json")
+            with open(json_file_path, 'w', encoding="utf-8") as w:
+                json.dump(response, w, ensure_ascii=False)
+
+            result.update({
+                'layout_info_path': json_file_path,
+            })
+            if save_layout_image:
+                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
+                origin_image.save(image_layout_path)
+                result.update({
+                    'layout_image_path': image_layout_path,
+                })
+
+            md_file_path = os.path.join(save_dir, f"{save_name}.md")
+            with open(md_file_path, "w", encoding="utf-8") as md_file:
+                md_file.write(cells)
+            result.update({
+                'md_content_path': md_file_path
+            })
+            result.update({
+                'filtered': True
+            })
+        else:
+            json_file_path = os.path.join(save_dir, f"{save_name}.json")
+            with open(json_file_path, 'w', encoding="utf-8") as w:
+                json.dump(cells, w, ensure_ascii=False)
+            result.update({
+                'layout_info_path': json_file_path,
+            })
+
+            if save_layout_image:
+                try:
+                    image_with_layout = draw_layout_on_image(origin_image, cells)
+                except Exception as e:
+                    print(f"Error drawing layout on image: {e}")
+                    image_with_layout = origin_image
+
+                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
+                image_with_layout.save(image_layout_path)
+                result.update({
+                    'layout_image_path': image_layout_path,
+                })
+            if prompt_mode != "prompt_layout_only_en":  # no text md when detection only
+                # picture crops go to save_dir/images/<content hash>.png, the markdown links them
+                image_dir = os.path.join(save_dir, PAGE_IMAGE_DIR)
+                md_content = layoutjson2md(origin_image, cells, text_key='text', image_dir=image_dir, md_dir=save_dir)
+                md_content_no_hf = layoutjson2md(origin_image, cells, text_key='text', no_page_hf=True,
+                                                 image_dir=image_dir, md_dir=save_dir) # used for clean output or metric of omnidocbench、olmbench 
+                md_file_path = os.path.join(save_dir, f"{save_name}.md")
+                with open(md_file_path, "w", encoding="utf-8") as md_file:
+                    md_file.write(md_content)
+                md_nohf_file_path = os.path.join(save_dir, f"{save_name}_nohf.md")
+                with open(md_nohf_file_path, "w", encoding="utf-8") as md_file:
+                    md_file.write(md_content_no_hf)
+                result.update({
+                    'md_content_path': md_file_path,
+                    'md_content_nohf_path': md_nohf_file_path,
+                })
+    else:
+        if save_layout_image:
+            image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
+            origin_image.save(image_layout_path)
+            result.update({
+                'layout_image_path': image_layout_path,
+            })
+
+        md_content = response
+        md_file_path = os.path.join(save_dir, f"{save_name}.md")
+        with open(md_file_path, "w", encoding="utf-8") as md_file:
+            md_file.write(md_content)
+        result.update({
+            'md_content_path': md_file_path,
+        })
+
+    return result
+
+
+# prompt modes answered with a json list of layout cells
+LAYOUT_PROMPT_MODES = ('prompt_layout_all_en', 'prompt_layout_only_en')
+# prompt modes whose output a pdf text layer can stand in for
+TEXT_LAYER_PROMPT_MODES = LAYOUT_PROMPT_MODES
+
+
+# each worker process keeps the pdf it is rendering open between pages
+_worker_pdf = {}
+
+
+def _render_worker_page(pdf_path, page_idx, dpi):
+    doc = _worker_pdf.get(pdf_path)
+    if doc is None:
+        for opened in _worker_pdf.values():
+            opened.close()
+        _worker_pdf.clear()
+        doc = _worker_pdf[pdf_path] = fitz.open(pdf_path)
+    return fitz_doc_to_image(doc[page_idx], target_dpi=dpi)
+
+
+def render_pdf_page(pdf_path, page_idx, dpi, min_pixels=None, max_pixels=None, encoding=None, encode=True):
+    """
+    Render one pdf page and encode the model input, in a worker process.
+
+    Only the rendered page comes back with the payload; the resized model input is
+    cheap to derive from it again in postprocess_pdf_page, so it is not pickled.
+
+    Returns:
+        tuple: (origin_image, image_url)
+    """
+    origin_image = _render_worker_page(pdf_path, page_idx, dpi)
+    _, image_url = encode_page_image(origin_image, min_pixels, max_pixels, encoding, encode)
+    return origin_image, image_url
+
+
+def postprocess_pdf_page(pdf_path, page_idx, dpi, response, prompt_mode, save_dir, save_name,
+                         min_pixels=None, max_pixels=None, origin_image=None, text_layer=None,
+                         save_layout_image=False):
+    """
+    postprocess_page for a pdf page in a worker process.
+
+    origin_image: the page returned by render_pdf_page; None renders it here (text layer
+    pages, which are rendered and written in this one call).
+    text_layer: {'cells', 'width'} from analyze_pdf, replaces the model response.
+    """
+    if origin_image is None:
+        origin_image = _render_worker_page(pdf_path, page_idx, dpi)
+    cells = None
+    if text_layer is not None:
+        image = origin_image
+        cells = scale_cells(text_layer['cells'], origin_image.width / text_layer['width'])
+        input_height, input_width = origin_image.height, origin_image.width
+    else:
+        image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
+        input_height, input_width = smart_resize(image.height, image.width)
+    return postprocess_page(
+        response, prompt_mode, save_dir, save_name, origin_image, image,
+        min_pixels, max_pixels, input_height, input_width, source="pdf", page_idx=page_idx, cells=cells,
+        save_layout_image=save_layout_image,
+    )
+
+
+def encode_page_image(origin_image, min_pixels=None, max_pixels=None, encoding=None, encode=True):
+    """
+    Resize a page to the model input and encode it as a data url.
+
+    Args:
+        encoding: keyword arguments for encode_model_input (image_format, quality, presize).
+        encode: False skips encoding (the response is already cached), image_url is then None.
+
+    Returns:
+        tuple: (image, image_url); image is None when it equals origin_image.
+    """
+    image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
+    image_url = encode_model_input(image, **(encoding or {})) if encode else None
+    if image.size == origin_image.size:
+        image = None
+    return image, image_url
+
+
+async def _anext_or_none(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return None
 
 
 class DotsOCRParser:
@@ -34,8 +256,47 @@ class DotsOCRParser:
             min_pixels=None,
             max_pixels=None,
             use_hf=False,
+            prefetch_pages=4,
+            cpu_workers=None,
+            request_timeout=600.0,
+            max_retries=3,
+            image_format='PNG',
+            image_quality=None,
+            presize_images=True,
+            use_cache=True,
+            cache_path=None,
+            parse_method=SupportedPdfParseMethod.OCR,
+            save_layout_image=False,
+            repeat_limit=10,
         ):
         self.dpi = dpi
+        # how page images are encoded for the vllm request, see encode_model_input
+        self.encoding = {'image_format': image_format, 'quality': image_quality, 'presize': presize_images}
+        # raw model responses are cached per (document hash, page, request settings), default under output_dir
+        self.use_cache = use_cache
+        self.cache_path = cache_path or os.path.join(output_dir, "ocr_cache.sqlite3")
+        self._cache = None
+        # OCR: every pdf page goes to the model; TXT / AUTO: use the pdf text layer (AUTO: where usable)
+        self.parse_method = SupportedPdfParseMethod(parse_method)
+        # the page jpg with the layout drawn on it is a debug artifact, off unless asked for
+        self.save_layout_image = save_layout_image
+        # number of pdf pages rendered ahead of the inference pool
+        self.prefetch_pages = prefetch_pages
+        # processes for cpu-bound pdf page stages (render / encode / post-process); 0 keeps everything on threads
+        if cpu_workers is None:
+            cpu_workers = 0 if use_hf else (os.cpu_count() or 1)
+        self.cpu_workers = cpu_workers
+        self._cpu_pool = None
+        self._cpu_pool_lock = threading.Lock()
+        # one async vllm client per parser, living on the parser's own event loop thread
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        # layout responses are streamed and cut off after this many duplicate cells in a row; 0 disables
+        self.repeat_limit = repeat_limit
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        self._client = None
 
         # default args for vllm server
         self.ip = ip
@@ -55,7 +316,7 @@ class DotsOCRParser:
             # self._load_hf_model()
             print(f"use hf model, num_thread will be set to 1")
         else:
-            print(f"use vllm model, num_thread will be set to {self.num_thread}")
+            print(f"use vllm model, max in-flight requests will be set to {self.num_thread}")
         assert self.min_pixels is None or self.min_pixels >= MIN_PIXELS
         assert self.max_pixels is None or self.max_pixels <= MAX_PIXELS
 
@@ -116,18 +377,42 @@ class DotsOCRParser:
         )[0]
         return response
 
-    def _inference_with_vllm(self, image, prompt):
-        response = inference_with_vllm(
-            image,
-            prompt, 
-            model_name=self.model_name,
-            ip=self.ip,
-            port=self.port,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            max_completion_tokens=self.max_completion_tokens,
-        )
-        return response
+    def _get_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="dots-ocr-loop", daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    def _run(self, coro):
+        """Run a coroutine on the parser's event loop and wait for its result (from a sync caller)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    def _get_client(self):
+        # only called on the loop thread
+        if self._client is None:
+            self._client = VllmClient(
+                ip=self.ip,
+                port=self.port,
+                model_name=self.model_name,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                max_completion_tokens=self.max_completion_tokens,
+                max_in_flight=self.num_thread,
+                timeout=self.request_timeout,
+                max_retries=self.max_retries,
+            )
+        return self._client
+
+    def _repeat_limit(self, prompt_mode):
+        return self.repeat_limit if prompt_mode in LAYOUT_PROMPT_MODES else 0
+
+    async def _ainference_with_vllm(self, image, prompt, repeat_limit=0):
+        return await self._get_client().chat(image, prompt, repeat_limit=repeat_limit)
+
+    def _inference_with_vllm(self, image, prompt, repeat_limit=0):
+        return self._run(self._ainference_with_vllm(image, prompt, repeat_limit))
 
     def get_prompt(self, prompt_mode, bbox=None, origin_image=None, image=None, min_pixels=None, max_pixels=None):
         prompt = dict_promptmode_to_prompt[prompt_mode]
@@ -138,6 +423,35 @@ class DotsOCRParser:
             prompt = prompt + str(bbox)
         return prompt
 
+    def _resolve_pixels(self, prompt_mode):
+        min_pixels, max_pixels = self.min_pixels, self.max_pixels
+        if prompt_mode == "prompt_grounding_ocr":
+            min_pixels = min_pixels or MIN_PIXELS  # preprocess image to the final input
+            max_pixels = max_pixels or MAX_PIXELS
+        if min_pixels is not None: assert min_pixels >= MIN_PIXELS, f"min_pixels should >= {MIN_PIXELS}"
+        if max_pixels is not None: assert max_pixels <= MAX_PIXELS, f"max_pixels should <+ {MAX_PIXELS}"
+        return min_pixels, max_pixels
+
+    def _get_cache(self):
+        if self._cache is None:
+            self._cache = OcrResponseCache(self.cache_path)
+        return self._cache
+
+    def _cache_key(self, doc_hash, page_idx, prompt_mode, min_pixels, max_pixels, **extra):
+        """
+        Key of a page's raw response, None when caching is off or the input has no file hash.
+        The repetition cutoff and the sampling settings are part of the key: a response cut
+        short under one limit, or sampled with other settings, is not replayed after they change.
+        """
+        if not self.use_cache or doc_hash is None:
+            return None
+        return OcrResponseCache.make_key(
+            doc_hash, page_idx, prompt_mode, self.dpi, min_pixels, max_pixels, self.model_name,
+            use_hf=self.use_hf, repeat_limit=self._repeat_limit(prompt_mode),
+            temperature=self.temperature, top_p=self.top_p, max_completion_tokens=self.max_completion_tokens,
+            **self.encoding, **extra,
+        )
+
     # def post_process_results(self, response, prompt_mode, save_dir, save_name, origin_image, image, min_pixels, max_pixels)
     def _parse_single_image(
         self, 
@@ -149,16 +463,11 @@ class DotsOCRParser:
         page_idx=0, 
         bbox=None,
         fitz_preprocess=False,
+        doc_hash=None,
         ):
-        # 确保目录存在（多进程环境下需要）
-        os.makedirs(save_dir, exist_ok=True)
-
-        min_pixels, max_pixels = self.min_pixels, self.max_pixels
-        if prompt_mode == "prompt_grounding_ocr":
-            min_pixels = min_pixels or MIN_PIXELS  # preprocess image to the final input
-            max_pixels = max_pixels or MAX_PIXELS
-        if min_pixels is not None: assert min_pixels >= MIN_PIXELS, f"min_pixels should >= {MIN_PIXELS}"
-        if max_pixels is not None: assert max_pixels <= MAX_PIXELS, f"max_pixels should <+ {MAX_PIXELS}"
+        min_pixels, max_pixels = self._resolve_pixels(prompt_mode)
+        cache_key = self._cache_key(doc_hash, page_idx, prompt_mode, min_pixels, max_pixels,
+                                    bbox=bbox, fitz_preprocess=fitz_preprocess)
 
         if source == 'image' and fitz_preprocess:
             image = get_image_by_fitz_doc(origin_image, target_dpi=self.dpi)
@@ -167,133 +476,251 @@ class DotsOCRParser:
             image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
         input_height, input_width = smart_resize(image.height, image.width)
         prompt = self.get_prompt(prompt_mode, bbox, origin_image, image, min_pixels=min_pixels, max_pixels=max_pixels)
-        if self.use_hf:
-            response = self._inference_with_hf(image, prompt)
-        else:
-            response = self._inference_with_vllm(image, prompt)
-        result = {'page_no': page_idx,
-            "input_height": input_height,
-            "input_width": input_width
-        }
-        if source == 'pdf':
-            save_name = f"{save_name}_page_{page_idx}"
-        if prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_grounding_ocr']:
-            cells, filtered = post_process_output(
-                response, 
-                prompt_mode, 
-                origin_image, 
-                image,
-                min_pixels=min_pixels, 
-                max_pixels=max_pixels,
-                )
-            if filtered and prompt_mode != 'prompt_layout_only_en':  # model output json failed, use filtered process
-                json_file_path = os.path.join(save_dir, f"{save_name}.json")
-                with open(json_file_path, 'w', encoding="utf-8") as w:
-                    json.dump(response, w, ensure_ascii=False)
-
-                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-                origin_image.save(image_layout_path)
-                result.update({
-                    'layout_info_path': json_file_path,
-                    'layout_image_path': image_layout_path,
-                })
-
-                md_file_path = os.path.join(save_dir, f"{save_name}.md")
-                with open(md_file_path, "w", encoding="utf-8") as md_file:
-                    md_file.write(cells)
-                result.update({
-                    'md_content_path': md_file_path
-                })
-                result.update({
-                    'filtered': True
-                })
+        response = self._get_cache().get(cache_key) if cache_key else None
+        if response is None:
+            if self.use_hf:
+                response = self._inference_with_hf(image, prompt)
             else:
-                try:
-                    image_with_layout = draw_layout_on_image(origin_image, cells)
-                except Exception as e:
-                    print(f"Error drawing layout on image: {e}")
-                    image_with_layout = origin_image
-
-                json_file_path = os.path.join(save_dir, f"{save_name}.json")
-                with open(json_file_path, 'w', encoding="utf-8") as w:
-                    json.dump(cells, w, ensure_ascii=False)
+                response = self._inference_with_vllm(
+                    encode_model_input(image, **self.encoding), prompt, self._repeat_limit(prompt_mode)
+                )
+            if cache_key:
+                self._get_cache().set(cache_key, response)
+        return postprocess_page(
+            response, prompt_mode, save_dir, save_name, origin_image, image,
+            min_pixels, max_pixels, input_height, input_width, source=source, page_idx=page_idx,
+            save_layout_image=self.save_layout_image,
+        )
 
-                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-                image_with_layout.save(image_layout_path)
-                result.update({
-                    'layout_info_path': json_file_path,
-                    'layout_image_path': image_layout_path,
-                })
-                if prompt_mode != "prompt_layout_only_en":  # no text md when detection only
-                    md_content = layoutjson2md(origin_image, cells, text_key='text')
-                    md_content_no_hf = layoutjson2md(origin_image, cells, text_key='text', no_page_hf=True) # used for clean output or metric of omnidocbench、olmbench 
-                    md_file_path = os.path.join(save_dir, f"{save_name}.md")
-                    with open(md_file_path, "w", encoding="utf-8") as md_file:
-                        md_file.write(md_content)
-                    md_nohf_file_path = os.path.join(save_dir, f"{save_name}_nohf.md")
-                    with open(md_nohf_file_path, "w", encoding="utf-8") as md_file:
-                        md_file.write(md_content_no_hf)
-                    result.update({
-                        'md_content_path': md_file_path,
-                        'md_content_nohf_path': md_nohf_file_path,
-                    })
+    def _get_cpu_pool(self):
+        with self._cpu_pool_lock:
+            if self._cpu_pool is None:
+                self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+            return self._cpu_pool
+
+    def close(self):
+        """Shut down the process pool, the vllm client / event loop and the response cache."""
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+        with self._cpu_pool_lock:
+            if self._cpu_pool is not None:
+                self._cpu_pool.shutdown(wait=True, cancel_futures=True)
+                self._cpu_pool = None
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            if self._client is not None:
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result()
+                self._client = None
+            asyncio.run_coroutine_threadsafe(loop.shutdown_default_executor(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._loop_thread.join()
+            loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def _atext_layer_page(self, input_path, page_idx, origin_image, prompt_mode, save_dir, save_name, text_layer):
+        """Build a pdf page's artifacts from its text layer, without calling the model."""
+        loop = asyncio.get_running_loop()
+        if self.cpu_workers and not self.use_hf:
+            # rendered and written in one worker call, the page image never leaves the worker
+            result = await loop.run_in_executor(self._get_cpu_pool(), partial(
+                postprocess_pdf_page, input_path, page_idx, self.dpi, None, prompt_mode, save_dir, save_name,
+                text_layer=text_layer, save_layout_image=self.save_layout_image,
+            ))
         else:
-            image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-            origin_image.save(image_layout_path)
-            result.update({
-                'layout_image_path': image_layout_path,
-            })
+            cells = scale_cells(text_layer['cells'], origin_image.width / text_layer['width'])
+            result = await loop.run_in_executor(None, partial(
+                postprocess_page, None, prompt_mode, save_dir, save_name, origin_image, origin_image,
+                None, None, origin_image.height, origin_image.width, source="pdf", page_idx=page_idx, cells=cells,
+                save_layout_image=self.save_layout_image,
+            ))
+        result['parse_method'] = SupportedPdfParseMethod.TXT.value
+        return result
 
-            md_content = response
-            md_file_path = os.path.join(save_dir, f"{save_name}.md")
-            with open(md_file_path, "w", encoding="utf-8") as md_file:
-                md_file.write(md_content)
-            result.update({
-                'md_content_path': md_file_path,
-            })
+    async def _aparse_pdf_page(self, input_path, page_idx, origin_image, prompt_mode, save_dir, save_name, doc_hash=None):
+        """
+        Parse one pdf page on the event loop. Cpu-bound stages (render / encode, then
+        json parsing, layout drawing, markdown with image crops and file writes) run in
+        the process pool when cpu_workers > 0, otherwise in the default thread executor;
+        the vllm request itself is awaited on the shared async client.
+        In the process pool the rendered page travels to the event loop and back once;
+        the resized model input is derived from it in each worker call.
+        """
+        loop = asyncio.get_running_loop()
+        if self.use_hf:
+            return await loop.run_in_executor(None, partial(
+                self._parse_single_image, origin_image, prompt_mode, save_dir, save_name,
+                source="pdf", page_idx=page_idx, doc_hash=doc_hash,
+            ))
+
+        min_pixels, max_pixels = self._resolve_pixels(prompt_mode)
+        cache_key = self._cache_key(doc_hash, page_idx, prompt_mode, min_pixels, max_pixels)
+        # on a cache hit the page is still rendered (artifacts need it) but not encoded or sent
+        response = self._get_cache().get(cache_key) if cache_key else None
+        pool = self._get_cpu_pool() if self.cpu_workers else None
+        if pool is not None:
+            origin_image, image_url = await loop.run_in_executor(
+                pool, render_pdf_page, input_path, page_idx, self.dpi, min_pixels, max_pixels, self.encoding,
+                response is None,
+            )
+        else:
+            image, image_url = await loop.run_in_executor(
+                None, encode_page_image, origin_image, min_pixels, max_pixels, self.encoding, response is None
+            )
+            image = image or origin_image
+        # pdf pages have no bbox, the prompt does not depend on the image
+        prompt = self.get_prompt(prompt_mode)
+        if response is None:
+            response = await self._get_client().chat(image_url, prompt, repeat_limit=self._repeat_limit(prompt_mode))
+            if cache_key:
+                self._get_cache().set(cache_key, response)
+        if pool is not None:
+            return await loop.run_in_executor(pool, partial(
+                postprocess_pdf_page, input_path, page_idx, self.dpi, response, prompt_mode, save_dir, save_name,
+                min_pixels, max_pixels, origin_image=origin_image, save_layout_image=self.save_layout_image,
+            ))
+        input_height, input_width = smart_resize(image.height, image.width)
+        return await loop.run_in_executor(None, partial(
+            postprocess_page, response, prompt_mode, save_dir, save_name, origin_image, image,
+            min_pixels, max_pixels, input_height, input_width, source="pdf", page_idx=page_idx,
+            save_layout_image=self.save_layout_image,
+        ))
 
-        return result
-    
     def parse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False):
         origin_image = fetch_image(input_path)
-        result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess)
+        doc_hash = file_sha256(input_path) if self.use_cache and os.path.isfile(input_path) else None
+        result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess, doc_hash=doc_hash)
         result['file_path'] = input_path
         return [result]
         
-    def parse_pdf(self, input_path, filename, prompt_mode, save_dir):
+    async def aiter_parse_pdf(self, input_path, filename, prompt_mode, save_dir, resume=False):
+        """
+        Parse a pdf on the parser's event loop and yield per-page results in page order.
+
+        A page is yielded as soon as it and all pages before it are done, so downstream
+        stages (split, embed, insert) can start while later pages are still being parsed.
+        Pages are rendered lazily: at most num_thread + prefetch_pages pages are in
+        progress at once, and each page image is released as soon as its result has been
+        written. At most num_thread requests are in flight on the vllm client.
+
+        With parse_method TXT / AUTO, pages with a usable text layer are built from it
+        (same cell json / markdown shape) and never sent to the model.
+        Every finished page is appended to <save_dir>/<filename>_journal.jsonl right away.
+        With resume=True, pages the journal records as done (same pdf content and
+        prompt_mode, artifacts still on disk) are yielded from it without being re-parsed.
+        """
         print(f"loading pdf: {input_path}")
-        images_origin = load_images_from_pdf(input_path, dpi=self.dpi)
-        total_pages = len(images_origin)
-        tasks = [
-            {
-                "origin_image": image,
-                "prompt_mode": prompt_mode,
-                "save_dir": save_dir,
-                "save_name": filename,
-                "source":"pdf",
-                "page_idx": i,
-            } for i, image in enumerate(images_origin)
-        ]
-
-        def _execute_task(task_args):
-            return self._parse_single_image(**task_args)
+        with fitz.open(input_path) as doc:
+            total_pages = doc.page_count
+        loop = asyncio.get_running_loop()
+        doc_hash = await loop.run_in_executor(None, file_sha256, input_path)
+        text_layers = [None] * total_pages
+        if self.parse_method != SupportedPdfParseMethod.OCR and prompt_mode in TEXT_LAYER_PROMPT_MODES:
+            text_layers = await loop.run_in_executor(None, analyze_pdf, input_path, self.parse_method)
+            num_text = sum(layer is not None for layer in text_layers)
+            print(f"text layer: {num_text} pages, ocr model: {total_pages - num_text} pages")
+        journal = PageJournal(os.path.join(save_dir, f"{filename}_journal.jsonl"), doc_hash, prompt_mode, resume=resume)
+        todo = [page_idx for page_idx in range(total_pages) if page_idx not in journal.completed]
+        if resume:
+            print(f"resume: {total_pages - len(todo)} pages already done, {len(todo)} to parse")
+        hybrid = bool(self.cpu_workers) and not self.use_hf
+        if hybrid:
+            # pages are rendered inside the worker processes
+            pages = ((page_idx, None) for page_idx in todo)
+        else:
+            pages = iter_images_from_pdf(input_path, dpi=self.dpi, page_ids=todo)
 
         if self.use_hf:
-            num_thread =  1
+            concurrency = 1
         else:
-            num_thread = min(total_pages, self.num_thread)
-        print(f"Parsing PDF with {total_pages} pages using {num_thread} threads...")
+            concurrency = max(1, min(len(todo), self.num_thread))
+        window = concurrency + self.prefetch_pages
+        print(f"Parsing PDF with {total_pages} pages, {concurrency} concurrent requests"
+              f"{f' and {self.cpu_workers} processes' if hybrid else ''}...")
+
+        pending = {}  # task -> page_idx, pages in progress
+        finished = dict(journal.completed)  # page_idx -> result, finished but waiting for an earlier page
+        next_page = 0
+        exhausted = False
+        fetch = None  # render of the next page running in the default executor (thread mode)
+        try:
+            while True:
+                # keep the window full; rendering (thread mode) runs off the loop, one page at a time
+                while not exhausted and len(pending) < window:
+                    if hybrid:
+                        page = next(pages, None)
+                    else:
+                        fetch = loop.run_in_executor(None, next, pages, None)
+                        page = await fetch
+                        fetch = None
+                    if page is None:
+                        exhausted = True
+                        break
+                    page_idx, image = page
+                    if text_layers[page_idx] is not None:
+                        task = asyncio.ensure_future(self._atext_layer_page(
+                            input_path, page_idx, image, prompt_mode, save_dir, filename, text_layers[page_idx]
+                        ))
+                    else:
+                        task = asyncio.ensure_future(self._aparse_pdf_page(
+                            input_path, page_idx, image, prompt_mode, save_dir, filename, doc_hash
+                        ))
+                    pending[task] = page_idx
+                    del page, image
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    result['file_path'] = input_path
+                    journal.append(result)
+                    finished[pending.pop(task)] = result
+                while next_page in finished:
+                    result = finished.pop(next_page)
+                    next_page += 1
+                    yield result
+            # pages restored from the journal after the last parsed one
+            while next_page in finished:
+                yield finished.pop(next_page)
+                next_page += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            if fetch is not None:
+                # cancelling the future does not stop next() in its thread; closing the
+                # generator while it runs raises "generator already executing"
+                await asyncio.wait([fetch])
+            pages.close()
+            journal.close()
+
+    def iter_parse_pdf(self, input_path, filename, prompt_mode, save_dir, resume=False):
+        """Synchronous wrapper of aiter_parse_pdf, driven on the parser's event loop."""
+        agen = self.aiter_parse_pdf(input_path, filename, prompt_mode, save_dir, resume=resume)
+        try:
+            while True:
+                result = self._run(_anext_or_none(agen))
+                if result is None:
+                    return
+                yield result
+        finally:
+            self._run(agen.aclose())
+
+    def parse_pdf(self, input_path, filename, prompt_mode, save_dir, resume=False):
+        with fitz.open(input_path) as doc:
+            total_pages = doc.page_count
 
         results = []
-        with ThreadPool(num_thread) as pool:
-            with tqdm(total=total_pages, desc="Processing PDF pages") as pbar:
-                for result in pool.imap_unordered(_execute_task, tasks):
-                    results.append(result)
-                    pbar.update(1)
-
-        results.sort(key=lambda x: x["page_no"])
-        for i in range(len(results)):
-            results[i]['file_path'] = input_path
+        with tqdm(total=total_pages, desc="Processing PDF pages") as pbar:
+            for result in self.iter_parse_pdf(input_path, filename, prompt_mode, save_dir, resume=resume):
+                results.append(result)
+                pbar.update(1)
         return results
 
     def parse_file(self, 
@@ -301,7 +728,8 @@ class DotsOCRParser:
         output_dir="", 
         prompt_mode="prompt_layout_all_en",
         bbox=None,
-        fitz_preprocess=False
+        fitz_preprocess=False,
+        resume=False,
         ):
         output_dir = output_dir or self.output_dir
         output_dir = os.path.abspath(output_dir)
@@ -310,13 +738,15 @@ class DotsOCRParser:
         os.makedirs(save_dir, exist_ok=True)
 
         if file_ext == '.pdf':
-            results = self.parse_pdf(input_path, filename, prompt_mode, save_dir)
+            results = self.parse_pdf(input_path, filename, prompt_mode, save_dir, resume=resume)
         elif file_ext in image_extensions:
             results = self.parse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox, fitz_preprocess=fitz_preprocess)
         else:
             raise ValueError(f"file extension {file_ext} not supported, supported extensions are {image_extensions} and pdf")
         
         print(f"Parsing finished, results saving to {save_dir}")
+        if self._cache is not None:
+            print(f"ocr cache: {self._cache.stats()}")
         with open(os.path.join(output_dir, os.path.basename(filename)+'.jsonl'), 'w', encoding="utf-8") as w:
             for result in results:
                 w.write(json.dumps(result, ensure_ascii=False) + '\n')
@@ -444,7 +874,11 @@ def do_parse(
         no_fitz_preprocess: bool = False,
         min_pixels: Optional[int] = None,
         max_pixels: Optional[int] = None,
-        use_hf: bool = False
+        use_hf: bool = False,
+        resume: bool = False,
+        parse_method: str = "ocr",
+        save_layout_image: bool = False,
+        repeat_limit: int = 10
 ):
     """
     dots.ocr Multilingual Document Layout Parser
@@ -461,11 +895,15 @@ def do_parse(
         top_p (float): 核采样参数 (默认: 1.0)
         dpi (int): DPI设置 (默认: 200)
         max_completion_tokens (int): 最大完成标记数 (默认: 16384)
-        num_thread (int): 线程数 (默认: 16)
+        num_thread (int): 同时在途的推理请求数 (默认: 16)
         no_fitz_preprocess (bool): 是否禁用Fitz预处理 (默认: False)
         min_pixels (Optional[int]): 最小像素数
         max_pixels (Optional[int]): 最大像素数
         use_hf (bool): 是否使用HuggingFace (默认: False)
+        resume (bool): 断点续跑，跳过逐页日志中已完成且产物完整的页 (默认: False)
+        parse_method (str): PDF 解析方式，ocr: 全部走模型；txt: 全部用文本层；auto: 逐页判断，有可用文本层的页不调用模型 (默认: ocr)
+        save_layout_image (bool): 是否输出绘制了版面框的页面图片，仅用于调试 (默认: False)
+        repeat_limit (int): 版面类 prompt 流式接收，连续重复的 cell 达到该数量时判定为复读并中止请求，只保留去重后的结果；0 关闭 (默认: 10)
     """
     prompts = list(dict_promptmode_to_prompt.keys())
 
@@ -473,7 +911,7 @@ def do_parse(
     if prompt not in prompts:
         raise ValueError(f"🤣无效的prompt参数: {prompt}。可选值: {prompts}")
 
-    dots_ocr_parser = DotsOCRParser(
+    with DotsOCRParser(
         ip=ip,
         port=port,
         model_name=model_name,
@@ -486,18 +924,22 @@ def do_parse(
         min_pixels=min_pixels,
         max_pixels=max_pixels,
         use_hf=use_hf,
-    )
-
-    fitz_preprocess = not no_fitz_preprocess
-    if fitz_preprocess:
-        print(f"😘Using fitz preprocess for image input, check the change of the image pixels")
-
-    result = dots_ocr_parser.parse_file(
-        input_path,
-        prompt_mode=prompt,
-        bbox=bbox,
-        fitz_preprocess=fitz_preprocess,
-    )
+        parse_method=parse_method,
+        save_layout_image=save_layout_image,
+        repeat_limit=repeat_limit,
+    ) as dots_ocr_parser:
+
+        fitz_preprocess = not no_fitz_preprocess
+        if fitz_preprocess:
+            print(f"😘Using fitz preprocess for image input, check the change of the image pixels")
+
+        result = dots_ocr_parser.parse_file(
+            input_path,
+            prompt_mode=prompt,
+            bbox=bbox,
+            fitz_preprocess=fitz_preprocess,
+            resume=resume,
+        )
 
     return result
 
@@ -8,6 +8,15 @@ from PIL import Image
 class SupportedPdfParseMethod(enum.Enum):
     OCR = 'ocr'
     TXT = 'txt'
+    AUTO = 'auto'  # decide per page: usable text layer -> TXT, otherwise OCR
+
+
+# per-page text layer classification, see classify_pdf_page
+TEXT_LAYER_MIN_CHARS = 100  # fewer glyphs: scanned or nearly empty page
+TEXT_LAYER_MIN_COVERAGE = 0.05  # text blocks must cover at least this share of the page
+TEXT_LAYER_MAX_IMAGE_RATIO = 0.3  # embedded images covering more of the page: scanned or figure-heavy
+TEXT_LAYER_MAX_DRAWINGS = 50  # more vector paths: charts / ruled tables, better left to the model
+TEXT_LAYER_MAX_BAD_CHAR_RATIO = 0.02  # more unmapped glyphs (U+FFFD): broken font encoding
 
 
 class PageInfo(BaseModel):
@@ -39,8 +48,16 @@ def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None) -> dict:
     return image
 
 
-def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -> list:
-    images = []
+def iter_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None, page_ids=None):
+    """Lazily render pdf pages, one page at a time.
+
+    Pages are only rasterized when the caller asks for the next one, so the caller
+    controls how many page buffers are alive at once. page_ids restricts rendering
+    to those page indices (within the start/end range).
+
+    Yields:
+        tuple: (page_idx, PIL.Image)
+    """
     with fitz.open(pdf_file) as doc:
         pdf_page_num = doc.page_count
         end_page_id = (
@@ -52,9 +69,155 @@ def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -
             print('end_page_id is out of range, use images length')
             end_page_id = pdf_page_num - 1
 
-        for index in range(0, doc.page_count):
-            if start_page_id <= index <= end_page_id:
-                page = doc[index]
-                img = fitz_doc_to_image(page, target_dpi=dpi)
-                images.append(img)
-    return images
\ No newline at end of file
+        wanted = None if page_ids is None else set(page_ids)
+        for index in range(max(0, start_page_id), end_page_id + 1):
+            if wanted is not None and index not in wanted:
+                continue
+            page = doc[index]
+            yield index, fitz_doc_to_image(page, target_dpi=dpi)
+
+
+def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -> list:
+    return [image for _, image in iter_images_from_pdf(pdf_file, dpi, start_page_id, end_page_id)]
+
+
+def _rect_area(bbox):
+    x0, y0, x1, y1 = bbox
+    return max(0.0, x1 - x0) * max(0.0, y1 - y0)
+
+
+def page_text_stats(page, page_dict=None) -> dict:
+    """Glyph count, unmapped glyph count, text coverage, image ratio and vector path count of a fitz page."""
+    page_dict = page_dict or page.get_text("dict", sort=True)
+    page_area = _rect_area(page.rect) or 1.0
+    chars = bad_chars = 0
+    text_area = 0.0
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:
+            continue
+        text_area += _rect_area(block["bbox"])
+        for line in block["lines"]:
+            for span in line["spans"]:
+                text = span["text"]
+                chars += len(text.strip())
+                bad_chars += text.count("\ufffd")
+    image_area = 0.0
+    for info in page.get_image_info():
+        rect = fitz.Rect(info["bbox"]) & page.rect
+        if not rect.is_empty:
+            image_area += rect.get_area()
+    return {
+        "chars": chars,
+        "bad_char_ratio": bad_chars / chars if chars else 0.0,
+        "text_coverage": min(1.0, text_area / page_area),
+        "image_ratio": min(1.0, image_area / page_area),
+        "drawings": len(page.get_drawings()),
+    }
+
+
+def classify_pdf_page(page, page_dict=None) -> SupportedPdfParseMethod:
+    """TXT when the page has a usable text layer and is not scanned / figure-heavy, otherwise OCR."""
+    stats = page_text_stats(page, page_dict)
+    usable = (
+        stats["chars"] >= TEXT_LAYER_MIN_CHARS
+        and stats["text_coverage"] >= TEXT_LAYER_MIN_COVERAGE
+        and stats["image_ratio"] <= TEXT_LAYER_MAX_IMAGE_RATIO
+        and stats["drawings"] <= TEXT_LAYER_MAX_DRAWINGS
+        and stats["bad_char_ratio"] <= TEXT_LAYER_MAX_BAD_CHAR_RATIO
+    )
+    return SupportedPdfParseMethod.TXT if usable else SupportedPdfParseMethod.OCR
+
+
+def _block_text(block) -> str:
+    lines = []
+    for line in block["lines"]:
+        text = "".join(span["text"] for span in line["spans"]).strip()
+        if not text:
+            continue
+        if lines and lines[-1].endswith("-") and text[:1].islower():
+            lines[-1] = lines[-1][:-1] + text  # re-join hyphenated words
+        else:
+            lines.append(text)
+    return " ".join(lines)
+
+
+def extract_text_layer_cells(page, page_idx=0, page_dict=None) -> list:
+    """
+    Build layout cells from a page's text layer, in the same shape as the model output
+    of prompt_layout_all_en (bbox in pdf points, category, markdown text).
+
+    Categories are inferred from position and font size relative to the page body text:
+    Page-header / Page-footer in the top / bottom margins, Title (first page) and
+    Section-header for short, larger or bold blocks, Picture for image blocks, Text otherwise.
+    """
+    page_dict = page_dict or page.get_text("dict", sort=True)
+    height = page.rect.height
+
+    # body font size: the size carrying most glyphs on the page
+    size_weights = {}
+    for block in page_dict["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                size = round(span["size"], 1)
+                size_weights[size] = size_weights.get(size, 0) + len(span["text"].strip())
+    body_size = max(size_weights, key=size_weights.get) if size_weights else 0
+
+    cells = []
+    for block in page_dict["blocks"]:
+        bbox = [round(v, 2) for v in block["bbox"]]
+        if block["type"] == 1:
+            cells.append({"bbox": bbox, "category": "Picture"})
+            continue
+        text = _block_text(block)
+        if not text:
+            continue
+        spans = [span for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+        max_size = max(span["size"] for span in spans)
+        bold = all(span["flags"] & 16 for span in spans)
+        short = len(text) <= 120 and len(block["lines"]) <= 3
+
+        if short and bbox[3] <= height * 0.06:
+            category = "Page-header"
+        elif short and bbox[1] >= height * 0.94:
+            category = "Page-footer"
+        elif short and page_idx == 0 and max_size >= body_size * 1.5:
+            category, text = "Title", f"# {text}"
+        elif short and (max_size >= body_size * 1.15 or bold):
+            category, text = "Section-header", f"## {text}"
+        else:
+            category = "Text"
+        cells.append({"bbox": bbox, "category": category, "text": text})
+    return cells
+
+
+def scale_cells(cells, scale) -> list:
+    """Scale cell bboxes (e.g. from pdf points to rendered image pixels)."""
+    return [dict(cell, bbox=[int(v * scale) for v in cell["bbox"]]) for cell in cells]
+
+
+def analyze_pdf(pdf_file, method=SupportedPdfParseMethod.AUTO) -> list:
+    """
+    Decide per page whether to use the text layer or the OCR model.
+
+    Returns:
+        list: one entry per page, None for OCR pages, otherwise
+        {'cells': text layer cells in pdf points, 'width': page width in points}.
+    """
+    method = SupportedPdfParseMethod(method)
+    layers = []
+    with fitz.open(pdf_file) as doc:
+        for index in range(doc.page_count):
+            if method == SupportedPdfParseMethod.OCR:
+                layers.append(None)
+                continue
+            page = doc[index]
+            page_dict = page.get_text("dict", sort=True)
+            if method == SupportedPdfParseMethod.AUTO and \
+                    classify_pdf_page(page, page_dict) != SupportedPdfParseMethod.TXT:
+                layers.append(None)
+                continue
+            layers.append({
+                "cells": extract_text_layer_cells(page, index, page_dict),
+                "width": page.rect.width,
+            })
+    return layers
@@ -4,7 +4,7 @@ import json
 import re
 
 from PIL import Image
-from dots_ocr.utils.image_utils import PILimage_to_base64
+from dots_ocr.utils.image_utils import PILimage_to_base64, save_image_by_content
 
 
 def has_latex_markdown(text: str) -> bool:
@@ -142,7 +142,8 @@ def clean_text(text: str) -> str:
     return text
 
 
-def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_page_hf: bool = False) -> str:
+def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_page_hf: bool = False,
+                  image_dir: str = None, md_dir: str = None) -> str:
     """
     Converts a layout JSON format to Markdown.
     
@@ -153,6 +154,9 @@ def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_pa
         cells: A list of dictionaries, each representing a layout cell.
         text_key: The key for the text field in the cell dictionary.
         no_page_header_footer: If True, skips page headers and footers.
+        image_dir: If set, Picture crops are written there (see save_image_by_content) and
+            referenced by a path relative to md_dir instead of an inline base64 data url.
+        md_dir: Directory of the Markdown file, defaults to the parent of image_dir.
         
     Returns:
         str: The text in Markdown format.
@@ -168,8 +172,13 @@ def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_pa
         
         if cell['category'] == 'Picture':
             image_crop = image.crop((x1, y1, x2, y2))
-            image_base64 = PILimage_to_base64(image_crop)
-            text_items.append(f"![]({image_base64})")
+            if image_dir:
+                image_path = save_image_by_content(image_crop, image_dir)
+                image_ref = os.path.relpath(image_path, md_dir or os.path.dirname(image_dir)).replace(os.sep, '/')
+                text_items.append(f"![]({image_ref})")
+            else:
+                image_base64 = PILimage_to_base64(image_crop)
+                text_items.append(f"![]({image_base64})")
         elif cell['category'] == 'Formula':
             text_items.append(get_formula_in_markdown(text))
         else:            
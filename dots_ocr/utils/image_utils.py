@@ -1,5 +1,7 @@
 import math
 import base64
+import hashlib
+import tempfile
 from PIL import Image
 from typing import Tuple
 import os
@@ -64,13 +66,74 @@ def smart_resize(
 
 
 
-def PILimage_to_base64(image, format='PNG'):
+def PILimage_to_base64(image, format='PNG', quality=None):
+    """
+    Encode a PIL image as a base64 data url.
+
+    Args:
+        format: 'PNG', 'JPEG' or 'WEBP'.
+        quality: JPEG / WEBP quality (1-100). JPEG defaults to 90; WEBP without a
+            quality is encoded lossless.
+    """
+    format = format.upper()
+    if format == 'JPG':
+        format = 'JPEG'
+    params = {}
+    if format == 'JPEG':
+        params['quality'] = quality or 90
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+    elif format == 'WEBP':
+        if quality is None:
+            params['lossless'] = True
+        else:
+            params['quality'] = quality
     buffered = BytesIO()
-    image.save(buffered, format=format)
+    image.save(buffered, format=format, **params)
     base64_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
     return f"data:image/{format.lower()};base64,{base64_str}"
 
 
+def save_image_by_content(image, image_dir):
+    """
+    Write a PIL image as PNG to image_dir/<sha256 of its pixels>.png and return the path.
+
+    The name is derived from the pixels, so the same crop is encoded and written once no
+    matter how often it is saved; the write goes through a unique temp file and os.replace
+    so concurrent threads and processes never see a partial file.
+    """
+    sha = hashlib.sha256(f"{image.mode}{image.size}".encode("utf-8"))
+    sha.update(image.tobytes())
+    path = os.path.join(image_dir, f"{sha.hexdigest()}.png")
+    if not os.path.exists(path):
+        os.makedirs(image_dir, exist_ok=True)
+        # unique per call: threads of one process may save the same crop at the same time
+        fd, tmp_path = tempfile.mkstemp(dir=image_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, format='PNG')
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return path
+
+
+def encode_model_input(image, image_format='PNG', quality=None, presize=True):
+    """
+    Encode a page image for the OCR request.
+
+    With presize, the image is first resized to the smart_resize target the server
+    resizes to anyway, so no pixels are encoded (and sent) only to be thrown away.
+    """
+    if presize:
+        height, width = smart_resize(image.height, image.width)
+        if (width, height) != image.size:
+            image = image.resize((width, height), Image.BICUBIC)
+    return PILimage_to_base64(image, format=image_format, quality=quality)
+
+
 def to_rgb(pil_image: Image.Image) -> Image.Image:
     if pil_image.mode == 'RGBA':
         white_background = Image.new("RGB", pil_image.size, (255, 255, 255))
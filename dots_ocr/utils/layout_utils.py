@@ -1,8 +1,6 @@
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont
 from typing import Dict, List
 
-import fitz
-from io import BytesIO
 import json
 
 from dots_ocr.utils.image_utils import smart_resize
@@ -28,6 +26,16 @@ dict_layout_type_to_color = {
 }
 
 
+_FILL_ALPHA = int(255 * 0.3)  # opacity of the box fill
+
+
+def _label_font(size=20):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size bitmap font
+        return ImageFont.load_default()
+
+
 def draw_layout_on_image(image, cells, resized_height=None, resized_width=None, fill_bbox=True, draw_bbox=True):
     """
     Draw transparent boxes on an image.
@@ -43,31 +51,18 @@ def draw_layout_on_image(image, cells, resized_height=None, resized_width=None,
     Returns:
         PIL.Image: The image with drawings.
     """
-    # origin_image = Image.open(image_path)
     original_width, original_height = image.size
-        
-    # Create a new PDF document
-    doc = fitz.open()
-    
-    # Get image information
-    img_bytes = BytesIO()
-    image.save(img_bytes, format='PNG')
-    # pix = fitz.Pixmap(image_path)
-    pix = fitz.Pixmap(img_bytes)
-    
-    # Create a page
-    page = doc.new_page(width=pix.width, height=pix.height)
-    page.insert_image(
-        fitz.Rect(0, 0, pix.width, pix.height), 
-        # filename=image_path
-        pixmap=pix
-        )
+    base = image.convert('RGBA')
+    # boxes are filled on a transparent overlay and alpha-composited in one pass
+    overlay = Image.new('RGBA', base.size, (0, 0, 0, 0))
+    overlay_draw = ImageDraw.Draw(overlay)
+    labels = []
 
     for i, cell in enumerate(cells):
         bbox = cell['bbox']
         layout_type = cell['category']
         order = i
-        
+
         top_left = (bbox[0], bbox[1])
         down_right = (bbox[2], bbox[3])
         if resized_height and resized_width:
@@ -75,41 +70,32 @@ def draw_layout_on_image(image, cells, resized_height=None, resized_width=None,
             scale_y = resized_height / original_height
             top_left = (int(bbox[0] / scale_x), int(bbox[1] / scale_y))
             down_right = (int(bbox[2] / scale_x), int(bbox[3] / scale_y))
-            
-        color = dict_layout_type_to_color.get(layout_type, (0, 128, 0, 256))
-        color = [col/255 for col in color[:3]]
+
+        color = tuple(dict_layout_type_to_color.get(layout_type, (0, 128, 0, 256))[:3])
 
         x0, y0, x1, y1 = top_left[0], top_left[1], down_right[0], down_right[1]
-        rect_coords = fitz.Rect(x0, y0, x1, y1)
+        if x1 < x0 or y1 < y0:
+            continue
         if draw_bbox:
             if fill_bbox:
-                page.draw_rect(
-                    rect_coords,
-                    color=None,
-                    fill=color,
-                    fill_opacity=0.3,
-                    width=0.5,
-                    overlay=True,
-                )  # Draw the rectangle
+                overlay_draw.rectangle((x0, y0, x1, y1), fill=color + (_FILL_ALPHA,))
             else:
-                page.draw_rect(
-                    rect_coords,
-                    color=color,
-                    fill=None,
-                    fill_opacity=1,
-                    width=0.5,
-                    overlay=True,
-                )  # Draw the rectangle
-        order_cate = f"{order}_{layout_type}"
-        page.insert_text(
-            (x1, y0 + 20), order_cate, fontsize=20, color=color
-        )  # Insert the index in the top left corner of the rectangle
-
-    # Convert to a Pixmap (maintaining original dimensions)
-    mat = fitz.Matrix(1.0, 1.0)
-    pix = page.get_pixmap(matrix=mat)
-
-    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                overlay_draw.rectangle((x0, y0, x1, y1), outline=color + (255,), width=1)
+        labels.append(((x1, y0 + 20), f"{order}_{layout_type}", color))
+
+    result = Image.alpha_composite(base, overlay)
+    draw = ImageDraw.Draw(result)
+    font = _label_font()
+    # anchors need a truetype font; the bitmap fallback of older Pillow raises on them
+    truetype = isinstance(font, ImageFont.FreeTypeFont)
+    for (x, y), text, color in labels:
+        # index and category next to the top right corner of the box, y is the baseline
+        if truetype:
+            draw.text((x, y), text, fill=color + (255,), font=font, anchor='ls')
+        else:
+            draw.text((x, y - draw.textbbox((0, 0), text, font=font)[3]), text, fill=color + (255,), font=font)
+
+    return result.convert('RGB')
 
 
 def pre_process_bboxes(
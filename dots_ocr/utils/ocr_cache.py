@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def file_sha256(path):
+    """sha256 of a file's content, read in 1MB blocks."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class OcrResponseCache:
+    """
+    Persistent cache of raw model responses, one row per (document, page, request settings).
+
+    Only the raw response is cached; json / layout image / markdown artifacts are always
+    regenerated locally, so post-processing changes take effect on a cached re-run.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(doc_hash, page_idx, prompt_mode, dpi, min_pixels, max_pixels, model_name, **extra):
+        """
+        Args:
+            doc_hash: sha256 of the pdf / image file.
+            extra: any other setting that changes the request (image encoding, bbox, ...).
+        """
+        fields = dict(
+            doc=doc_hash, page=page_idx, prompt_mode=prompt_mode, dpi=dpi,
+            min_pixels=min_pixels, max_pixels=max_pixels, model=model_name, **extra,
+        )
+        return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM ocr_responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        if not response:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_responses (key, response, created) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM ocr_responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
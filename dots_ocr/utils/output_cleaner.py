@@ -29,6 +29,224 @@ class CleanedData:
     success: bool
 
 
+# a category-text pair repeated this many times keeps only its first occurrence
+DUP_PAIR_THRESHOLD = 5
+
+_DECODER = json.JSONDecoder()
+_OBJECT_TOKEN = re.compile(r'[{}"]')
+_STRING_TOKEN = re.compile(r'["\\]')
+_BBOX_FIELD = re.compile(r'"bbox"\s*:\s*\[([^\]]+)\]')
+_CATEGORY_FIELD = re.compile(r'"category"\s*:\s*"([^"]+)"')
+_TEXT_FIELD = re.compile(r'"text"\s*:\s*"((?:[^"\\]|\\.){0,10000})')
+
+
+def normalize_cell(obj) -> Optional[Dict]:
+    """
+    Validates one decoded object as a layout cell, with the rules of clean_list_data:
+    a 4-number bbox is kept as is, a 3-coordinate bbox is dropped (category/text kept),
+    no bbox is fine if there is a category, anything else is rejected (None).
+    """
+    if not isinstance(obj, dict):
+        return None
+    if 'bbox' not in obj:
+        return obj if 'category' in obj else None
+    bbox = obj['bbox']
+    if isinstance(bbox, list) and len(bbox) == 3:
+        cell = {key: obj[key] for key in ('category', 'text') if key in obj}
+        return cell or None
+    if isinstance(bbox, list) and len(bbox) == 4 and all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in bbox):
+        return obj
+    return None
+
+
+class StreamingCellParser:
+    """
+    Single-pass, incremental recovery of layout cells from (possibly broken) model output.
+
+    feed() takes the output in arbitrary chunks - the whole string, or deltas as they are
+    streamed - and returns the cells completed by that chunk; close() ends the stream and
+    returns the final cell list. Each `{...}` object is decoded in place with
+    JSONDecoder.raw_decode; one that does not decode (cut off, malformed, or split across
+    chunks) is scanned once while tracking string/escape state and decoded when its closing
+    brace arrives. Decoded objects are validated with normalize_cell. Text between objects
+    (brackets, commas, missing delimiters, garbage) is skipped, a `{` outside a string
+    restarts a cut-off object, and an unfinished object at the end is dropped - unless it
+    is the only one, in which case its bbox, category and partial text are kept, like
+    OutputCleaner's single-incomplete-dict fix.
+
+    Repeats are removed as cells arrive, with the rules of
+    remove_duplicate_category_text_pairs_and_bbox: a bbox seen before drops the cell, and
+    a category-text pair seen DUP_PAIR_THRESHOLD times keeps only its first occurrence.
+    Reaching the threshold retracts copies already returned by feed(), so take the final
+    list from close() (or the `cells` snapshot).
+    """
+
+    def __init__(self, pair_threshold=DUP_PAIR_THRESHOLD):
+        self.pair_threshold = pair_threshold
+        self.objects = 0        # complete objects cut from the stream
+        self.invalid = 0        # objects that were cut off or failed to decode / validate
+        self.repeat_run = 0     # cells dropped as duplicates since the last new one, i.e. a repetition loop
+        self._parts = None      # text of the open object, None between objects
+        self._in_string = False
+        self._escape = False    # a chunk ended right after a backslash
+        self._cells = []        # every valid cell in order, duplicates included
+        self._removed = set()   # indices into _cells dropped as duplicates
+        self._seen_bboxes = set()
+        self._pair_positions = {}
+        self._closed = None
+
+    @property
+    def duplicates(self):
+        return len(self._removed)
+
+    @property
+    def cells(self):
+        return [cell for i, cell in enumerate(self._cells) if i not in self._removed]
+
+    def feed(self, chunk: str) -> List[Dict]:
+        new = []
+        n = len(chunk)
+        i = 0
+        start = 0  # where the open object's text starts in this chunk
+        if self._escape and n:
+            self._escape = False
+            i = 1
+        while i < n:
+            if self._parts is None:
+                j = chunk.find('{', i)
+                if j < 0:
+                    break
+                try:
+                    # fast path: a whole, well-formed object decoded in C
+                    obj, i = _DECODER.raw_decode(chunk, j)
+                except ValueError:
+                    self._parts = []
+                    self._in_string = False
+                    start = j
+                    i = j + 1
+                else:
+                    cell = self._accept(obj)
+                    if cell is not None:
+                        new.append(cell)
+            elif self._in_string:
+                m = _STRING_TOKEN.search(chunk, i)
+                if m is None:
+                    break
+                j = m.start()
+                if chunk[j] == '"':
+                    self._in_string = False
+                    i = j + 1
+                elif j + 1 < n:
+                    i = j + 2
+                else:
+                    self._escape = True
+                    break
+            else:
+                m = _OBJECT_TOKEN.search(chunk, i)
+                if m is None:
+                    break
+                j = m.start()
+                token = chunk[j]
+                if token == '"':
+                    self._in_string = True
+                elif token == '{':
+                    # cells are flat, so this is a new object and the open one was cut off
+                    self.invalid += 1
+                    self._parts = None
+                    i = j
+                    continue
+                else:
+                    self._parts.append(chunk[start:j + 1])
+                    try:
+                        obj = json.loads(''.join(self._parts))
+                    except ValueError:
+                        obj = None
+                    cell = self._accept(obj)
+                    self._parts = None
+                    if cell is not None:
+                        new.append(cell)
+                i = j + 1
+        if self._parts is not None:
+            self._parts.append(chunk[start:])
+        return new
+
+    def feed_cells(self, items: List[Any]) -> List[Dict]:
+        """Runs already decoded items through the same validation and dedupe."""
+        new = []
+        for item in items:
+            cell = normalize_cell(item)
+            if cell is None:
+                self.invalid += 1
+                continue
+            cell = self._add(dict(cell))
+            if cell is not None:
+                new.append(cell)
+        return new
+
+    def close(self) -> List[Dict]:
+        if self._closed is None:
+            if self._parts is not None and not self._cells:
+                cell = self._partial_cell(''.join(self._parts))
+                if cell is not None:
+                    self._add(cell)
+            self._parts = None
+            self._closed = self.cells
+        return self._closed
+
+    def _accept(self, obj):
+        self.objects += 1
+        cell = normalize_cell(obj)
+        if cell is None:
+            self.invalid += 1
+            return None
+        return self._add(cell)
+
+    def _add(self, cell):
+        idx = len(self._cells)
+        self._cells.append(cell)
+        bbox = cell.get('bbox')
+        if isinstance(bbox, list) and bbox:
+            key = tuple(bbox)
+            if key in self._seen_bboxes:
+                self._removed.add(idx)
+            else:
+                self._seen_bboxes.add(key)
+        if 'category' in cell and 'text' in cell:
+            positions = self._pair_positions.setdefault((str(cell['category']), str(cell['text'])), [])
+            positions.append(idx)
+            if len(positions) == self.pair_threshold:
+                self._removed.update(positions[1:])
+            elif len(positions) > self.pair_threshold:
+                self._removed.add(idx)
+        if idx in self._removed:
+            self.repeat_run += 1
+            return None
+        self.repeat_run = 0
+        return cell
+
+    @staticmethod
+    def _partial_cell(text):
+        bbox_match = _BBOX_FIELD.search(text)
+        if not bbox_match:
+            return None
+        try:
+            bbox = [int(x.strip()) for x in bbox_match.group(1).split(',')]
+        except ValueError:
+            return None
+        if len(bbox) != 4:
+            return None
+        category_match = _CATEGORY_FIELD.search(text)
+        cell = {"bbox": bbox, "category": category_match.group(1) if category_match else "Text"}
+        text_match = _TEXT_FIELD.search(text)
+        if text_match and text_match.group(1):
+            try:
+                cell["text"] = json.loads('"' + text_match.group(1) + '"')
+            except ValueError:
+                cell["text"] = text_match.group(1)
+        return cell
+
+
 class OutputCleaner:
     """Data Cleaner - Based on a simplified regex method"""
     
@@ -416,6 +634,23 @@ class OutputCleaner:
         return cleaned_data
 
     def clean_model_output(self, model_output: str):
+        """Recovers the layout cells of a broken model output with one StreamingCellParser pass."""
+        try:
+            parser = StreamingCellParser()
+            if isinstance(model_output, list):
+                parser.feed_cells(model_output)
+            else:
+                parser.feed(str(model_output))
+            cells = parser.close()
+            print(f"🔧 Recovered {len(cells)} cells: {parser.duplicates} duplicates removed, "
+                  f"{parser.invalid} broken objects skipped")
+            return cells
+        except Exception as e:
+            print(f"❌ Case cleaning failed: {e}")
+            return model_output
+
+    def clean_model_output_regex(self, model_output: str):
+        """The multi-pass regex cleaner clean_model_output replaced; kept for comparison."""
         try:
             # Select cleaning method based on data type
             if isinstance(model_output, list):
@@ -0,0 +1,86 @@
+import json
+import os
+import re
+
+
+# result fields that point at artifacts on disk
+ARTIFACT_KEYS = ('layout_info_path', 'layout_image_path', 'md_content_path', 'md_content_nohf_path')
+# markdown artifacts whose image links (picture crops under images/) must exist too
+MARKDOWN_KEYS = ('md_content_path', 'md_content_nohf_path')
+_IMAGE_LINK = re.compile(r'!\[[^\]]*\]\(([^)\s]+)\)')
+
+
+class PageJournal:
+    """
+    Append-only journal of finished pdf pages.
+
+    One json line is appended (and fsync'ed) as soon as a page's artifacts are written,
+    so after a crash the journal says exactly which pages are done. With resume=True the
+    entries of the same document and prompt_mode whose artifacts (including the picture
+    crops their markdown links to) still exist are loaded into `completed` and the journal
+    is appended to, after cutting off a torn last line; otherwise it is started afresh.
+    """
+
+    def __init__(self, path, doc_hash, prompt_mode, resume=False):
+        self.path = path
+        self.doc_hash = doc_hash
+        self.prompt_mode = prompt_mode
+        self.completed = self._load() if resume else {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, 'a' if resume else 'w', encoding="utf-8")
+
+    def _load(self):
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        good_end = 0  # end offset of the last complete line
+        torn = False
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    torn = not line.endswith(b'\n')
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    torn = True  # torn last line from a crash, or garbage in between
+                    continue
+                good_end = f.tell()
+                if entry.get('doc_hash') != self.doc_hash or entry.get('prompt_mode') != self.prompt_mode:
+                    continue
+                result = entry['result']
+                if self._artifacts_exist(result):
+                    completed[result['page_no']] = result
+        if torn:
+            # drop the tail, or the next entry would be glued onto it and lost again
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_end)
+                if good_end:
+                    f.seek(good_end - 1)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+        return completed
+
+    @staticmethod
+    def _artifacts_exist(result):
+        if not all(os.path.exists(result[key]) for key in ARTIFACT_KEYS if key in result):
+            return False
+        for key in MARKDOWN_KEYS:
+            if key not in result:
+                continue
+            md_dir = os.path.dirname(result[key])
+            with open(result[key], encoding="utf-8") as f:
+                links = _IMAGE_LINK.findall(f.read())
+            for link in links:
+                if link.startswith('data:') or '://' in link:
+                    continue
+                if not os.path.exists(os.path.join(md_dir, link)):
+                    return False
+        return True
+
+    def append(self, result):
+        entry = {'doc_hash': self.doc_hash, 'prompt_mode': self.prompt_mode, 'result': result}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
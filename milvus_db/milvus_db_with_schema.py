@@ -2,25 +2,35 @@
 提供Milvus向量数据库的集合创建、连接和文档添加功能。
 支持稠密向量和稀疏向量的混合索引。
 """
+import asyncio
+import hashlib
+import json
 import os
+import random
+import re
 import sys
-from typing import List, Optional, Dict
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Dict, Iterable, Tuple
 
 # 添加上级目录到 Python 路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from splitters.splitter_md import MarkdownDirSplitter
 from langchain_core.documents import Document
-from utils.embeddings_utils import process_item_with_guard, limiter, RETRY_ON_429, MAX_429_RETRIES, BASE_BACKOFF
+from utils.embeddings_utils import process_items_with_guard, MAX_BATCH_ITEMS, EMBED_CONCURRENCY
 from langchain_milvus import Milvus
 from pymilvus import DataType, Function, FunctionType, MilvusClient
+from pymilvus.exceptions import ConnectError, ErrorCode, MilvusException, MilvusUnavailableException
 from env_utils import COLLECTION_NAME, MILVUS_URI, CONTEXT_COLLECTION_NAME
 from utils.embeddings_utils import image_to_base64
-from utils.common_utils import get_surrounding_text_content
+from utils.cache_utils import DescriptionCache, file_digest, get_description_cache
+from utils.common_utils import build_title_path, find_surrounding_texts
+from utils.dedup_utils import DEDUP_SCOPE, dedup_documents
 from langchain_core.messages import HumanMessage  
 import logging
-import time
-import random
 from llm_utils import qwen3_max
 
 
@@ -32,6 +42,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ========= 批量写入配置 =========
+INSERT_BATCH_ROWS = 500  # 每批最多写入的行数
+INSERT_BATCH_BYTES = 16 * 1024 * 1024  # 每批估算体积上限，远低于 gRPC 消息上限
+INSERT_CONCURRENCY = 4  # 同时在途的写入批次数
+INSERT_MAX_RETRIES = 3  # 单批写入失败后的最大重试次数
+INSERT_BASE_BACKOFF = 1.0  # 写入重试的基础退避时间（秒）
+DENSE_DIM = 1024  # text_content_dense 的维度，与 schema 保持一致
+MAX_TEXT_LENGTH = 10000  # text 字段最大长度，与 schema 保持一致
+# 字段长度限制，与 schema 保持一致
+VARCHAR_LIMITS = {"category": 1000, "filename": 1000, "filetype": 1000, "title": 1000, "image_path": 2000, "fingerprint": 64}
+# 校验失败或多次写入失败的行写入死信文件，便于排查后重新入库
+DEAD_LETTER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "milvus_dead_letter.jsonl")
+_DEAD_LETTER_LOCK = threading.Lock()  # 写入线程池中的多个批次可能同时写死信文件，避免 JSONL 行交错
+
+# ========= 图片描述配置 =========
+DESCRIBE_CONCURRENCY = 8  # 同时在途的多模态模型调用数
+DESCRIBE_TIMEOUT = 120  # 单次模型调用的超时时间（秒）
+DESCRIBE_MAX_RETRIES = 2  # 单张图片失败后的最大重试次数
+DESCRIBE_BASE_BACKOFF = 2.0  # 重试的基础退避时间（秒）
+DESCRIBE_CACHE_ENABLED = True  # 相同图片 + 相同提示词模板 + 相同模型的描述直接复用缓存
+# ======== 配置结束 =========
+
 
 class MilvusVectorSave:
     """
@@ -42,6 +74,7 @@ class MilvusVectorSave:
         # 类型注解：明确声明属性类型，提供IDE智能提示和类型检查
         self.vector_stored_saved: Optional[Milvus] = None
         self.client = MilvusClient(uri=MILVUS_URI, user='root', password='Milvus')
+        self._fingerprint_checked = False
 
     def create_dataknowledge_collection(self,collection_name: str = COLLECTION_NAME, uri: str = MILVUS_URI, is_first: bool = False):
         """创建一个collection milvus + langchain"""
@@ -59,6 +92,7 @@ class MilvusVectorSave:
         schema.add_field("text", DataType.VARCHAR, max_length=10000, enable_analyzer=True,
                         analyzer_params={'tokenizer': 'jieba', 'filter': ['cnalphanumonly']}, description="对应每个文本块的内容") 
         schema.add_field("image_path", DataType.VARCHAR, max_length=2000, description="图片文件的本地路径，仅图片类型数据使用")
+        schema.add_field("fingerprint", DataType.VARCHAR, max_length=64, description="文档块指纹(归一化内容+标题路径的sha256)，用于增量入库")
 
         schema.add_field("title_sparse", DataType.SPARSE_FLOAT_VECTOR, description="标题的稀疏向量嵌入")
         schema.add_field("text_content_sparse", DataType.SPARSE_FLOAT_VECTOR, description="文档块的稀疏向量嵌入")
@@ -95,6 +129,12 @@ class MilvusVectorSave:
                 index_type="AUTOINDEX",
             )
 
+            # 文件名索引 增量入库时按 filename 查询已有的文档块
+            index_params.add_index(
+                field_name="filename",
+                index_type="INVERTED",
+            )
+
             # 稀疏向量索引 - 标题
             index_params.add_index(
                 field_name="title_sparse",
@@ -247,20 +287,7 @@ class MilvusVectorSave:
                 doc_dict['image_path'] = ''
             
             # 5. 对于文本块  提取 title(拼接所有的 Header) 与内容(doc.page_content) 存储到 text 字段
-            headers = []
-            # 假设 Header 的键可能为 'Header 1', 'Header 2', 'Header 3' 等，我们按层级顺序拼接
-            # 我们需要先收集所有存在的 Header 键，并按层级排序
-            header_keys = [key for key in metadata.keys() if key.startswith('Header')]              # ['Header 1', 'Header 3']
-            # 按 Header 后的数字排序，确保层级顺序
-            header_keys_sorted = sorted(header_keys, key=lambda x: int(x.split()[1]) if x.split()[1].isdigit() else x)
-
-            for key in header_keys_sorted:
-                value = metadata.get(key, '').strip()
-                if value:  # 只添加非空的 Header 值
-                    headers.append(value)
-            
-            # 将所有非空的 Header 值用连字符或空格连接起来
-            doc_dict['title'] = ' --> '.join(headers) if headers else ''  # 你也可以用其他连接符，如空格
+            doc_dict['title'] = build_title_path(metadata)  # 按层级拼接非空的 Header，如 'Header 1 --> Header 3'
             # 对文本块处理：拼接标题和内容
             if metadata.get('embedding_type') == 'text':
                 if doc_dict['title']:
@@ -268,66 +295,278 @@ class MilvusVectorSave:
                 else:
                     doc_dict['text'] = doc.page_content
             
-            # 6. 将doc_dict添加到result_dict中
+            # 6. 计算文档块指纹，用于增量入库时判断内容是否变化
+            doc_dict['fingerprint'] = MilvusVectorSave.compute_fingerprint(doc_dict)
+
+            # 7. 将doc_dict添加到result_dict中
             result_dict.append(doc_dict)
             
         return result_dict
+
+    @staticmethod
+    def compute_fingerprint(item: Dict) -> str:
+        """
+        计算文档块指纹：sha256(类别 + 标题路径 + 归一化文本 / 图片字节)
+        文本块的 text 已包含标题前缀；图片块使用图片文件内容，不受后续生成的图片描述影响。
+        """
+        sha = hashlib.sha256()
+        sha.update(item.get('category', '').encode('utf-8') + b'\0')
+        sha.update(item.get('title', '').strip().encode('utf-8') + b'\0')
+        image_path = item.get('image_path')
+        if image_path and os.path.isfile(image_path):
+            with open(image_path, 'rb') as f:
+                sha.update(hashlib.sha256(f.read()).digest())
+        elif image_path:
+            sha.update(image_path.encode('utf-8'))
+        else:
+            # 归一化：合并连续空白，忽略首尾空白
+            normalized = re.sub(r'\s+', ' ', item.get('text', '')).strip()
+            sha.update(normalized.encode('utf-8'))
+        return sha.hexdigest()
+
+    def ensure_fingerprint_field(self):
+        """
+        确认集合中存在 fingerprint 字段：旧版本创建的集合没有该字段，写入时会直接失败。
+        缺失时尝试在线添加（nullable，旧数据的指纹为空，增量入库时视为需要替换的旧块）；
+        当前 Milvus 不支持添加字段时抛出 RuntimeError，提示重建集合。
+        """
+        if self._fingerprint_checked:
+            return
+        res = self.client.describe_collection(collection_name=COLLECTION_NAME)
+        if not any(field.get('name') == 'fingerprint' for field in res.get('fields', [])):
+            logger.warning(f"⚠️ 集合 {COLLECTION_NAME} 缺少 fingerprint 字段，尝试在线添加")
+            try:
+                self.client.add_collection_field(
+                    collection_name=COLLECTION_NAME,
+                    field_name="fingerprint",
+                    data_type=DataType.VARCHAR,
+                    max_length=VARCHAR_LIMITS["fingerprint"],
+                    nullable=True,
+                    desc="文档块指纹(归一化内容+标题路径的sha256)，用于增量入库",
+                )
+            except Exception as e:
+                raise RuntimeError(
+                    f"集合 {COLLECTION_NAME} 缺少 fingerprint 字段且无法自动添加({e})，"
+                    f"请使用 create_dataknowledge_collection(is_first=True) 重建集合后重新入库") from e
+            logger.info(f"🐶已为集合 {COLLECTION_NAME} 添加 fingerprint 字段")
+        self._fingerprint_checked = True
+
+    def query_existing_chunks(self, filename: str) -> List[Tuple[int, str]]:
+        """
+        查询某个文件已入库的所有文档块
+        :param filename: 文件名（对应 filename 字段）
+        :return: [(主键id, 指纹)]，旧数据没有指纹时为空字符串
+        """
+        escaped = filename.replace('\\', '\\\\').replace('"', '\\"')
+        iterator = self.client.query_iterator(
+            collection_name=COLLECTION_NAME,
+            batch_size=1000,
+            filter=f'filename == "{escaped}"',
+            output_fields=["id", "fingerprint"],
+        )
+        rows = []
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                rows.extend((row['id'], row.get('fingerprint') or '') for row in batch)
+        finally:
+            iterator.close()
+        return rows
+
+    def diff_with_existing(self, data_list: List[Dict]) -> Tuple[List[int], List[int]]:
+        """
+        把待入库的文档块与 Milvus 中同一 filename 的已有数据按指纹比对（按多重集合计数，重复的块各自对应一行）
+        :param data_list: doc_to_dict 的输出
+        :return: (需要新增的 data_list 下标, 需要删除的已有行主键)
+        """
+        new_indices: List[int] = []
+        stale_ids: List[int] = []
+        by_filename: Dict[str, List[int]] = defaultdict(list)
+        for idx, item in enumerate(data_list):
+            by_filename[item.get('filename', '')].append(idx)
+
+        for filename, indices in by_filename.items():
+            existing: Dict[str, List[int]] = defaultdict(list)
+            for row_id, fingerprint in self.query_existing_chunks(filename):
+                existing[fingerprint].append(row_id)
+
+            for idx in indices:
+                ids = existing.get(data_list[idx]['fingerprint'])
+                if ids:
+                    ids.pop()  # 内容未变，保留已有行
+                else:
+                    new_indices.append(idx)
+            for ids in existing.values():
+                stale_ids.extend(ids)  # 已不存在于新版本文档中的行
+
+        return new_indices, stale_ids
+
+    @staticmethod
+    def can_delete_stale(expected: int, embedded: int, write_stats: Dict[str, int]) -> bool:
+        """
+        增量模式下是否可以删除过期块：只有全部新块都向量化成功且没有转存死信时才删除，
+        否则被替换的旧块仍保留，避免修改过的段落新旧两行都丢失
+        :param expected: 需要新增的块数
+        :param embedded: 向量化成功的块数
+        :param write_stats: write_to_milvus 返回的写入统计
+        """
+        return embedded == expected and write_stats.get("dead_letter", 0) == 0
+
+    def delete_by_ids(self, ids: List[int], batch_size: int = 1000):
+        """按主键分批删除 Milvus 中的数据"""
+        for start in range(0, len(ids), batch_size):
+            self.client.delete(collection_name=COLLECTION_NAME, ids=ids[start:start + batch_size])
+        if ids:
+            logger.info(f"🐶已删除 {len(ids)} 条过期数据")
     
-    def write_to_milvus(self, processed_data: List[Dict]):
+    @staticmethod
+    def validate_row(row: Dict) -> Optional[str]:
+        """
+        校验一行数据是否满足 schema 约束
+        :return: 不合法的原因，合法时返回 None
         """
-        把数据写入到Milvus中
+        dense = row.get('text_content_dense')
+        if not isinstance(dense, (list, tuple)) or len(dense) != DENSE_DIM:
+            return f"text_content_dense 维度应为 {DENSE_DIM}，实际为 {len(dense) if isinstance(dense, (list, tuple)) else type(dense).__name__}"
+        if not all(isinstance(v, (int, float)) for v in dense):
+            return "text_content_dense 包含非数值元素"
+        text = row.get('text')
+        if not isinstance(text, str) or len(text) > MAX_TEXT_LENGTH:
+            return f"text 缺失或超过 {MAX_TEXT_LENGTH} 字符"
+        for field, limit in VARCHAR_LIMITS.items():
+            value = row.get(field, '')
+            if not isinstance(value, str) or len(value) > limit:
+                return f"{field} 不是字符串或超过 {limit} 字符"
+        return None
+
+    @staticmethod
+    def _estimate_row_bytes(row: Dict) -> int:
+        """估算一行数据序列化后的体积"""
+        size = len(row.get('text_content_dense') or []) * 4
+        for key, value in row.items():
+            if isinstance(value, str):
+                size += len(value.encode('utf-8'))
+        return size
+
+    @staticmethod
+    def split_rows(rows: List[Dict], max_rows: int = INSERT_BATCH_ROWS, max_bytes: int = INSERT_BATCH_BYTES) -> List[List[Dict]]:
+        """按行数和估算体积把数据切分为多个写入批次"""
+        batches: List[List[Dict]] = []
+        current: List[Dict] = []
+        current_bytes = 0
+        for row in rows:
+            size = MilvusVectorSave._estimate_row_bytes(row)
+            if current and (len(current) >= max_rows or current_bytes + size > max_bytes):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(row)
+            current_bytes += size
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def write_dead_letters(rows: List[Dict], reason: str):
+        """把无法写入的行追加到死信文件"""
+        lines = ''.join(json.dumps({"reason": reason, "time": int(time.time()), "row": row}, ensure_ascii=False) + '\n'
+                        for row in rows)
+        os.makedirs(os.path.dirname(DEAD_LETTER_PATH), exist_ok=True)
+        with _DEAD_LETTER_LOCK, open(DEAD_LETTER_PATH, 'a', encoding='utf-8') as f:
+            f.write(lines)
+        logger.warning(f"⚠️ {len(rows)} 条数据写入失败，已转存死信文件 {DEAD_LETTER_PATH}: {reason}")
+
+    @staticmethod
+    def _is_retryable_insert_error(error: Exception) -> bool:
+        """连接异常、服务不可用和限流视为可重试的临时错误；其余 Milvus 错误（参数、schema、数据校验）重试也不会成功"""
+        if isinstance(error, (ConnectError, MilvusUnavailableException)):
+            return True
+        if isinstance(error, MilvusException):
+            return error.code == ErrorCode.RATE_LIMIT
+        return True  # 网络层异常（gRPC、超时等）
+
+    def _insert_batch(self, batch: List[Dict]) -> Tuple[int, int]:
+        """
+        写入一个批次：临时错误指数退避重试，参数/schema 等错误不重试；
+        仍失败时二分批次定位坏行，单行仍失败则转存死信文件
+        :return: (成功写入条数, 转存死信条数)
+        """
+        for attempt in range(INSERT_MAX_RETRIES + 1):
+            try:
+                insert_res = self.client.insert(collection_name=COLLECTION_NAME, data=batch)
+                return insert_res.get('insert_count', len(batch)), 0
+            except Exception as e:
+                error = e
+                if not self._is_retryable_insert_error(e):
+                    break
+                if attempt < INSERT_MAX_RETRIES:
+                    backoff = INSERT_BASE_BACKOFF * (2 ** attempt) * (0.8 + random.random() * 0.4)
+                    logger.warning(f"⚠️ 写入 {len(batch)} 条失败({e})，{backoff:.2f}s 后第{attempt + 1}次重试")
+                    time.sleep(backoff)
+
+        if len(batch) > 1:
+            mid = len(batch) // 2
+            left = self._insert_batch(batch[:mid])
+            right = self._insert_batch(batch[mid:])
+            return left[0] + right[0], left[1] + right[1]
+        self.write_dead_letters(batch, f"写入失败: {error}")
+        return 0, 1
+
+    def write_to_milvus(self, processed_data: List[Dict], flush: bool = False) -> Dict[str, int]:
+        """
+        把数据写入到Milvus中：
+        先校验每一行，不合法的行转存死信文件；再按行数和体积切分批次，多个批次并发写入，失败批次单独重试。
         :param processed_data:
-        :return:
+        :param flush: 写入完成后是否立即 flush，让数据落盘并对检索可见
+        :return: 写入统计 {"inserted": 成功条数, "dead_letter": 转存死信条数, "batches": 批次数}
         """
+        stats = {"inserted": 0, "dead_letter": 0, "batches": 0}
         if not processed_data:
             logger.warning("🐶没有需要写入的数据")
-            return
-        
+            return stats
+        self.ensure_fingerprint_field()
+
         # 数据清洗：确保text字段不超过最大长度
-        MAX_TEXT_LENGTH = 10000
         for item in processed_data:
             text = item.get('text', '')
             if len(text) > MAX_TEXT_LENGTH:
                 logger.warning(f"⚠️ 文本超长({len(text)}字符)，已截断至{MAX_TEXT_LENGTH}字符: {text[:50]}...")
                 item['text'] = text[:MAX_TEXT_LENGTH]
-        
-        try:
-            insert_res = self.client.insert(collection_name=COLLECTION_NAME, data=processed_data)
-            print(f"[Milvus] 成功写入 {len(processed_data)} 条数据.IDs 示例: {insert_res['ids'][:5]}")
-        except Exception as e:
-            logger.error(f"🐶写入Milvus失败: {e}")
-            raise e
 
-    @staticmethod
-    def generate_image_description(data_list:List[Dict]):
-        """
-        为文档中包含图片的条目(image_path 字段非空)生成一段基于上下文的、简洁的多模态文本描述 以便后续可以将这段描述用于向量化(embedding)并存入向量数据库 Milvus。
+        # 校验：不合法的行不参与写入，直接转存死信文件
+        valid_rows = []
+        for item in processed_data:
+            reason = self.validate_row(item)
+            if reason:
+                self.write_dead_letters([item], f"校验失败: {reason}")
+                stats["dead_letter"] += 1
+            else:
+                valid_rows.append(item)
 
-        参数:
-            data_list: 包含字典的列表
+        batches = self.split_rows(valid_rows)
+        stats["batches"] = len(batches)
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(INSERT_CONCURRENCY, len(batches))) as executor:
+                futures = [executor.submit(self._insert_batch, batch) for batch in batches]
+                for future in as_completed(futures):
+                    inserted, dead = future.result()
+                    stats["inserted"] += inserted
+                    stats["dead_letter"] += dead
 
-        返回:
-            包含完整结果的新列表
-        """
-        for index, item in enumerate(data_list):
-            if item.get('image_path'):  # 检查是否为图片字典
-                # 获取前后文本内容
-                prev_text, next_text = get_surrounding_text_content(data_list, index)
-                
-                # 打印调试信息
-                logger.info(f"\n{'='*50}")
-                logger.info(f"正在处理图片: {item.get('image_path')}")
-                logger.info(f"前文内容: {prev_text[:100] if prev_text else 'None'}...")
-                logger.info(f"后文内容: {next_text[:100] if next_text else 'None'}...")
-                logger.info(f"{'='*50}\n")
-
-                # 将图片转换为base64
-                base64_img, _  = image_to_base64(item['image_path'])
-
-                # 构建提示词模板
-                context_prompt = ""
-                if prev_text and next_text:
-                    context_prompt = f"""
+        if flush and stats["inserted"]:
+            self.client.flush(collection_name=COLLECTION_NAME)
+
+        print(f"[Milvus] 成功写入 {stats['inserted']}/{len(processed_data)} 条数据，共 {stats['batches']} 批，"
+              f"死信 {stats['dead_letter']} 条")
+        return stats
+
+    @staticmethod
+    def build_image_prompt(prev_text: Optional[str], next_text: Optional[str]) -> str:
+        """根据图片前后文本是否存在，构建生成图片描述的提示词"""
+        context_prompt = ""
+        if prev_text and next_text:
+            context_prompt = f"""
         你是一位科研论文图像理解专家。请基于论文上下文和图片内容，生成该图片的英文语义描述。
 
         【论文上下文】
@@ -349,8 +588,8 @@ class MilvusVectorSave:
 
         请直接给出描述，不要有"这张图片..."等前缀。
                             """
-                elif prev_text:
-                    context_prompt = f"""
+        elif prev_text:
+            context_prompt = f"""
         你是一位科研论文图像理解专家。请基于论文上下文和图片内容，生成该图片的英文语义描述。
 
         【论文上下文（前文）】
@@ -366,8 +605,8 @@ class MilvusVectorSave:
 
         请直接给出描述，不要有"这张图片..."等前缀。
                             """
-                elif next_text:
-                    context_prompt = f"""
+        elif next_text:
+            context_prompt = f"""
         你是一位科研论文图像理解专家。请基于论文上下文和图片内容，生成该图片的英文语义描述。
 
         【论文上下文（后文）】
@@ -383,8 +622,8 @@ class MilvusVectorSave:
 
         请直接给出描述，不要有"这张图片..."等前缀。
                             """
-                else:
-                    context_prompt = """
+        else:
+            context_prompt = """
         你是一位科研论文图像理解专家。请观察这张图片并生成英文描述。
 
         【任务要求】
@@ -397,28 +636,165 @@ class MilvusVectorSave:
 
         请直接给出描述，不要有"这张图片..."等前缀。
                             """
+        return context_prompt
+
+    @staticmethod
+    def image_prompt_digest(prev_text: Optional[str], next_text: Optional[str]) -> str:
+        """提示词模板的哈希：只区分使用了哪个模板（有无前文/后文），不含具体上下文，模板修改后自动变化"""
+        template = MilvusVectorSave.build_image_prompt("{prev_text}" if prev_text else None,
+                                                       "{next_text}" if next_text else None)
+        return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
 
-                # 构建多模态消息
-                message = HumanMessage(
-                    content=[
-                        {"type": "text", "text": context_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"{base64_img}"
-                            }
+    @staticmethod
+    async def _adescribe_image(item: Dict, prev_text: Optional[str], next_text: Optional[str],
+                               semaphore: asyncio.Semaphore, timeout: float, max_retries: int) -> Optional[str]:
+        """为单张图片生成描述：受信号量限制并发，单次调用超时后按指数退避重试，全部失败返回 None"""
+        async with semaphore:
+            # 打印调试信息
+            logger.info(f"\n{'='*50}")
+            logger.info(f"正在处理图片: {item.get('image_path')}")
+            logger.info(f"前文内容: {prev_text[:100] if prev_text else 'None'}...")
+            logger.info(f"后文内容: {next_text[:100] if next_text else 'None'}...")
+            logger.info(f"{'='*50}\n")
+
+            # 将图片转换为base64（文件读取放到线程中，不阻塞事件循环）
+            base64_img, _ = await asyncio.to_thread(image_to_base64, item['image_path'])
+            if not base64_img:
+                return None
+
+            # 构建多模态消息
+            message = HumanMessage(
+                content=[
+                    {"type": "text", "text": MilvusVectorSave.build_image_prompt(prev_text, next_text)},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"{base64_img}"
                         }
-                    ]
-                )
+                    }
+                ]
+            )
 
-                # 调用模型生成描述  修改原始类型为图片的text字段
-                response = qwen3_max.invoke([message])
-                item['text'] = response.content
-        
+            for attempt in range(1, max_retries + 2):
+                try:
+                    response = await asyncio.wait_for(qwen3_max.ainvoke([message]), timeout=timeout)
+                    return response.content
+                except Exception as e:
+                    reason = "超时" if isinstance(e, asyncio.TimeoutError) else str(e)
+                    if attempt > max_retries:
+                        logger.error(f"❌ 图片描述生成失败 {item.get('image_path')}: {reason}")
+                        return None
+                    wait = DESCRIBE_BASE_BACKOFF * (2 ** (attempt - 1)) + random.uniform(0, DESCRIBE_BASE_BACKOFF)
+                    logger.warning(f"⚠️ 图片描述生成失败({reason})，{wait:.2f}s 后第{attempt}次重试: {item.get('image_path')}")
+                    await asyncio.sleep(wait)
+
+    @staticmethod
+    async def agenerate_image_description(data_list: List[Dict], targets: Optional[Iterable[int]] = None,
+                                          max_concurrency: int = DESCRIBE_CONCURRENCY,
+                                          timeout: float = DESCRIBE_TIMEOUT,
+                                          max_retries: int = DESCRIBE_MAX_RETRIES,
+                                          use_cache: bool = DESCRIBE_CACHE_ENABLED) -> List[Dict]:
+        """
+        generate_image_description 的异步版本：一次线性扫描求出每张图片的前后文本，
+        先查图片描述缓存，未命中的再以不超过 max_concurrency 的并发调用多模态模型，结果按原下标写回。
+
+        参数:
+            data_list: 包含字典的列表
+            targets: 只为这些下标的条目生成描述（上下文仍取自完整列表），默认处理全部图片
+            max_concurrency: 同时在途的模型调用数
+            timeout: 单次模型调用的超时时间（秒）
+            max_retries: 单张图片失败后的最大重试次数
+            use_cache: 是否按 (模型, 提示词模板, 图片内容) 复用已生成的描述
+
+        返回:
+            原列表（图片条目的 text 字段被替换为描述，生成失败的保持原值）
+        """
+        targets = set(range(len(data_list))) if targets is None else set(targets)
+        indices = [i for i in sorted(targets) if data_list[i].get('image_path')]
+        if not indices:
+            return data_list
+
+        surrounding = find_surrounding_texts(data_list)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        start = time.monotonic()
+
+        # 缓存键：(模型, 提示词模板, 图片内容)；同一次调用中键相同的图片也只请求一次
+        keys: Dict[int, str] = {}
+        if use_cache:
+            model = getattr(qwen3_max, 'model_name', 'qwen3_max')
+            for i in indices:
+                image_digest = file_digest(data_list[i]['image_path'])
+                if image_digest:
+                    keys[i] = DescriptionCache.make_key(
+                        model, MilvusVectorSave.image_prompt_digest(*surrounding[i]), image_digest)
+        cache = get_description_cache() if keys else None
+        results: Dict[int, Optional[str]] = {}
+        cached = cache.get_descriptions(keys.values()) if cache else {}
+        pending: Dict[str, List[int]] = defaultdict(list)
+        for i in indices:
+            key = keys.get(i)
+            if key in cached:
+                results[i] = cached[key]
+            else:
+                pending[key or f"nocache:{i}"].append(i)
+
+        groups = list(pending.values())
+        descriptions = await asyncio.gather(*(
+            MilvusVectorSave._adescribe_image(data_list[group[0]], *surrounding[group[0]], semaphore, timeout, max_retries)
+            for group in groups
+        ))
+        for group, description in zip(groups, descriptions):
+            for i in group:
+                results[i] = description
+        if cache:
+            cache.put_descriptions({keys[group[0]]: description for group, description in zip(groups, descriptions)
+                                    if group[0] in keys})
+
+        # 按原下标写回，修改原始类型为图片的text字段
+        failed = 0
+        for i in indices:
+            if results[i]:
+                data_list[i]['text'] = results[i]
+            else:
+                failed += 1
+        print(f"[进度] 图片描述完成 {len(indices) - failed}/{len(indices)}，耗时 {time.monotonic() - start:.1f}s，"
+              f"模型调用 {len(groups)} 次，缓存节省 {len(indices) - len(groups)} 次")
         return data_list
 
-    def do_save_to_milvus(self, processed_data: List[Document]):
+    @staticmethod
+    def generate_image_description(data_list: List[Dict], targets: Optional[Iterable[int]] = None,
+                                   max_concurrency: int = DESCRIBE_CONCURRENCY) -> List[Dict]:
         """
+        为文档中包含图片的条目(image_path 字段非空)生成一段基于上下文的、简洁的多模态文本描述 以便后续可以将这段描述用于向量化(embedding)并存入向量数据库 Milvus。
+        同步入口，内部运行 agenerate_image_description；在已运行事件循环的线程中调用时（异步图节点、notebook），
+        改为在辅助线程中运行并阻塞等待结果，异步调用方应直接 await agenerate_image_description 以免阻塞事件循环。
+
+        参数:
+            data_list: 包含字典的列表
+            targets: 只为这些下标的条目生成描述（上下文仍取自完整列表），默认处理全部图片
+            max_concurrency: 同时在途的模型调用数
+
+        返回:
+            包含完整结果的新列表
+        """
+        def run():
+            return asyncio.run(MilvusVectorSave.agenerate_image_description(
+                data_list, targets=targets, max_concurrency=max_concurrency))
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return run()  # 当前线程没有事件循环
+        logger.warning("⚠️ 在事件循环中同步调用 generate_image_description，已转到辅助线程运行；"
+                       "异步调用方请使用 await agenerate_image_description(...)")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(run).result()
+
+    def do_save_to_milvus(self, processed_data: List[Document], max_workers: int = EMBED_CONCURRENCY, incremental: bool = False,
+                          dedup_threshold: Optional[float] = None, dedup_scope: str = DEDUP_SCOPE):
+        """
+        第零步：
+        （可选，传入 dedup_threshold 时）近重复去重（页眉页脚、版权声明等在每页重复出现的文本块只保留第一次出现的）；
         第一步：
         把Splitter之后的的数据（document对象列表），先转换为字典；
         第二步：
@@ -426,48 +802,53 @@ class MilvusVectorSave:
         第三步：
         最后写入向量数据库
         :param processed_data:
+        :param max_workers: 同时在途的嵌入请求数（受全局限流器约束）
+        :param incremental: 增量模式：按文档块指纹与库中同一 filename 的数据比对，
+                            只为新增的块生成描述、向量化并写入，删除已消失的块，未变化的块直接跳过
+        :param dedup_threshold: 近重复判定阈值（Jaccard 相似度，建议值 DEDUP_THRESHOLD），默认 None 表示不去重
+        :param dedup_scope: 去重范围，document：只在同一文件内去重；global：跨文件去重；均只比较同一标题路径下的文本块
         :return:
         """
+        # 第零步
+        if dedup_threshold is not None:
+            processed_data, _ = dedup_documents(processed_data, threshold=dedup_threshold, scope=dedup_scope)
+
         # 第一步
-        expanded_data = MilvusVectorSave.generate_image_description(MilvusVectorSave.doc_to_dict(processed_data))
+        self.ensure_fingerprint_field()
+        dict_data = MilvusVectorSave.doc_to_dict(processed_data)
+        stale_ids: List[int] = []
+        if incremental:
+            new_indices, stale_ids = self.diff_with_existing(dict_data)
+            logger.info(f"🐶增量入库: 新增 {len(new_indices)} 条, 删除 {len(stale_ids)} 条, "
+                        f"未变化 {len(dict_data) - len(new_indices)} 条")
+            # 图片描述仍以完整文档为上下文，只为新增的图片生成
+            described = MilvusVectorSave.generate_image_description(dict_data, targets=new_indices)
+            expanded_data = [described[i] for i in new_indices]
+        else:
+            expanded_data = MilvusVectorSave.generate_image_description(dict_data)
+
+        # 第二步：批量并发向量化（多条文本/图片打包为一次请求，子批次失败时只重试该子批次）
+        embedded_data: List[Dict] = process_items_with_guard(expanded_data, max_batch=MAX_BATCH_ITEMS, max_workers=max_workers)
         processed_data: List[Dict] = []
-        # 处理每个 item
-        for idx, item in enumerate(expanded_data, 1):
-            # 限速控制
-            limiter.acquire()
-
-            # 处理 + 可选 429 重试
-            if RETRY_ON_429:
-                attempts = 0
-                while True:
-                    # 包装版处理
-                    result = process_item_with_guard(item.copy())
-                    # 检查是否成功
-                    if result.get("text_content_dense"):
-                        processed_data.append(result)
-                        break
-                    attempts += 1
-                    if attempts > MAX_429_RETRIES:
-                        print(f"[429重试] 超过最大重试次数，跳过 idx={idx}")
-                        processed_data.append(result)
-                        break
-                    backoff = BASE_BACKOFF * (2 ** (attempts - 1)) * (0.8 + random.random() * 0.4)
-                    print(f"[429重试] 第{attempts}次，sleep {backoff:.2f}s …")
-                    time.sleep(backoff)
+        for idx, item in enumerate(embedded_data, 1):
+            if item.get("text_content_dense"):
+                processed_data.append(item)
             else:
-                # 若关闭 429 重试，这里同样使用包装版
-                processed_data.append(process_item_with_guard(item.copy()))
-
-            # 进度打印
-            if idx % 20 == 0:
-                print(f"[进度] 已处理 {idx}/{len(expanded_data)}")
+                logger.warning(f"⚠️ 向量化失败，跳过 idx={idx}: {item.get('text', '')[:50]}...")
+        print(f"[进度] 向量化完成 {len(processed_data)}/{len(expanded_data)}")
 
         # 打印处理后的 item 内容
         # for item in processed_data:
         #     print(json.dumps(item, ensure_ascii=False, indent=4))
         
-        # 第三步：写入向量数据库
-        self.write_to_milvus(processed_data)
+        # 第三步：写入向量数据库（增量模式下先写入新块，再删除过期块，避免文档出现空窗）
+        write_stats = self.write_to_milvus(processed_data)
+        if stale_ids:
+            if self.can_delete_stale(len(expanded_data), len(processed_data), write_stats):
+                self.delete_by_ids(stale_ids)
+            else:
+                logger.warning(f"⚠️ 有 {len(expanded_data) - len(processed_data)} 条向量化失败、"
+                               f"{write_stats['dead_letter']} 条转存死信，保留 {len(stale_ids)} 条旧数据，下次增量入库时再清理")
         
         # 返回处理后的数据
         return processed_data
@@ -0,0 +1,289 @@
+"""PDF → Milvus 流式入库管道.
+OCR → 切分 → 图片描述 → 向量化 → 批量写入 五个阶段各自运行在独立线程中，
+阶段之间通过有界队列逐页传递数据，内存占用与文档页数无关，前几页的文档块在几秒内即可被检索到。
+"""
+import os
+import sys
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# 添加上级目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from dots_ocr.parser import DotsOCRParser
+from milvus_db.milvus_db_with_schema import MilvusVectorSave, logger
+from splitters.splitter_md import MarkdownDirSplitter
+from utils.dedup_utils import DEDUP_SCOPE, NearDuplicateFilter
+from utils.embeddings_utils import process_items_with_guard, EMBED_CONCURRENCY
+
+_SENTINEL = object()  # 阶段结束标记
+
+
+class StreamingIngestPipeline:
+    """
+    逐页流式入库：
+    1. OCR：DotsOCRParser 按页序产出每页的 Markdown
+    2. 切分：MarkdownDirSplitter 逐页切分，标题层级跨页延续，开启去重时，跨页的近重复文本块（页眉页脚等）只保留第一次出现的
+    3. 描述：按指纹与库中同一文件的已有数据比对，跳过未变化的块；为新增的图片生成描述，向后看一页以取得跨页的后文
+    4. 向量化：批量并发调用嵌入接口
+    5. 写入：攒够 insert_batch_size 条或距上次写入超过 flush_interval 秒即写入 Milvus；
+       全部写入成功后删除新版本文档中已不存在的旧块，重复处理同一个 PDF 不会产生重复数据
+    管道持有解析器，用完后调用 close()（或使用 with 语句）释放解析器的进程池和事件循环线程。
+    """
+
+    def __init__(self,
+                 parser: DotsOCRParser,
+                 splitter: MarkdownDirSplitter,
+                 vector_save: Optional[MilvusVectorSave] = None,
+                 queue_size: int = 4,
+                 insert_batch_size: int = 256,
+                 flush_interval: float = 5.0,
+                 max_workers: int = EMBED_CONCURRENCY,
+                 incremental: bool = True,
+                 dedup_threshold: Optional[float] = None,
+                 dedup_scope: str = DEDUP_SCOPE):
+        """
+        :param parser: OCR 解析器
+        :param splitter: Markdown 切分器
+        :param vector_save: Milvus 写入器，默认新建
+        :param queue_size: 阶段之间每个队列最多缓存的页数
+        :param insert_batch_size: 每次写入 Milvus 的最大条数
+        :param flush_interval: 缓冲区中有数据且距上次写入超过该秒数时立即写入
+        :param max_workers: 向量化阶段同时在途的嵌入请求数
+        :param incremental: 增量模式：只写入库中没有的块，并删除已消失的块；关闭后每次都全部写入
+        :param dedup_threshold: 近重复判定阈值（Jaccard 相似度，建议值 DEDUP_THRESHOLD），默认 None 表示不去重
+        :param dedup_scope: 去重范围，document：只在同一文件内去重；global：跨文件去重（同一次 run 内）；均只比较同一标题路径下的文本块
+        """
+        self.parser = parser
+        self.splitter = splitter
+        self.vector_save = vector_save or MilvusVectorSave()
+        self.queue_size = queue_size
+        self.insert_batch_size = insert_batch_size
+        self.flush_interval = flush_interval
+        self.max_workers = max_workers
+        self.incremental = incremental
+        self.dedup_threshold = dedup_threshold
+        self.dedup_scope = dedup_scope
+
+        self._failed = threading.Event()
+        self._errors: List[BaseException] = []
+        self._counts = {"new": 0, "embedded": 0}  # 本次 run 中需要新增的块数、向量化成功的块数
+
+    def close(self):
+        """释放解析器"""
+        self.parser.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 各阶段（均为 生成器：输入页迭代器 → 输出页迭代器） ----------
+
+    def _ocr_stage(self, pdf_path: str, prompt_mode: str) -> Iterator[str]:
+        output_dir = os.path.abspath(self.parser.output_dir)
+        filename = os.path.splitext(os.path.basename(pdf_path))[0]
+        save_dir = os.path.join(output_dir, filename)
+        os.makedirs(save_dir, exist_ok=True)
+        for result in self.parser.iter_parse_pdf(pdf_path, filename, prompt_mode, save_dir):
+            md_path = result.get('md_content_path')
+            if md_path:
+                yield md_path
+
+    def _split_stage(self, md_paths: Iterable[str], source_filename: str) -> Iterator[List[Dict]]:
+        current_titles = {1: "", 2: "", 3: ""}  # 标题状态跨页延续
+        dedup_filter = None
+        if self.dedup_threshold is not None:
+            dedup_filter = NearDuplicateFilter(threshold=self.dedup_threshold, scope=self.dedup_scope)  # 去重状态跨页延续
+        for md_path in md_paths:
+            docs = self.splitter.process_md_file(md_path)
+            docs = self.splitter.add_title_hierarchy(docs, source_filename, current_titles=current_titles)
+            docs = self.splitter.fit_token_budget(docs)
+            if dedup_filter is not None:
+                docs = dedup_filter.filter(docs)
+            yield MilvusVectorSave.doc_to_dict(docs)
+        if dedup_filter is not None:
+            dedup_filter.log_report()
+
+    @staticmethod
+    def _new_indices(items: List[Dict], existing: Optional[Dict[str, List[int]]]) -> List[int]:
+        """
+        本页需要新增的块下标；内容未变的块认领一行已有数据（按多重集合计数，与 diff_with_existing 一致）
+        :param existing: 指纹 → 已入库的主键列表，认领后剩下的即为过期行；None 表示全部新增
+        """
+        if existing is None:
+            return list(range(len(items)))
+        new_indices = []
+        for idx, item in enumerate(items):
+            ids = existing.get(item['fingerprint'])
+            if ids:
+                ids.pop()
+            else:
+                new_indices.append(idx)
+        return new_indices
+
+    @staticmethod
+    def _describe_page(prev_text: Optional[Dict], items: List[Dict], next_items: List[Dict],
+                       targets: List[int]) -> List[Dict]:
+        """以 上一页最后一个文本块 + 本页 + 下一页第一个文本块 为上下文，为 targets 中的图片生成描述，返回 targets 对应的块"""
+        if any(items[i].get('image_path') for i in targets):
+            next_text = next((item for item in next_items if not item.get('image_path')), None)
+            context = ([prev_text] if prev_text else []) + items + ([next_text] if next_text else [])
+            offset = 1 if prev_text else 0
+            MilvusVectorSave.generate_image_description(context, targets=[offset + i for i in targets])
+        return [items[i] for i in targets]
+
+    def _describe_stage(self, pages: Iterable[List[Dict]],
+                        existing: Optional[Dict[str, List[int]]]) -> Iterator[List[Dict]]:
+        prev_text = None
+        pending = None
+        for items in pages:
+            targets = self._new_indices(items, existing)
+            if pending is not None:
+                pending_items, pending_targets = pending
+                yield self._describe_page(prev_text, pending_items, items, pending_targets)
+                prev_text = next((item for item in reversed(pending_items) if not item.get('image_path')), prev_text)
+            pending = (items, targets)
+        if pending is not None:
+            pending_items, pending_targets = pending
+            yield self._describe_page(prev_text, pending_items, [], pending_targets)
+
+    def _embed_stage(self, pages: Iterable[List[Dict]]) -> Iterator[List[Dict]]:
+        for items in pages:
+            embedded = process_items_with_guard(items, max_workers=self.max_workers) if items else []
+            rows = [item for item in embedded if item.get('text_content_dense')]
+            if len(rows) < len(items):
+                logger.warning(f"⚠️ 本页有 {len(items) - len(rows)} 条向量化失败，已跳过")
+            self._counts["new"] += len(items)
+            self._counts["embedded"] += len(rows)
+            yield rows
+
+    # ---------- 线程与队列 ----------
+
+    def _put(self, q: queue.Queue, item):
+        """放入队列；下游已失败时放弃，避免上游永久阻塞"""
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_queue(self, q: queue.Queue) -> Iterator:
+        """逐个取出队列中的数据，遇到结束标记或任一阶段失败时停止"""
+        while True:
+            try:
+                item = q.get(timeout=0.5)
+            except queue.Empty:
+                if self._failed.is_set():
+                    return
+                continue
+            if item is _SENTINEL:
+                return
+            yield item
+
+    def _start_stage(self, name: str, stage: Callable[[], Iterable]) -> queue.Queue:
+        """在独立线程中运行一个阶段，把产出逐页放入有界队列并返回该队列"""
+        out_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        def worker():
+            try:
+                for item in stage():
+                    if self._failed.is_set():
+                        break
+                    self._put(out_q, item)
+            except BaseException as e:
+                logger.error(f"🐶流式入库阶段 {name} 失败: {e}")
+                self._errors.append(e)
+                self._failed.set()
+            finally:
+                # 送达结束标记，下游才能退出（失败时下游会自行退出）
+                self._put(out_q, _SENTINEL)
+
+        threading.Thread(target=worker, name=f"ingest-{name}", daemon=True).start()
+        return out_q
+
+    def run(self, pdf_path: str, source_filename: Optional[str] = None,
+            prompt_mode: str = "prompt_layout_all_en") -> Dict[str, float]:
+        """
+        流式处理一个 PDF 并写入 Milvus
+        :param pdf_path: PDF 文件路径
+        :param source_filename: 写入 filename 字段的原始文件名，默认取 PDF 文件名
+        :param prompt_mode: OCR 提示词模式
+        :return: 统计信息（页数、写入条数、转存死信条数、删除的过期条数、首次写入耗时、总耗时）
+        """
+        source_filename = source_filename or os.path.basename(pdf_path)
+        self._failed.clear()
+        self._errors.clear()
+        self._counts = {"new": 0, "embedded": 0}
+        start = time.monotonic()
+
+        existing: Optional[Dict[str, List[int]]] = None
+        if self.incremental:
+            self.vector_save.ensure_fingerprint_field()
+            existing = defaultdict(list)
+            for row_id, fingerprint in self.vector_save.query_existing_chunks(source_filename):
+                existing[fingerprint].append(row_id)
+
+        md_q = self._start_stage("ocr", lambda: self._ocr_stage(pdf_path, prompt_mode))
+        split_q = self._start_stage("split", lambda: self._split_stage(self._iter_queue(md_q), source_filename))
+        describe_q = self._start_stage("describe", lambda: self._describe_stage(self._iter_queue(split_q), existing))
+        embed_q = self._start_stage("embed", lambda: self._embed_stage(self._iter_queue(describe_q)))
+
+        stats = {"pages": 0, "inserted": 0, "dead_letter": 0, "deleted": 0,
+                 "first_insert_seconds": None, "elapsed_seconds": 0.0}
+        buffer: List[Dict] = []
+        last_flush = time.monotonic()
+
+        def write(batch: List[Dict]):
+            nonlocal last_flush
+            res = self.vector_save.write_to_milvus(batch)
+            stats["inserted"] += res["inserted"]
+            stats["dead_letter"] += res["dead_letter"]
+            if stats["first_insert_seconds"] is None:
+                stats["first_insert_seconds"] = round(time.monotonic() - start, 2)
+            last_flush = time.monotonic()
+
+        try:
+            for rows in self._iter_queue(embed_q):
+                stats["pages"] += 1
+                buffer.extend(rows)
+                # 攒够一批就写入；缓冲区有数据且等待过久也立即写入，让前几页尽快可检索
+                while len(buffer) >= self.insert_batch_size or (
+                        buffer and time.monotonic() - last_flush >= self.flush_interval):
+                    batch, buffer = buffer[:self.insert_batch_size], buffer[self.insert_batch_size:]
+                    write(batch)
+            if buffer and not self._failed.is_set():
+                write(buffer)
+        except BaseException:
+            self._failed.set()
+            raise
+
+        if self._errors:
+            raise self._errors[0]
+
+        # 新块全部写入后再删除过期块，避免文档出现空窗；有块未写入时保留旧数据，下次运行时再清理
+        stale_ids = [row_id for ids in (existing or {}).values() for row_id in ids]
+        if stale_ids:
+            if self.vector_save.can_delete_stale(self._counts["new"], self._counts["embedded"], stats):
+                self.vector_save.delete_by_ids(stale_ids)
+                stats["deleted"] = len(stale_ids)
+            else:
+                logger.warning(f"⚠️ 有 {self._counts['new'] - self._counts['embedded']} 条向量化失败、"
+                               f"{stats['dead_letter']} 条转存死信，保留 {len(stale_ids)} 条旧数据，下次运行时再清理")
+
+        stats["elapsed_seconds"] = round(time.monotonic() - start, 2)
+        logger.info(f"🐶流式入库完成: {stats}")
+        return stats
+
+
+if __name__ == "__main__":
+    with StreamingIngestPipeline(
+        parser=DotsOCRParser(output_dir="./dots_ocr/output", num_thread=16),
+        splitter=MarkdownDirSplitter(images_output_dir="./output/images"),
+    ) as pipeline:
+        pipeline.run("./demo_pdf1.pdf")
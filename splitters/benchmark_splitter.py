@@ -0,0 +1,146 @@
+"""
+对比 MarkdownDirSplitter 的单遍扫描（process_md_file）与原多遍实现（process_md_file_multipass）：
+逐文件比较产出的 Document 是否一致，并统计耗时。
+
+    python splitters/benchmark_splitter.py                      # 合成语料（含大图、表格、代码块等）
+    python splitters/benchmark_splitter.py output/doc1 output/doc2 --repeat 5
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from splitters.splitter_md import MarkdownDirSplitter
+
+
+_TABLES = [
+    '<table><thead><tr><th>名称</th><th>数值</th></tr></thead><tbody><tr><td>a &amp; b</td><td>1</td></tr>'
+    '<tr><td><b>粗体</b> 文本</td><td>2</td></tr></tbody></table>',
+    '<table><tbody><tr><td>表头1</td><td>表头2</td><td>表头3</td></tr><tr><td>x</td><td>y</td></tr>'
+    '<tr><td>表头1</td><td>表头2</td><td>表头3</td></tr></tbody></table>',
+    '<table><tr><th>H</th></tr><tr><td>r1</td></tr><tr><td>r2</td><td>extra</td></tr></table>',
+    '<TABLE><tbody><tr><th colspan="2">合并</th></tr><tr><td>1</td><td>2<br>3</td></tr></tbody></TABLE>',
+    '<table></table>',
+]
+
+
+def _image_data_url(rng, size, fmt='PNG'):
+    image = Image.effect_noise(size, rng.randint(10, 80)).convert('RGB')
+    buffered = io.BytesIO()
+    image.save(buffered, format=fmt)
+    return f"data:image/{fmt.lower()};base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+
+
+def make_corpus(out_dir, n_files=8, seed=0):
+    """合成若干页 Markdown：标题、段落、代码块、HTML 表格、内嵌 Base64 大图、路径引用图片"""
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(out_dir, 'images'), exist_ok=True)
+    Image.new('RGB', (40, 30), 'blue').save(os.path.join(out_dir, 'images', 'ref.png'))
+    words = ['多模态', '检索', 'layout', 'model', '向量', 'the', 'of', 'page', '\t制表符', '页面​零宽']
+    paths = []
+    for page in range(n_files):
+        blocks = []
+        for _ in range(rng.randint(10, 30)):
+            kind = rng.random()
+            if kind < 0.15:
+                blocks.append('#' * rng.randint(1, 4) + ' ' + ' '.join(rng.choice(words) for _ in range(3)))
+            elif kind < 0.25:
+                blocks.append(rng.choice(_TABLES) if rng.random() < 0.7 else '前文 ' + rng.choice(_TABLES) + ' 后文')
+            elif kind < 0.4:
+                size = rng.choice([(64, 64), (400, 300), (1200, 900)])
+                blocks.append(f"![]({_image_data_url(rng, size, rng.choice(['PNG', 'JPEG']))})")
+            elif kind < 0.45:
+                blocks.append(rng.choice(['![](images/ref.png)', '![图](images/missing.png)', '![](http://x/y.png)']))
+            elif kind < 0.5:
+                blocks.append('```python\n# 不是标题\nprint(1)\n\n```')
+            else:
+                blocks.append(' '.join(rng.choice(words) for _ in range(rng.randint(5, 400))))
+        path = os.path.join(out_dir, f"doc_page_{page}.md")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(rng.choice(['\n\n', '\n']).join(blocks))
+        paths.append(path)
+    return paths
+
+
+def _normalized(docs, images_dir):
+    return [(doc.page_content.replace(images_dir, '<images>'), doc.metadata) for doc in docs]
+
+
+def benchmark_splitter(md_files, repeat=3):
+    """逐文件比较两种实现的 Document 输出，并给出平均耗时与加速比"""
+    work_dir = tempfile.mkdtemp()
+    engines = {}
+    for name in ('multipass', 'single_pass'):
+        images_dir = os.path.join(work_dir, name)
+        engines[name] = (MarkdownDirSplitter(images_output_dir=images_dir), images_dir)
+
+    totals = {'multipass': 0.0, 'single_pass': 0.0}
+    mismatches = []
+    total_bytes = 0
+    try:
+        for md_file in md_files:
+            total_bytes += os.path.getsize(md_file)
+            outputs = {}
+            for name, (splitter, images_dir) in engines.items():
+                process = splitter.process_md_file_multipass if name == 'multipass' else splitter.process_md_file
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    docs = process(md_file)
+                totals[name] += (time.perf_counter() - start) / repeat
+                outputs[name] = _normalized(docs, images_dir)
+                missing = [doc.page_content for doc in docs
+                           if doc.metadata.get('embedding_type') == 'image' and not os.path.isfile(doc.page_content)]
+                if missing:
+                    mismatches.append((md_file, f"{name}: {len(missing)} image files missing"))
+            if outputs['multipass'] != outputs['single_pass']:
+                mismatches.append((md_file, f"documents differ ({len(outputs['multipass'])} vs {len(outputs['single_pass'])})"))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{len(md_files)} files, {total_bytes / 1024 / 1024:.1f} MB, repeat {repeat}")
+    print(f"multipass:   {totals['multipass'] * 1000:.1f} ms")
+    print(f"single_pass: {totals['single_pass'] * 1000:.1f} ms")
+    print(f"speedup:     {totals['multipass'] / max(totals['single_pass'], 1e-9):.1f}x")
+    print(f"identical output: {len(md_files) - len({f for f, _ in mismatches})}/{len(md_files)} files")
+    for md_file, reason in mismatches:
+        print(f"  ❌ {md_file}: {reason}")
+    return totals, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MarkdownDirSplitter: 单遍扫描 vs 多遍实现")
+    parser.add_argument('paths', nargs='*', help="Markdown 文件或目录，默认使用合成语料")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--files', type=int, default=8, help="合成语料的文件数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus_dir = None
+    if args.paths:
+        md_files = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                md_files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.md'))
+            else:
+                md_files.append(path)
+    else:
+        corpus_dir = tempfile.mkdtemp()
+        md_files = make_corpus(corpus_dir, n_files=args.files, seed=args.seed)
+    try:
+        benchmark_splitter(md_files, repeat=args.repeat)
+    finally:
+        if corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+单遍 Markdown 扫描器：MarkdownDirSplitter.process_md_file 的切分引擎。
+
+原流程对每个文件做多次全文扫描：正则找 HTML 表格并逐个用 BeautifulSoup 解析、再一次正则统计表格数、
+MarkdownHeaderTextSplitter 逐行逐字符过滤、对整块内容（含数 MB 的 Base64）做非贪婪 DOTALL 正则提取图片、
+再一次正则移除图片。这里只按行走一遍：
+1. HTML 表格用一次大小写不敏感的查找定位，用标准库 HTMLParser 建的轻量树转成 Markdown 后拼回原文
+2. 标题切分与 MarkdownHeaderTextSplitter 逐行规则一致（代码块、标题栈、空行分段、同标题段落合并）
+3. 图片在行被收入段落时用 str.find 直接截取（路径引用 / Base64），不对大块内容跑正则
+
+产出与原流程的 Document 一致，见 splitters/benchmark_splitter.py 的对比。
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.log_utils import log
+
+
+# ![alt](path) 形式的图片引用，不含 data url
+IMAGE_REF_PATTERN = re.compile(r'!\[[^\]]*\]\((?!data:)([^)\s]+)\)')
+
+_TABLE_OPEN = re.compile(r'<table>', re.IGNORECASE)
+_TABLE_CLOSE = re.compile(r'</table>', re.IGNORECASE)
+_DATA_URL_PREFIX = 'data:image/'
+_BASE64_MARK = ';base64,'
+_VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                        'param', 'source', 'track', 'wbr'])
+
+
+# ---------- HTML 表格 ----------
+
+class _Node:
+    __slots__ = ('name', 'attrs', 'children')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+
+
+class _TableTreeBuilder(HTMLParser):
+    """只建 表格转换需要的树：标签、属性、文本；结束标签回退到最近的同名标签、实体的处理都与 bs4 html.parser 一致"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.root = _Node(None, {})
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = _Node(tag, {k: '' if v is None else v for k, v in attrs})
+        self._stack[-1].children.append(node)
+        if tag not in _VOID_TAGS:
+            self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self._stack[-1].children.append(_Node(tag, {k: '' if v is None else v for k, v in attrs}))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].name == tag:
+                del self._stack[i:]
+                return
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ';')
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        self.handle_data(unescape(f"&#{name};"))
+
+    def handle_data(self, data):
+        children = self._stack[-1].children
+        if children and isinstance(children[-1], str):
+            children[-1] += data
+        else:
+            children.append(data)
+
+
+def _iter_tags(node: _Node) -> Iterator[_Node]:
+    """先序遍历所有后代标签（与 bs4 find_all 的顺序一致）"""
+    stack = list(reversed(node.children))
+    while stack:
+        child = stack.pop()
+        if isinstance(child, _Node):
+            yield child
+            stack.extend(reversed(child.children))
+
+
+def _find(node: _Node, names: Tuple[str, ...]) -> Optional[_Node]:
+    return next((tag for tag in _iter_tags(node) if tag.name in names), None)
+
+
+def _find_all(node: _Node, names: Tuple[str, ...]) -> List[_Node]:
+    return [tag for tag in _iter_tags(node) if tag.name in names]
+
+
+def _text(node: _Node) -> str:
+    """等价于 bs4 的 get_text(strip=True)：每个文本节点 strip 后直接拼接"""
+    parts = []
+    stack = list(reversed(node.children))
+    while stack:
+        child = stack.pop()
+        if isinstance(child, str):
+            child = child.strip()
+            if child:
+                parts.append(child)
+        else:
+            stack.extend(reversed(child.children))
+    return ''.join(parts)
+
+
+def _same(a: _Node, b: _Node) -> bool:
+    """结构相等（等价于 bs4 Tag.__eq__）"""
+    if a is b:
+        return True
+    if a.name != b.name or a.attrs != b.attrs or len(a.children) != len(b.children):
+        return False
+    for x, y in zip(a.children, b.children):
+        if isinstance(x, str) or isinstance(y, str):
+            if x != y:
+                return False
+        elif not _same(x, y):
+            return False
+    return True
+
+
+def html_table_to_markdown(html_table: str) -> str:
+    """
+    将单个 HTML 表格转换为 Markdown 格式，规则与 MarkdownDirSplitter.convert_html_table_to_markdown 相同
+    （表头取 thead 首行，否则 tbody 首行；空表或解析失败时返回原始 HTML），解析用标准库 HTMLParser 代替 BeautifulSoup
+    """
+    try:
+        builder = _TableTreeBuilder()
+        builder.feed(html_table)
+        builder.close()
+        table = _find(builder.root, ('table',))
+        if table is None:
+            return html_table
+
+        # 处理表头
+        headers = []
+        thead = _find(table, ('thead',))
+        if thead is not None:
+            header_row = _find(thead, ('tr',))
+            if header_row is not None:
+                headers = [_text(cell) for cell in _find_all(header_row, ('th', 'td'))]
+        tbody = _find(table, ('tbody',))
+        first_row = _find(tbody, ('tr',)) if tbody is not None else None
+        if not headers and first_row is not None:
+            ths = _find_all(first_row, ('th',))
+            headers = [_text(cell) for cell in (ths or _find_all(first_row, ('td',)))]
+
+        # 处理表格数据行
+        rows = []
+        if tbody is not None:
+            for tr in _find_all(tbody, ('tr',)):
+                if headers and thead is None and _same(tr, first_row):
+                    continue
+                row_data = [_text(cell) for cell in _find_all(tr, ('td', 'th'))]
+                if row_data:
+                    rows.append(row_data)
+        if not rows:
+            for tr in _find_all(table, ('tr',)):
+                if headers and _find(tr, ('th',)) is not None:
+                    continue
+                row_data = [_text(cell) for cell in _find_all(tr, ('td', 'th'))]
+                if row_data:
+                    rows.append(row_data)
+
+        # 构建 Markdown 表格
+        markdown_lines = []
+        if headers:
+            markdown_lines.append('| ' + ' | '.join(headers) + ' |')
+            markdown_lines.append('|' + '|'.join(['---' for _ in headers]) + '|')
+        for row in rows:
+            if headers:
+                row = (row + [''] * (len(headers) - len(row)))[:len(headers)]
+            markdown_lines.append('| ' + ' | '.join(row) + ' |')
+
+        if not markdown_lines:
+            log.warning("⚠️ 表格转换后为空，保留原始 HTML")
+            return html_table
+        return '\n' + '\n'.join(markdown_lines) + '\n'
+
+    except Exception as e:
+        log.error(f"❌ HTML 表格转换失败: {e}")
+        return html_table
+
+
+def splice_html_tables(text: str) -> Tuple[str, int]:
+    """把文本中的 <table>...</table> 替换为 Markdown 表格，返回 (新文本, 转换的表格数)"""
+    pieces = []
+    pos = 0
+    while True:
+        start = _TABLE_OPEN.search(text, pos)
+        if start is None:
+            break
+        end = _TABLE_CLOSE.search(text, start.end())
+        if end is None:
+            break
+        pieces.append(text[pos:start.start()])
+        pieces.append(html_table_to_markdown(text[start.start():end.end()]))
+        pos = end.end()
+    if not pieces:
+        return text, 0
+    pieces.append(text[pos:])
+    return ''.join(pieces), len(pieces) // 2
+
+
+# ---------- 标题切分 + 图片 ----------
+
+@dataclass
+class MarkdownChunk:
+    """同一组标题下的一段内容；content 中已移除提取出的图片"""
+    metadata: Dict[str, str]
+    content: str
+    image_paths: List[str] = field(default_factory=list)             # 路径引用，已解析为存在的本地文件
+    base64_images: List[Tuple[str, str]] = field(default_factory=list)  # (图片类型, Base64 数据)
+
+    @property
+    def has_images(self) -> bool:
+        return bool(self.image_paths or self.base64_images)
+
+
+def _take_images(line: str, base_dir: str, image_paths: List[str], base64_images: List[Tuple[str, str]]) -> str:
+    """从一行中取出图片，返回剩余文本：先取存在的本地路径引用，再取 Base64（仅 ![](data:...) 形式从文本中移除）"""
+    if '![' in line:
+        def take_ref(match):
+            img_path = os.path.normpath(os.path.join(base_dir, match.group(1)))
+            if not os.path.isfile(img_path):
+                return match.group(0)
+            image_paths.append(img_path)
+            return ''
+        line = IMAGE_REF_PATTERN.sub(take_ref, line)
+
+    if _DATA_URL_PREFIX not in line:
+        return line
+    kept = []
+    pos = cut = 0
+    while True:
+        i = line.find(_DATA_URL_PREFIX, pos)
+        if i < 0:
+            break
+        j = line.find(_BASE64_MARK, i + len(_DATA_URL_PREFIX))
+        if j < 0:
+            break
+        k = line.find(')', j + len(_BASE64_MARK))
+        if k < 0:
+            break
+        base64_images.append((line[i + len(_DATA_URL_PREFIX):j], line[j + len(_BASE64_MARK):k]))
+        if i >= 4 and line[i - 4:i] == '![](':
+            kept.append(line[cut:i - 4])
+            cut = k + 1
+        pos = k + 1
+    if not cut:
+        return line
+    kept.append(line[cut:])
+    return ''.join(kept)
+
+
+def scan_markdown(text: str, headers_to_split_on: List[Tuple[str, str]], base_dir: str = '.') -> Iterator[MarkdownChunk]:
+    """
+    逐行扫描 Markdown（表格需已转换，见 splice_html_tables），按标题切分并取出图片，每完成一个标题段就产出一个 MarkdownChunk。
+    切分规则与 MarkdownHeaderTextSplitter(headers_to_split_on) 默认参数（strip_headers=True）一致。
+    :param base_dir: 解析相对图片路径的目录（Markdown 文件所在目录）
+    """
+    headers = sorted(headers_to_split_on, key=lambda split: len(split[0]), reverse=True)
+    chunk: Optional[MarkdownChunk] = None
+    lines: List[str] = []
+    image_paths: List[str] = []
+    base64_images: List[Tuple[str, str]] = []
+    current_metadata: Dict[str, str] = {}
+    initial_metadata: Dict[str, str] = {}
+    header_stack: List[Tuple[int, str]] = []
+    in_code_block = False
+    opening_fence = ""
+
+    def close_paragraph(metadata):
+        """把当前段落并入标题段；标题变化时返回已完成的上一个标题段"""
+        nonlocal chunk, lines, image_paths, base64_images
+        content = "\n".join(lines)
+        finished = None
+        if chunk is not None and chunk.metadata == metadata:
+            chunk.content += "  \n" + content
+            chunk.image_paths.extend(image_paths)
+            chunk.base64_images.extend(base64_images)
+        else:
+            finished = chunk
+            chunk = MarkdownChunk(metadata, content, image_paths, base64_images)
+        lines, image_paths, base64_images = [], [], []
+        return finished
+
+    for line in text.split("\n"):
+        stripped_line = line.strip()
+        if not stripped_line.isprintable():
+            stripped_line = "".join(filter(str.isprintable, stripped_line))
+        if not in_code_block:
+            if stripped_line.startswith("```") and stripped_line.count("```") == 1:
+                in_code_block = True
+                opening_fence = "```"
+            elif stripped_line.startswith("~~~"):
+                in_code_block = True
+                opening_fence = "~~~"
+        elif stripped_line.startswith(opening_fence):
+            in_code_block = False
+            opening_fence = ""
+
+        if in_code_block:
+            lines.append(_take_images(stripped_line, base_dir, image_paths, base64_images))
+            continue
+
+        for sep, name in headers:
+            if stripped_line.startswith(sep) and (len(stripped_line) == len(sep) or stripped_line[len(sep)] == " "):
+                level = sep.count("#")
+                while header_stack and header_stack[-1][0] >= level:
+                    initial_metadata.pop(header_stack.pop()[1], None)
+                header_stack.append((level, name))
+                initial_metadata[name] = stripped_line[len(sep):].strip()
+                if lines:
+                    finished = close_paragraph(current_metadata.copy())
+                    if finished is not None:
+                        yield finished
+                break
+        else:
+            if stripped_line:
+                lines.append(_take_images(stripped_line, base_dir, image_paths, base64_images))
+            elif lines:
+                finished = close_paragraph(current_metadata.copy())
+                if finished is not None:
+                    yield finished
+
+        current_metadata = initial_metadata.copy()
+
+    if lines:
+        finished = close_paragraph(current_metadata)
+        if finished is not None:
+            yield finished
+    if chunk is not None:
+        yield chunk
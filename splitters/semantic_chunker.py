@@ -0,0 +1,186 @@
+"""
+语义分块：MarkdownDirSplitter 的 chunking="semantic" 模式。
+
+与 LangChain SemanticChunker 的做法相同（句子 + 前后 buffer_size 句组合后嵌入，相邻组合的余弦距离超过阈值处断开），区别在于：
+- 一批 Document（通常是一个文件的全部标题分块）的所有句子去重后按 batch_size 分批嵌入，经持久化嵌入缓存，重复内容不再请求
+- 相邻距离与阈值（percentile / standard_deviation / interquartile / gradient）用 NumPy 一次算完
+- 只在每个 Document 内部断开，不跨越标题边界
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.cache_utils import CachedEmbeddings
+from utils.log_utils import log
+
+# 各阈值类型的默认取值，与 LangChain SemanticChunker 相同
+BREAKPOINT_DEFAULTS: Dict[str, float] = {
+    "percentile": 95,
+    "standard_deviation": 3,
+    "interquartile": 1.5,
+    "gradient": 95,
+}
+
+EMBED_BATCH_SIZE = 64  # 每次嵌入请求包含的句子组合数
+
+# 句子切分：中文句末标点直接断开，英文句末标点后需跟空白；换行也视为句子边界
+SENTENCE_PATTERN = re.compile(r'(?<=[。！？；!?])|(?<=[.?!;])\s+|\n+')
+# 论文中常见的英文缩写（Fig. 3、et al.、e.g. 等）和姓名首字母，其后的空白不视为句子边界
+ABBREVIATION_PATTERN = re.compile(
+    r'(?:\b(?:[Ff]igs?|[Ee]qs?|[Tt]abs?|[Ss]ecs?|[Rr]efs?|Ch|Chap|Alg|Def|Thm|Prop|Cor|Appx|No|Nos|Vol|pp?|'
+    r'al|etc|vs|cf|approx|resp|incl|Dr|Mr|Mrs|Ms|Prof|Jr|Sr|St|Inc|Ltd|'
+    r'Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)'
+    r'|\be\.g|\bi\.e|\b[A-Z])\.$'
+)
+ABBREVIATION_LOOKBACK = 10  # 判断缩写时向前查看的字符数，不短于最长的缩写
+
+
+def _is_abbreviation_break(text: str, match: re.Match) -> bool:
+    """英文句点后的空白断点是否紧跟在缩写之后（此时不断句）"""
+    start = match.start()
+    if start == 0 or text[start - 1] != '.' or '\n' in match.group():
+        return False
+    return ABBREVIATION_PATTERN.search(text[max(0, start - ABBREVIATION_LOOKBACK):start]) is not None
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """把文本切分为句子，返回各句（去掉首尾空白）在原文中的 (起, 止) 位置，空白句跳过"""
+    spans = []
+    start = 0
+    matches = [match for match in SENTENCE_PATTERN.finditer(text) if not _is_abbreviation_break(text, match)]
+    for match in [*matches, None]:
+        end = match.start() if match else len(text)
+        sentence = text[start:end]
+        stripped = sentence.strip()
+        if stripped:
+            offset = start + sentence.index(stripped)
+            spans.append((offset, offset + len(stripped)))
+        if match:
+            start = match.end()
+    return spans
+
+
+def split_sentences(text: str) -> List[str]:
+    """把文本切分为句子，去掉空白句"""
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+def combine_sentences(sentences: List[str], buffer_size: int = 1) -> List[str]:
+    """每个句子与前后各 buffer_size 个句子拼接，作为该位置的嵌入输入"""
+    return [
+        " ".join(sentences[max(0, i - buffer_size):i + buffer_size + 1])
+        for i in range(len(sentences))
+    ]
+
+
+def breakpoint_threshold(distances: np.ndarray, threshold_type: str, amount: float) -> Tuple[float, np.ndarray]:
+    """
+    按阈值类型计算断点阈值
+    :return: (阈值, 用于与阈值比较的序列)；gradient 类型比较的是距离的梯度
+    """
+    if threshold_type == "percentile":
+        return float(np.percentile(distances, amount)), distances
+    if threshold_type == "standard_deviation":
+        return float(np.mean(distances) + amount * np.std(distances)), distances
+    if threshold_type == "interquartile":
+        q1, q3 = np.percentile(distances, [25, 75])
+        return float(np.mean(distances) + amount * (q3 - q1)), distances
+    if threshold_type == "gradient":
+        gradient = np.gradient(distances)
+        return float(np.percentile(gradient, amount)), gradient
+    raise ValueError(f"未知的断点阈值类型: {threshold_type}，可选 {list(BREAKPOINT_DEFAULTS)}")
+
+
+class SemanticSplitter:
+
+    def __init__(self, embeddings: Embeddings, breakpoint_threshold_type: str = "percentile",
+                 breakpoint_threshold_amount: Optional[float] = None, buffer_size: int = 1,
+                 batch_size: int = EMBED_BATCH_SIZE, use_cache: bool = True):
+        """
+        :param embeddings: LangChain 嵌入对象
+        :param breakpoint_threshold_type: 断点阈值类型 percentile / standard_deviation / interquartile / gradient
+        :param breakpoint_threshold_amount: 阈值参数，默认取 BREAKPOINT_DEFAULTS 中的值
+        :param buffer_size: 每个句子前后各拼接多少个句子再嵌入
+        :param batch_size: 每次嵌入请求包含的句子组合数
+        :param use_cache: 是否经持久化嵌入缓存（CachedEmbeddings）调用嵌入模型
+        """
+        if breakpoint_threshold_type not in BREAKPOINT_DEFAULTS:
+            raise ValueError(f"未知的断点阈值类型: {breakpoint_threshold_type}，可选 {list(BREAKPOINT_DEFAULTS)}")
+        if use_cache and not isinstance(embeddings, CachedEmbeddings):
+            model_name = getattr(embeddings, "model", None) or type(embeddings).__name__
+            embeddings = CachedEmbeddings(embeddings, model_name=model_name)
+        self.embeddings = embeddings
+        self.breakpoint_threshold_type = breakpoint_threshold_type
+        self.breakpoint_threshold_amount = (
+            BREAKPOINT_DEFAULTS[breakpoint_threshold_type]
+            if breakpoint_threshold_amount is None else breakpoint_threshold_amount
+        )
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+
+    def _embed(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """去重后分批嵌入，返回 文本 → 单位化向量"""
+        unique = list(dict.fromkeys(texts))
+        vectors = []
+        for start in range(0, len(unique), self.batch_size):
+            vectors.extend(self.embeddings.embed_documents(unique[start:start + self.batch_size]))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        return dict(zip(unique, matrix))
+
+    def _breakpoints(self, vectors: np.ndarray) -> np.ndarray:
+        """相邻句子组合的余弦距离超过阈值的位置（断在该位置的句子之后）"""
+        distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+        threshold, values = breakpoint_threshold(distances, self.breakpoint_threshold_type, self.breakpoint_threshold_amount)
+        return np.flatnonzero(values > threshold)
+
+    def split_texts(self, texts: List[str]) -> List[List[str]]:
+        """
+        对一批文本分别做语义切分，所有句子一起嵌入；返回与 texts 一一对应的分块列表
+        分块取原文中的连续片段，保留原有的换行和空白
+        """
+        spans_per_text = [sentence_spans(text) for text in texts]
+        combined_per_text = [
+            combine_sentences([text[start:end] for start, end in spans], self.buffer_size)
+            for text, spans in zip(texts, spans_per_text)
+        ]
+        to_embed = [combined for spans, combined_list in zip(spans_per_text, combined_per_text)
+                    if len(spans) > 2 for combined in combined_list]
+        vectors = self._embed(to_embed) if to_embed else {}
+
+        results = []
+        for text, spans, combined in zip(texts, spans_per_text, combined_per_text):
+            if len(spans) <= 2:
+                # 句子太少无法估计距离分布，保持为一块
+                results.append([text])
+                continue
+            breakpoints = self._breakpoints(np.stack([vectors[c] for c in combined]))
+            chunks, first = [], 0
+            for last in [*breakpoints.tolist(), len(spans) - 1]:
+                chunks.append(text[spans[first][0]:spans[last][1]])
+                first = last + 1
+            results.append(chunks)
+        return results
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        对一批 Document 做语义切分：只切分文本块（embedding_type 为 text），每个 Document 内部断开，保留原 metadata
+        """
+        text_indices = [i for i, doc in enumerate(documents) if doc.metadata.get("embedding_type", "text") == "text"]
+        if not text_indices:
+            return list(documents)
+        chunks_per_doc = self.split_texts([documents[i].page_content for i in text_indices])
+        chunks_by_index = dict(zip(text_indices, chunks_per_doc))
+
+        result = []
+        for i, doc in enumerate(documents):
+            if i not in chunks_by_index or len(chunks_by_index[i]) == 1:
+                result.append(doc)
+                continue
+            result.extend(Document(page_content=chunk, metadata=dict(doc.metadata)) for chunk in chunks_by_index[i])
+        log.info(f"语义切分：{len(text_indices)} 个文本块 → {len(result) - len(documents) + len(text_indices)} 个")
+        return result
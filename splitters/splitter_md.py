@@ -4,28 +4,64 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import base64
 from PIL import Image
 import io
-from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
-# SemanticChunker 在新版本中已弃用，使用 RecursiveCharacterTextSplitter 替代
+from langchain_text_splitters import MarkdownHeaderTextSplitter
 from llm_utils import openai_embedding
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 import re
 import hashlib
-from typing import List
-from utils.common_utils import get_sorted_md_files
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from utils.common_utils import build_title_path, get_sorted_md_files
 from utils.log_utils import log
+from utils.token_utils import EMBEDDING_MAX_TOKENS, count_tokens, split_text_by_tokens
 from bs4 import BeautifulSoup
+from splitters.md_scanner import IMAGE_REF_PATTERN, scan_markdown, splice_html_tables
+from splitters.semantic_chunker import SemanticSplitter
 
 
+# 目录内 md 文件少于该数量时不启动进程池，直接在当前进程逐个处理
+MIN_FILES_FOR_POOL = 4
+
+MAX_CHUNK_CHARS = 10000  # 文本块（含标题前缀）的字符数上限，与 Milvus text 字段的 max_length 一致
+MIN_CONTENT_TOKENS = 32  # 标题前缀过长时，正文至少保留的 token 数
+
+# 进程池中每个 worker 持有的切分器（由 _init_split_worker 创建）
+_worker_splitter = None
+_worker_chunks = True  # worker 内是否完成分块；语义分块需要调用嵌入模型，留在主进程做
+
+
+def _init_split_worker(splitter_cls, images_output_dir: str, text_chunk_size: int, chunk_in_worker: bool) -> None:
+    global _worker_splitter, _worker_chunks
+    _worker_splitter = splitter_cls(images_output_dir=images_output_dir, text_chunk_size=text_chunk_size, max_workers=1)
+    _worker_chunks = chunk_in_worker
+
+
+def _split_md_file(md_file: str) -> List[Document]:
+    log.info(f"真正处理的文件为:{md_file}")
+    if _worker_chunks:
+        return _worker_splitter.process_md_file(md_file)
+    return _worker_splitter.extract_documents(md_file)
+
 
 class MarkdownDirSplitter:
 
-    def __init__(self, images_output_dir: str, text_chunk_size: int = 1000):
+    def __init__(self, images_output_dir: str, text_chunk_size: int = EMBEDDING_MAX_TOKENS, max_workers: Optional[int] = None,
+                 chunking: str = "recursive", embeddings: Optional[Embeddings] = None,
+                 breakpoint_threshold_type: str = "percentile"):
         """
         :params images_output_dir: 用于保存从 Markdown 中提取的 Base64 图片的本地目录。如果调用api可以直接对base64进行处理，如果私有化部署的gem则需要对jpg处理
-        :params text_chunk_size:  文本分块阈值，默认 1000 字符。超过该长度的文本块会进一步语义分割。
+        :params text_chunk_size:  文本块的 token 上限（含入库时拼接的标题前缀），默认为嵌入模型的输入上限。超过的文本块会进一步切分。
+        :params max_workers: process_md_dir 并行切分的进程数，默认 CPU 核数；1 表示在当前进程逐个处理
+        :params chunking: 分块方式。recursive：只按 token 上限切分；semantic：先在标题分块内部按语义断开（见 splitters/semantic_chunker.py），再按 token 上限切分
+        :params embeddings: semantic 模式使用的嵌入模型，默认 openai_embedding
+        :params breakpoint_threshold_type: semantic 模式的断点阈值类型 percentile / standard_deviation / interquartile / gradient
         """
+        if chunking not in ("recursive", "semantic"):
+            raise ValueError(f"未知的分块方式: {chunking}，可选 recursive / semantic")
         self.images_output_dir = images_output_dir
         self.text_chunk_size = text_chunk_size
+        self.max_workers = max_workers or os.cpu_count() or 1
         os.makedirs(self.images_output_dir, exist_ok=True)
 
         # 定义标题切割层级
@@ -40,13 +76,15 @@ class MarkdownDirSplitter:
             headers_to_split_on=self.headers_to_split_on
         )
 
-        # 初始化文本切割器（使用 RecursiveCharacterTextSplitter 替代 SemanticChunker）
-        self.semantic_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            is_separator_regex=False
-        )
+        # 超长文本块按 token 数切分（utils/token_utils.py），相邻块重叠 1/5
+        self.chunk_overlap = text_chunk_size // 5
+
+        # 语义分块（可选）
+        self.chunking = chunking
+        self.semantic_splitter = None
+        if chunking == "semantic":
+            self.semantic_splitter = SemanticSplitter(embeddings or openai_embedding,
+                                                      breakpoint_threshold_type=breakpoint_threshold_type)
 
     def save_base64_to_Image(self, base64_str: str, output_path: str ) -> None:
         '''将 Base64 编码的图片数据解码并保存为图像文件 因为私有化部署的gem模型无法直接处理base64'''
@@ -111,6 +149,34 @@ class MarkdownDirSplitter:
         }
     )
     '''
+    def process_image_refs(self, content: str, source: str) -> Tuple[str, List[Document]]:
+        """
+        处理Markdown中按路径引用的图片（OCR 阶段已把图片裁剪写成文件，见 layoutjson2md 的 image_dir）
+        路径相对于 Markdown 文件所在目录，直接作为图片 Document 的内容，不再解码、重存
+        :param content:  Markdown 内容 字符串
+        :param source:  当前 Markdown 文件的路径，用于解析相对路径
+        :return: (移除了本地图片引用的内容, 图片 Document 列表)；指向不存在文件或网络地址的引用保留在文本中
+        """
+        image_docs = []
+        md_dir = os.path.dirname(source)
+
+        def replace_ref(match):
+            img_path = os.path.normpath(os.path.join(md_dir, match.group(1)))
+            if not os.path.isfile(img_path):
+                return match.group(0)
+            image_docs.append(Document(
+                page_content=img_path,
+                metadata={
+                    "source": source,
+                    "alt_text": "图片",
+                    "embedding_type": "image"
+                }
+            ))
+            return ''
+
+        content = IMAGE_REF_PATTERN.sub(replace_ref, content)
+        return content, image_docs
+
     def process_image_with_api(self):
         '''使用API处理图片,返回图片的Document列表'''
         pass
@@ -237,8 +303,63 @@ class MarkdownDirSplitter:
         
         return converted_text
 
+    def save_base64_image(self, img_type: str, base64_data: str) -> str:
+        """
+        按内容保存一张 Base64 图片，文件名与 process_images 相同（md5 + 扩展名），已存在则不再写
+        图片类型与扩展名一致（png/jpg/jpeg）时直接写解码后的字节，不经 PIL 重新编码
+        """
+        img_type = img_type.split(';')[0]
+        ext = img_type if img_type in ['png', 'jpg', 'jpeg'] else 'png'
+        img_path = os.path.join(self.images_output_dir, f"{hashlib.md5(base64_data.encode()).hexdigest()}.{ext}")
+        if not os.path.exists(img_path):
+            if ext == img_type:
+                tmp_path = f"{img_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(base64.b64decode(base64_data))
+                os.replace(tmp_path, img_path)
+            else:
+                self.save_base64_to_Image(base64_data, img_path)
+        return img_path
+
     def process_md_file(self, md_file: str) -> List[Document]:
         """
+        读取一个 Markdown 文件 → 单遍扫描（表格转换、按标题切分、取出图片，见 splitters/md_scanner.py）→ 对长文本进行分块
+        产出与 process_md_file_multipass 相同的 Document 列表（文本块和图片路径块）
+        :params md_file —— Markdown 文件的路径（字符串）
+        """
+        return self.chunk_documents(self.extract_documents(md_file))
+
+    def extract_documents(self, md_file: str) -> List[Document]:
+        """
+        读取一个 Markdown 文件并单遍扫描，返回按标题切分、取出图片后的 Document 列表（尚未分块）
+        """
+        with open(md_file, 'r', encoding='utf-8') as file:
+            content = file.read()
+
+        content, table_count = splice_html_tables(content)
+        if table_count > 0:
+            log.info(f"✅ 成功转换 {table_count} 个 HTML 表格为 Markdown 格式")
+
+        documents = []
+        for chunk in scan_markdown(content, self.headers_to_split_on, base_dir=os.path.dirname(md_file)):
+            if chunk.has_images:
+                if chunk.content.strip():
+                    chunk.metadata['embedding_type'] = 'text'
+                    documents.append(Document(page_content=chunk.content, metadata=chunk.metadata))
+                image_metadata = {"source": md_file, "alt_text": "图片", "embedding_type": "image"}
+                for img_path in chunk.image_paths:
+                    documents.append(Document(page_content=img_path, metadata=dict(image_metadata)))
+                for img_type, base64_data in chunk.base64_images:
+                    img_path = self.save_base64_image(img_type, base64_data)
+                    documents.append(Document(page_content=str(img_path), metadata=dict(image_metadata)))
+            else:
+                chunk.metadata['embedding_type'] = 'text'
+                documents.append(Document(page_content=chunk.content, metadata=chunk.metadata))
+        return documents
+
+    def process_md_file_multipass(self, md_file: str) -> List[Document]:
+        """
+        原多遍实现，保留用于对比（splitters/benchmark_splitter.py）
         读取一个 Markdown 文件 → 按标题结构分割 → 提取并保存其中的 Base64 图片 → 清洗文本 → 对长文本进行语义分块 → 最终返回结构化、可嵌入的 Document 列表（包含文本块和图片路径块）
         :params md_file —— Markdown 文件的路径（字符串）
         """
@@ -252,13 +373,18 @@ class MarkdownDirSplitter:
         split_documents: List[Document] = self.text_splitter.split_text(content)
         documents = []
         for doc in split_documents:
-            # 2. 提取并保存其中的 Base64 图片
-            if 'data:image/' in doc.page_content:
+            # 2. 提取图片：路径引用直接使用文件，旧版内嵌的 Base64 图片解码保存
+            image_docs: List[Document] = []
+            cleaned_content = doc.page_content
+            if '![' in cleaned_content:
+                cleaned_content, image_docs = self.process_image_refs(cleaned_content, md_file)
+            if 'data:image/' in cleaned_content:
                 # 拿到图片的专属document
-                image_docs: List[Document] = self.process_images(doc.page_content, md_file)
+                image_docs.extend(self.process_images(cleaned_content, md_file))
+                cleaned_content = self.remove_base64_images(cleaned_content)
+            if image_docs:
                 # 移除图片之后，# 如果清洗后还有文本内容，创建一个纯文本 Document 并标记 embedding_type='text' 
                 # # 剩余的文本内容，给上doc.metadata['embedding_type'] = 'text'作为文本的embedding_type
-                cleaned_content = self.remove_base64_images(doc.page_content)
                 if cleaned_content.strip():
                     doc.metadata['embedding_type'] = 'text'
                     documents.append(Document(page_content=cleaned_content, metadata=doc.metadata))
@@ -267,20 +393,51 @@ class MarkdownDirSplitter:
                 doc.metadata['embedding_type'] = 'text'
                 documents.append(doc)
 
-        # 语义分割
-        final_docs = []
-        for d in documents:
-            if len(d.page_content) > self.text_chunk_size:
-                final_docs.extend(self.semantic_splitter.split_documents([d]))
-            else:
-                final_docs.append(d)
-
-        # 添加标题层级 用于后续的查询和检索
-        return final_docs
+        return self.chunk_documents(documents)
     
-    def add_title_hierarchy(self, documents: List[Document], source_filename: str) -> List[Document]:
-        """章节溯源"""
-        current_titles = {1: "", 2: "", 3: ""}        # current_titles 是一个状态记录器，表示“当前遍历到的文档块，所处的最新一级、二级、三级标题是什么”
+    def chunk_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        分块：semantic 模式先对同一批文本块做语义切分（所有句子批量嵌入），再按 token 上限切分超长文本块
+        """
+        if self.semantic_splitter is not None:
+            documents = self.semantic_splitter.split_documents(documents)
+        return self.fit_token_budget(documents)
+
+    def fit_token_budget(self, documents: List[Document]) -> List[Document]:
+        """
+        保证每个文本块在入库时（标题前缀 + ':' + 正文，见 MilvusVectorSave.doc_to_dict）不超过 text_chunk_size 个 token
+        和 MAX_CHUNK_CHARS 个字符：标题前缀计入预算，超出的正文按 token 数切分，图片块原样保留
+        标题层级补全后前缀可能变长，add_title_hierarchy 之后需要再调用一次
+        """
+        fitted = []
+        for doc in documents:
+            if doc.metadata.get('embedding_type') != 'text':
+                fitted.append(doc)
+                continue
+            title = build_title_path(doc.metadata)
+            prefix = f"{title}:" if title else ""
+            text = prefix + doc.page_content
+            if len(text) <= MAX_CHUNK_CHARS and count_tokens(text) <= self.text_chunk_size:
+                fitted.append(doc)
+                continue
+
+            # 前缀与正文拼接处可能多出 1 个 token，预留出来
+            budget = self.text_chunk_size - (count_tokens(prefix) + 1 if prefix else 0)
+            if budget < MIN_CONTENT_TOKENS:
+                log.warning(f"⚠️ 标题前缀过长（{count_tokens(prefix)} token），文本块会超出 {self.text_chunk_size} token: {title[:50]}...")
+                budget = MIN_CONTENT_TOKENS
+            pieces = split_text_by_tokens(doc.page_content, budget, overlap_tokens=min(self.chunk_overlap, budget // 5),
+                                          max_chars=MAX_CHUNK_CHARS - len(prefix))
+            fitted.extend(Document(page_content=piece, metadata=dict(doc.metadata)) for piece in pieces)
+        return fitted
+
+    def add_title_hierarchy(self, documents: List[Document], source_filename: str, current_titles: Optional[Dict[int, str]] = None) -> List[Document]:
+        """
+        章节溯源
+        :param current_titles: 跨调用延续的标题状态（逐页流式处理时传入同一个字典，原地更新），默认从空标题开始
+        """
+        if current_titles is None:
+            current_titles = {1: "", 2: "", 3: ""}        # current_titles 是一个状态记录器，表示“当前遍历到的文档块，所处的最新一级、二级、三级标题是什么”
         processed_docs = []
 
         for doc in documents:
@@ -322,9 +479,8 @@ class MarkdownDirSplitter:
         # 读取 所有 .md 文件，按页码/章节排序
         md_files = get_sorted_md_files(md_dir)
         all_documents = []
-        for md_file in md_files:
-            log.info(f"真正处理的文件为:{md_file}")
-            all_documents.extend(self.process_md_file(md_file))    
+        for docs in self.split_md_files(md_files):
+            all_documents.extend(docs)
         """
         process_md_file 内部做了什么？
         读取文件内容
@@ -337,8 +493,34 @@ class MarkdownDirSplitter:
             返回该文件的所有 Document 列表
         → 此时，每个 Document 的 metadata['source'] 是它所在的 .md 文件路径（如 "./converted_md/page_01.md"）
         """
-        # 添加标题层级
-        return self.add_title_hierarchy(all_documents, source_filename)
+        # 添加标题层级：按页码顺序拼接后顺序执行一遍，标题跨页延续；补全的标题计入 token 预算
+        return self.fit_token_budget(self.add_title_hierarchy(all_documents, source_filename))
+
+    def split_md_files(self, md_files: List[str]) -> List[List[Document]]:
+        """
+        逐文件切分（表格转换、图片提取与保存、分块），文件之间互不依赖，文件较多时分发到进程池并行处理
+        :return: 与 md_files 顺序一一对应的 Document 列表；标题层级不在这里处理
+        """
+        workers = min(self.max_workers, len(md_files))
+        if workers <= 1 or len(md_files) < MIN_FILES_FOR_POOL:
+            results = []
+            for md_file in md_files:
+                log.info(f"真正处理的文件为:{md_file}")
+                results.append(self.process_md_file(md_file))
+            return results
+
+        log.info(f"并行切分 {len(md_files)} 个 md 文件，进程数 {workers}")
+        chunk_in_worker = self.semantic_splitter is None
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_split_worker,
+            initargs=(type(self), self.images_output_dir, self.text_chunk_size, chunk_in_worker),
+        ) as executor:
+            # map 按提交顺序返回结果，保证页码顺序
+            results = list(executor.map(_split_md_file, md_files, chunksize=max(1, len(md_files) // (workers * 4))))
+        if not chunk_in_worker:
+            results = [self.chunk_documents(documents) for documents in results]
+        return results
 
 
 if __name__ == "__main__":
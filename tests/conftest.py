@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 测试直接导入项目模块（utils、splitters、dots_ocr、milvus_db）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# llm_utils 在导入时创建模型客户端，需要非空的 API Key（测试中不会真正请求）
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("DASHSCOPE_API_KEY", "test")
@@ -0,0 +1,61 @@
+from utils import cache_utils
+from utils.cache_utils import EmbeddingCache, SqliteLRUCache
+
+
+def test_eviction_removes_least_recently_used_down_to_low_watermark(tmp_path):
+    cache = SqliteLRUCache(str(tmp_path / "cache.sqlite3"), max_bytes=1000, access_update_interval=0)
+    for i in range(10):
+        cache.set(f"k{i}", b"x" * 100)
+    cache.get("k0")  # k0 becomes the most recently used
+
+    cache.set("k10", b"x" * 100)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 900
+    assert cache.get("k0") is not None
+    assert cache.get("k1") is None and cache.get("k2") is None
+    assert cache.get("k10") is not None
+    assert cache._total_bytes == stats["bytes"]
+
+
+def test_access_time_is_refreshed_at_most_once_per_interval(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_utils.time, "time", lambda: now[0])
+    cache = SqliteLRUCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000, access_update_interval=60)
+    cache.set("a", b"x")
+
+    def last_access():
+        return cache._conn.execute("SELECT last_access FROM cache WHERE key = 'a'").fetchone()[0]
+
+    now[0] += 30
+    assert cache.get("a") == b"x"
+    assert last_access() == 1000.0
+
+    now[0] += 30
+    cache.get("a")
+    assert last_access() == 1060.0
+
+
+def test_running_total_accounts_for_replaced_values(tmp_path):
+    cache = SqliteLRUCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000)
+    cache.set_many([("a", b"x" * 300), ("b", b"x" * 200)])
+    cache.set("a", b"x" * 50)
+
+    assert cache._total_bytes == 250
+    assert cache.stats()["bytes"] == 250
+
+
+def test_running_total_is_loaded_when_reopened(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SqliteLRUCache(path, max_bytes=10_000).set_many([("a", b"x" * 300), ("b", b"x" * 200)])
+
+    assert SqliteLRUCache(path, max_bytes=10_000)._total_bytes == 500
+
+
+def test_embeddings_round_trip_as_float32(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    items = [{"text": "a"}, {"text": "b"}]
+    cache.put_embeddings("m", "1", items, [[0.5, 0.25], []])
+
+    assert cache.get_embeddings("m", "1", items) == [[0.5, 0.25], None]
+    assert cache.stats()["bytes"] == 2 * 4
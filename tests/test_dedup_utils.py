@@ -0,0 +1,58 @@
+from langchain_core.documents import Document
+
+from utils.dedup_utils import NearDuplicateFilter, dedup_documents
+
+FOOTER = "Copyright 2024 Example Corp. All rights reserved. Licensed under CC BY 4.0."
+
+
+def _text(content, source="a.pdf", **headers):
+    return Document(page_content=content, metadata={"source": source, "embedding_type": "text", **headers})
+
+
+def test_near_duplicates_keep_first_occurrence():
+    docs = [
+        _text(FOOTER),
+        _text("Transformers use self-attention to relate tokens in a sequence."),
+        _text(FOOTER.replace("2024", "2025")),
+        _text(FOOTER),
+    ]
+
+    kept, report = dedup_documents(docs, threshold=0.8)
+
+    assert [doc.page_content for doc in kept] == [docs[0].page_content, docs[1].page_content]
+    assert report["dropped"] == 2
+    assert report["top_duplicates"][0]["count"] == 2
+
+
+def test_images_and_distinct_texts_are_kept():
+    image = Document(page_content="images/a.png", metadata={"source": "a.pdf", "embedding_type": "image"})
+    docs = [image, image, _text("Retrieval augmented generation."), _text("Milvus stores dense vectors.")]
+
+    assert NearDuplicateFilter(threshold=0.85).filter(docs) == docs
+
+
+def test_document_scope_only_drops_within_the_same_source():
+    docs = [_text(FOOTER, "a.pdf"), _text(FOOTER, "b.pdf")]
+
+    assert len(NearDuplicateFilter(scope="document").filter(docs)) == 2
+    assert len(NearDuplicateFilter(scope="global").filter(docs)) == 1
+
+
+def test_state_carries_across_filter_calls():
+    dedup_filter = NearDuplicateFilter()
+    assert dedup_filter.filter([_text(FOOTER)])
+    assert dedup_filter.filter([_text(FOOTER)]) == []
+    assert dedup_filter.report()["total"] == 2
+
+
+def test_same_text_under_different_titles_is_kept():
+    docs = [
+        _text(FOOTER, **{"Header 1": "Method"}),
+        _text(FOOTER, **{"Header 1": "Results"}),
+        _text(FOOTER, **{"Header 1": "Results", "Header 2": "Ablation"}),
+        _text(FOOTER.replace("2024", "2025"), **{"Header 1": "Results"}),
+    ]
+
+    kept = NearDuplicateFilter(threshold=0.8, scope="global").filter(docs)
+
+    assert kept == docs[:3]
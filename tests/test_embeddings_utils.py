@@ -0,0 +1,41 @@
+from http import HTTPStatus
+
+from utils import embeddings_utils
+
+
+def test_embed_sub_batch_bisects_until_bad_item_is_isolated(monkeypatch):
+    calls = []
+
+    def fake_call(input_data):
+        calls.append([item["text"] for item in input_data])
+        if any(item["text"] == "bad" for item in input_data):
+            return False, [], HTTPStatus.BAD_REQUEST, None
+        return True, [[float(len(item["text"]))] for item in input_data], HTTPStatus.OK, None
+
+    monkeypatch.setattr(embeddings_utils, "_call_dashscope", fake_call)
+    items = [{"text": t} for t in ["a", "bb", "bad", "dddd"]]
+
+    result = embeddings_utils._embed_sub_batch(items)
+
+    assert result == [[1.0], [2.0], [], [4.0]]
+    assert calls[0] == ["a", "bb", "bad", "dddd"]
+    assert ["bad"] in calls
+    assert ["a", "bb"] in calls and ["dddd"] in calls
+
+
+def test_embed_sub_batch_retries_retryable_errors_without_bisecting(monkeypatch):
+    responses = iter([
+        (False, [], HTTPStatus.INTERNAL_SERVER_ERROR, 0.0),
+        (True, [[1.0], [2.0]], HTTPStatus.OK, None),
+    ])
+    calls = []
+
+    def fake_call(input_data):
+        calls.append(len(input_data))
+        return next(responses)
+
+    monkeypatch.setattr(embeddings_utils, "_call_dashscope", fake_call)
+    monkeypatch.setattr(embeddings_utils.time, "sleep", lambda seconds: None)
+
+    assert embeddings_utils._embed_sub_batch([{"text": "a"}, {"text": "b"}]) == [[1.0], [2.0]]
+    assert calls == [2, 2]
@@ -0,0 +1,117 @@
+import pytest
+from langchain_core.documents import Document
+
+from milvus_db import milvus_db_with_schema
+from milvus_db.milvus_db_with_schema import MilvusVectorSave
+
+
+def _item(text, filename="a.pdf", title="Intro"):
+    item = {"text": text, "category": "text", "filename": filename, "title": title, "image_path": ""}
+    item["fingerprint"] = MilvusVectorSave.compute_fingerprint(item)
+    return item
+
+
+def _saver(existing=None):
+    """不连接 Milvus 的 MilvusVectorSave，existing: filename → [(id, fingerprint)]"""
+    saver = MilvusVectorSave.__new__(MilvusVectorSave)
+    saver._fingerprint_checked = True
+    saver.query_existing_chunks = lambda filename: list((existing or {}).get(filename, []))
+    return saver
+
+
+def test_fingerprint_ignores_whitespace_but_not_title():
+    assert _item("hello   world\n")["fingerprint"] == _item(" hello world")["fingerprint"]
+    assert _item("hello world")["fingerprint"] != _item("hello world", title="Method")["fingerprint"]
+
+
+def test_diff_with_existing_adds_changed_and_deletes_stale():
+    kept, edited, new = _item("unchanged"), _item("edited paragraph"), _item("brand new")
+    existing = {"a.pdf": [(1, kept["fingerprint"]), (2, _item("old paragraph")["fingerprint"]), (3, "")]}
+
+    new_indices, stale_ids = _saver(existing).diff_with_existing([kept, edited, new])
+
+    assert new_indices == [1, 2]
+    assert sorted(stale_ids) == [2, 3]
+
+
+def test_diff_with_existing_counts_duplicate_chunks():
+    dup = _item("repeated")
+    existing = {"a.pdf": [(1, dup["fingerprint"])]}
+
+    new_indices, stale_ids = _saver(existing).diff_with_existing([dup, dict(dup)])
+
+    assert new_indices == [1]
+    assert stale_ids == []
+
+
+@pytest.mark.parametrize("embedded, dead_letter, expected", [
+    (2, 0, True),
+    (1, 0, False),
+    (2, 1, False),
+])
+def test_can_delete_stale(embedded, dead_letter, expected):
+    stats = {"inserted": embedded - dead_letter, "dead_letter": dead_letter, "batches": 1}
+    assert MilvusVectorSave.can_delete_stale(2, embedded, stats) is expected
+
+
+@pytest.mark.parametrize("failed_embedding, dead_letter, deleted", [
+    (False, 0, True),
+    (True, 0, False),
+    (False, 1, False),
+])
+def test_incremental_save_keeps_stale_rows_when_replacement_fails(monkeypatch, failed_embedding, dead_letter, deleted):
+    existing = {"a.pdf": [(7, _item("old paragraph")["fingerprint"])]}
+    saver = _saver(existing)
+    calls = {"deleted": []}
+
+    def embed(items, **kwargs):
+        for i, item in enumerate(items):
+            item["text_content_dense"] = [] if failed_embedding and i == 0 else [0.1] * 1024
+        return items
+
+    monkeypatch.setattr(milvus_db_with_schema, "process_items_with_guard", embed)
+    monkeypatch.setattr(MilvusVectorSave, "generate_image_description",
+                        staticmethod(lambda data_list, targets=None, **kwargs: data_list))
+    saver.write_to_milvus = lambda rows: {"inserted": len(rows) - dead_letter, "dead_letter": dead_letter, "batches": 1}
+    saver.delete_by_ids = lambda ids: calls["deleted"].extend(ids)
+
+    docs = [Document(page_content="new paragraph", metadata={"source": "a.pdf", "embedding_type": "text",
+                                                             "Header 1": "Intro"})]
+    saver.do_save_to_milvus(docs, incremental=True, dedup_threshold=None)
+
+    assert calls["deleted"] == ([7] if deleted else [])
+
+
+def test_missing_fingerprint_field_fails_with_recreate_hint():
+    class FakeClient:
+        def describe_collection(self, collection_name):
+            return {"fields": [{"name": "id"}, {"name": "text"}]}
+
+        def add_collection_field(self, **kwargs):
+            raise Exception("add field not supported")
+
+    saver = MilvusVectorSave.__new__(MilvusVectorSave)
+    saver.client = FakeClient()
+    saver._fingerprint_checked = False
+
+    with pytest.raises(RuntimeError, match="重建集合"):
+        saver.ensure_fingerprint_field()
+
+
+def test_missing_fingerprint_field_is_added_as_nullable():
+    added = {}
+
+    class FakeClient:
+        def describe_collection(self, collection_name):
+            return {"fields": [{"name": "id"}]}
+
+        def add_collection_field(self, **kwargs):
+            added.update(kwargs)
+
+    saver = MilvusVectorSave.__new__(MilvusVectorSave)
+    saver.client = FakeClient()
+    saver._fingerprint_checked = False
+    saver.ensure_fingerprint_field()
+
+    assert added["field_name"] == "fingerprint" and added["nullable"] is True
+    assert saver._fingerprint_checked
@@ -0,0 +1,62 @@
+import pytest
+from pymilvus.exceptions import DataNotMatchException, ErrorCode, MilvusException, MilvusUnavailableException
+
+from milvus_db import milvus_db_with_schema
+from milvus_db.milvus_db_with_schema import MilvusVectorSave
+
+
+class FakeClient:
+    """insert 时包含坏行的批次抛出 error，好批次首次抛出 transient（若给出）"""
+
+    def __init__(self, error, transient=None):
+        self.error = error
+        self.transient = transient
+        self.calls = []
+
+    def insert(self, collection_name, data):
+        self.calls.append([row["id"] for row in data])
+        if any(row["id"] == "bad" for row in data):
+            raise self.error
+        if self.transient is not None:
+            error, self.transient = self.transient, None
+            raise error
+        return {"insert_count": len(data)}
+
+
+@pytest.fixture
+def saver(monkeypatch):
+    monkeypatch.setattr(milvus_db_with_schema.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(MilvusVectorSave, "write_dead_letters", staticmethod(lambda rows, reason: None))
+    return MilvusVectorSave.__new__(MilvusVectorSave)
+
+
+def rows(*ids):
+    return [{"id": i} for i in ids]
+
+
+def test_schema_error_bisects_without_retrying(saver):
+    saver.client = FakeClient(DataNotMatchException(message="dim mismatch"))
+
+    assert saver._insert_batch(rows("a", "bad", "c", "d")) == (3, 1)
+    # 每个包含坏行的批次只尝试一次
+    assert saver.client.calls.count(["a", "bad", "c", "d"]) == 1
+    assert saver.client.calls.count(["bad"]) == 1
+
+
+def test_transient_error_is_retried_before_bisecting(saver):
+    saver.client = FakeClient(DataNotMatchException(message="bad row"),
+                              transient=MilvusUnavailableException(message="server restarting"))
+
+    assert saver._insert_batch(rows("a", "b")) == (2, 0)
+    assert saver.client.calls == [["a", "b"], ["a", "b"]]
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (MilvusUnavailableException(message="unavailable"), True),
+    (MilvusException(code=ErrorCode.RATE_LIMIT, message="rate limited"), True),
+    (ConnectionResetError(), True),
+    (MilvusException(code=1100, message="invalid parameter"), False),
+    (DataNotMatchException(message="field missing"), False),
+])
+def test_insert_error_classification(error, retryable):
+    assert MilvusVectorSave._is_retryable_insert_error(error) is retryable
@@ -0,0 +1,36 @@
+from dots_ocr.parser import DotsOCRParser
+from dots_ocr.utils.ocr_cache import OcrResponseCache
+
+
+def page_key(tmp_path, **settings):
+    parser = DotsOCRParser(output_dir=str(tmp_path), cpu_workers=0, **settings)
+    return parser._cache_key("doc", 0, "prompt_layout_all_en", None, None)
+
+
+def test_cache_key_changes_with_request_settings(tmp_path):
+    base = page_key(tmp_path)
+
+    assert page_key(tmp_path) == base
+    assert page_key(tmp_path, temperature=0.7) != base
+    assert page_key(tmp_path, top_p=0.9) != base
+    assert page_key(tmp_path, max_completion_tokens=4096) != base
+    assert page_key(tmp_path, repeat_limit=0) != base
+    assert page_key(tmp_path, image_format="JPEG") != base
+
+
+def test_no_key_without_cache_or_document_hash(tmp_path):
+    parser = DotsOCRParser(output_dir=str(tmp_path), cpu_workers=0, use_cache=False)
+    assert parser._cache_key("doc", 0, "prompt_layout_all_en", None, None) is None
+
+    parser = DotsOCRParser(output_dir=str(tmp_path), cpu_workers=0)
+    assert parser._cache_key(None, 0, "prompt_layout_all_en", None, None) is None
+
+
+def test_response_round_trip(tmp_path):
+    cache = OcrResponseCache(str(tmp_path / "ocr.sqlite3"))
+    key = OcrResponseCache.make_key("doc", 3, "prompt_ocr", 200, None, None, "model")
+
+    assert cache.get(key) is None
+    cache.set(key, "page text")
+    assert cache.get(key) == "page text"
+    cache.close()
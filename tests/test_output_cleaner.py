@@ -0,0 +1,60 @@
+import json
+
+from dots_ocr.utils.output_cleaner import DUP_PAIR_THRESHOLD, StreamingCellParser
+
+CELLS = [
+    {"bbox": [10, 10, 200, 40], "category": "Title", "text": "# Attention Is All You Need"},
+    {"bbox": [10, 50, 500, 120], "category": "Text", "text": "We propose the \"Transformer\", a model\\nbased on attention {only}."},
+    {"bbox": [10, 130, 500, 400], "category": "Picture"},
+    {"bbox": [10, 410, 500, 440], "category": "Caption", "text": "Figure 1: The Transformer."},
+]
+
+
+def _parse(text, chunk_size=None):
+    parser = StreamingCellParser()
+    if chunk_size is None:
+        parser.feed(text)
+    else:
+        for start in range(0, len(text), chunk_size):
+            parser.feed(text[start:start + chunk_size])
+    return parser.close()
+
+
+def test_chunked_feeding_matches_whole_string():
+    text = json.dumps(CELLS, ensure_ascii=False)
+
+    whole = _parse(text)
+
+    assert whole == CELLS
+    for chunk_size in (1, 2, 3, 7, 64):
+        assert _parse(text, chunk_size) == whole
+
+
+def test_broken_output_recovers_same_cells_chunked_and_whole():
+    # missing comma, garbage between objects, a cut-off object in the middle and at the end
+    text = (
+        '[' + json.dumps(CELLS[0]) + json.dumps(CELLS[1]) + ' garbage, '
+        '{"bbox": [1, 2, 3, 4], "category": ' + json.dumps(CELLS[2]) + ',' + json.dumps(CELLS[3]) +
+        ', {"bbox": [10, 450, 500, 480], "category": "Text", "text": "cut of'
+    )
+
+    whole = _parse(text)
+
+    assert whole == CELLS
+    for chunk_size in (1, 5, 13):
+        assert _parse(text, chunk_size) == whole
+
+
+def test_repeated_cells_are_removed_while_streaming():
+    repeated = {"category": "Text", "text": "loop"}
+    text = json.dumps(CELLS[:1] + [CELLS[0]] + [repeated] * (DUP_PAIR_THRESHOLD + 2))
+
+    for chunk_size in (None, 4):
+        cells = _parse(text, chunk_size)
+        assert cells == [CELLS[0], repeated]
+
+
+def test_single_incomplete_object_keeps_partial_cell():
+    text = '[{"bbox": [1, 2, 30, 40], "category": "Text", "text": "partial te'
+
+    assert _parse(text) == _parse(text, 3) == [{"bbox": [1, 2, 30, 40], "category": "Text", "text": "partial te"}]
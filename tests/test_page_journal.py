@@ -0,0 +1,71 @@
+import json
+
+from dots_ocr.utils.page_journal import PageJournal
+
+
+def _page(tmp_path, page_no, body="text"):
+    md_path = tmp_path / f"doc_page_{page_no}.md"
+    md_path.write_text(body, encoding="utf-8")
+    return {"page_no": page_no, "md_content_path": str(md_path)}
+
+
+def test_resume_truncates_torn_last_line(tmp_path):
+    path = tmp_path / "doc_journal.jsonl"
+    journal = PageJournal(str(path), "hash", "prompt_layout_all_en")
+    journal.append(_page(tmp_path, 0))
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"doc_hash": "hash", "prompt_mode": "prompt_lay')  # crash mid-write
+
+    journal = PageJournal(str(path), "hash", "prompt_layout_all_en", resume=True)
+    assert sorted(journal.completed) == [0]
+    journal.append(_page(tmp_path, 1))
+    journal.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["result"]["page_no"] for line in lines] == [0, 1]
+    journal = PageJournal(str(path), "hash", "prompt_layout_all_en", resume=True)
+    assert sorted(journal.completed) == [0, 1]
+    journal.close()
+
+
+def test_resume_skips_other_documents_and_missing_artifacts(tmp_path):
+    path = tmp_path / "doc_journal.jsonl"
+    journal = PageJournal(str(path), "hash", "prompt_layout_all_en")
+    journal.append(_page(tmp_path, 0))
+    journal.append({"page_no": 1, "md_content_path": str(tmp_path / "gone.md")})
+    journal.close()
+
+    resumed = PageJournal(str(path), "hash", "prompt_layout_all_en", resume=True)
+    assert sorted(resumed.completed) == [0]
+    resumed.close()
+    other = PageJournal(str(path), "other-hash", "prompt_layout_all_en", resume=True)
+    assert other.completed == {}
+    other.close()
+
+
+def test_resume_reparses_page_whose_picture_crops_are_missing(tmp_path):
+    path = tmp_path / "doc_journal.jsonl"
+    journal = PageJournal(str(path), "hash", "prompt_layout_all_en")
+    journal.append(_page(tmp_path, 0, "intro\n\n![](images/abc.png)\n\n![](data:image/png;base64,AAAA)"))
+    journal.close()
+
+    resumed = PageJournal(str(path), "hash", "prompt_layout_all_en", resume=True)
+    assert resumed.completed == {}
+    resumed.close()
+
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "abc.png").write_bytes(b"png")
+    resumed = PageJournal(str(path), "hash", "prompt_layout_all_en", resume=True)
+    assert sorted(resumed.completed) == [0]
+    resumed.close()
+
+
+def test_without_resume_the_journal_starts_afresh(tmp_path):
+    path = tmp_path / "doc_journal.jsonl"
+    journal = PageJournal(str(path), "hash", "prompt_layout_all_en")
+    journal.append(_page(tmp_path, 0))
+    journal.close()
+
+    PageJournal(str(path), "hash", "prompt_layout_all_en").close()
+    assert path.read_text(encoding="utf-8") == ""
@@ -0,0 +1,60 @@
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import TokenBucketRateLimiter, get_rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", fake)
+    return fake
+
+
+def test_burst_is_free_then_requests_are_spaced_by_interval(clock):
+    limiter = TokenBucketRateLimiter(limit=60, window_seconds=60, burst=3)
+
+    waits = [limiter._reserve() for _ in range(5)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(1.0)
+    assert waits[4] == pytest.approx(2.0)
+    assert limiter.stats()["waited"] == 2
+
+
+def test_tokens_refill_over_time(clock):
+    limiter = TokenBucketRateLimiter(limit=60, window_seconds=60, burst=2)
+    limiter._reserve()
+    limiter._reserve()
+    assert limiter.tokens == pytest.approx(0.0)
+
+    clock.now += 1.0
+    assert limiter.tokens == pytest.approx(1.0)
+    clock.now += 10.0
+    assert limiter.tokens == pytest.approx(2.0)  # never more than burst
+
+
+def test_throttle_pauses_and_halves_rate_then_recovers(clock):
+    limiter = TokenBucketRateLimiter(limit=60, window_seconds=60, burst=1)
+
+    limiter.on_throttled(retry_after=5.0)
+
+    assert limiter.interval == pytest.approx(2.0)
+    assert limiter._reserve() == pytest.approx(5.0)
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.interval == pytest.approx(1.0)
+
+
+def test_get_rate_limiter_shares_one_instance_per_name():
+    first = get_rate_limiter("test-model", 10)
+    assert get_rate_limiter("test-model", 99) is first
+    assert first.limit == 10
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from splitters.semantic_chunker import SemanticSplitter, breakpoint_threshold, split_sentences
+
+
+class TopicEmbeddings(Embeddings):
+    """按主题词给出正交向量，记录每次 embed_documents 的输入"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[1.0, 0.0] if "Cats" in text else [0.0, 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+CATS_THEN_STOCKS = "Cats purr. Cats sleep.\nCats hunt. Stocks rose. Stocks fell. Stocks rallied."
+
+
+def test_abbreviations_do_not_end_sentences():
+    text = "As shown in Fig. 3, Smith et al. improve recall, e.g. on BEIR. J. Doe disagrees! See Eq. 2.\nNext line"
+
+    assert split_sentences(text) == [
+        "As shown in Fig. 3, Smith et al. improve recall, e.g. on BEIR.",
+        "J. Doe disagrees!",
+        "See Eq. 2.",
+        "Next line",
+    ]
+
+
+def test_chinese_and_plain_sentence_ends():
+    assert split_sentences("第一句。第二句！Third one. Fourth one? no. End") == [
+        "第一句。", "第二句！", "Third one.", "Fourth one?", "no.", "End",
+    ]
+
+
+@pytest.mark.parametrize("threshold_type, amount", [
+    ("percentile", 95), ("standard_deviation", 1.5), ("interquartile", 1.5),
+])
+def test_split_texts_breaks_at_topic_change(threshold_type, amount):
+    embeddings = TopicEmbeddings()
+    splitter = SemanticSplitter(embeddings, threshold_type, amount, buffer_size=0, use_cache=False)
+
+    chunks, short = splitter.split_texts([CATS_THEN_STOCKS, "Only one. Two."])
+
+    assert chunks == ["Cats purr. Cats sleep.\nCats hunt.", "Stocks rose. Stocks fell. Stocks rallied."]
+    assert short == ["Only one. Two."]
+    # 所有文本的句子一起去重嵌入，句子太少的文本不参与
+    assert len(embeddings.calls) == 1
+    assert sorted(embeddings.calls[0]) == sorted(set(split_sentences(CATS_THEN_STOCKS)))
+
+
+def test_breakpoint_thresholds():
+    distances = np.array([0.1, 0.2, 0.3, 0.4, 0.5])
+
+    assert breakpoint_threshold(distances, "percentile", 50)[0] == pytest.approx(0.3)
+    assert breakpoint_threshold(distances, "standard_deviation", 1)[0] == pytest.approx(0.3 + np.std(distances))
+    assert breakpoint_threshold(distances, "interquartile", 1)[0] == pytest.approx(0.5)
+    threshold, values = breakpoint_threshold(distances, "gradient", 50)
+    assert values == pytest.approx(np.full(5, 0.1))
+    with pytest.raises(ValueError):
+        breakpoint_threshold(distances, "median", 50)
@@ -0,0 +1,13 @@
+from splitters.benchmark_splitter import _normalized, make_corpus
+from splitters.splitter_md import MarkdownDirSplitter
+
+
+def test_single_pass_scan_matches_multipass(tmp_path):
+    md_files = make_corpus(str(tmp_path / "corpus"), n_files=4, seed=1)
+    single_dir, multi_dir = str(tmp_path / "single"), str(tmp_path / "multi")
+    single = MarkdownDirSplitter(images_output_dir=single_dir, max_workers=1)
+    multi = MarkdownDirSplitter(images_output_dir=multi_dir, max_workers=1)
+
+    for md_file in md_files:
+        expected = _normalized(multi.process_md_file_multipass(md_file), multi_dir)
+        assert _normalized(single.process_md_file(md_file), single_dir) == expected
@@ -0,0 +1,71 @@
+from milvus_db import streaming_ingest
+from milvus_db.milvus_db_with_schema import MilvusVectorSave
+from milvus_db.streaming_ingest import StreamingIngestPipeline
+
+
+class FakeParser:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeVectorSave:
+    can_delete_stale = staticmethod(MilvusVectorSave.can_delete_stale)
+
+    def __init__(self, existing):
+        self.existing = existing
+        self.written = []
+        self.deleted = []
+
+    def ensure_fingerprint_field(self):
+        pass
+
+    def query_existing_chunks(self, filename):
+        return list(self.existing)
+
+    def write_to_milvus(self, rows):
+        self.written.extend(rows)
+        return {"inserted": len(rows), "dead_letter": 0, "batches": 1}
+
+    def delete_by_ids(self, ids):
+        self.deleted.extend(ids)
+
+
+def make_pipeline(monkeypatch, pages, existing, embed_ok=lambda item: True):
+    def embed(items, max_workers):
+        return [dict(item, text_content_dense=[0.1]) if embed_ok(item) else item for item in items]
+
+    monkeypatch.setattr(streaming_ingest, "process_items_with_guard", embed)
+    pipeline = StreamingIngestPipeline(FakeParser(), splitter=None, vector_save=FakeVectorSave(existing))
+    pipeline._ocr_stage = lambda pdf_path, prompt_mode: iter(["page.md"] * len(pages))
+    pipeline._split_stage = lambda md_paths, source_filename: (page for page, _ in zip(pages, md_paths))
+    return pipeline
+
+
+def chunk(text):
+    return {"text": text, "image_path": "", "fingerprint": f"fp-{text}"}
+
+
+def test_rerun_writes_only_new_chunks_and_deletes_stale_ones(monkeypatch):
+    pages = [[chunk("a"), chunk("b")], [chunk("c")]]
+    existing = [(1, "fp-a"), (2, "fp-b"), (3, "fp-old")]
+    with make_pipeline(monkeypatch, pages, existing) as pipeline:
+        stats = pipeline.run("doc.pdf")
+
+    assert [row["text"] for row in pipeline.vector_save.written] == ["c"]
+    assert pipeline.vector_save.deleted == [3]
+    assert stats["pages"] == 2 and stats["inserted"] == 1 and stats["deleted"] == 1
+    assert pipeline.parser.closed
+
+
+def test_stale_chunks_are_kept_when_a_new_chunk_was_not_written(monkeypatch):
+    pages = [[chunk("a"), chunk("c")]]
+    pipeline = make_pipeline(monkeypatch, pages, [(1, "fp-a"), (3, "fp-old")],
+                             embed_ok=lambda item: item["text"] != "c")
+
+    stats = pipeline.run("doc.pdf")
+
+    assert pipeline.vector_save.written == []
+    assert pipeline.vector_save.deleted == []
+    assert stats["deleted"] == 0
@@ -0,0 +1,45 @@
+from langchain_core.documents import Document
+
+from splitters.splitter_md import MAX_CHUNK_CHARS, MarkdownDirSplitter
+from utils import token_utils
+from utils.common_utils import build_title_path
+from utils.token_utils import count_tokens, estimate_tokens
+
+
+def test_without_local_tokenizer_tokens_are_estimated(monkeypatch):
+    monkeypatch.setattr(token_utils, "EMBEDDING_TOKENIZER_PATH", None)
+    assert token_utils._load_counter() is estimate_tokens
+
+    monkeypatch.setattr(token_utils, "EMBEDDING_TOKENIZER_PATH", "/nonexistent/tokenizer")
+    assert token_utils._load_counter() is estimate_tokens
+
+
+def test_estimate_counts_cjk_characters_one_each():
+    assert estimate_tokens("向量检索") == 4
+    assert estimate_tokens("abcdef") == 2
+    assert estimate_tokens("检索 abc") == 2 + 2
+
+
+def test_fit_token_budget_counts_title_prefix(tmp_path):
+    splitter = MarkdownDirSplitter(images_output_dir=str(tmp_path), text_chunk_size=64, max_workers=1)
+    metadata = {"Header 1": "Chapter 1 Introduction", "Header 2": "1.1 Background", "embedding_type": "text"}
+    body = " ".join(f"sentence number {i} about retrieval." for i in range(200))
+    image = Document(page_content="images/a.png", metadata={"embedding_type": "image"})
+
+    fitted = splitter.fit_token_budget([Document(page_content=body, metadata=metadata), image])
+
+    assert fitted[-1] is image
+    texts = fitted[:-1]
+    assert len(texts) > 1
+    prefix = build_title_path(metadata) + ":"
+    for doc in texts:
+        assert doc.metadata == metadata
+        assert count_tokens(prefix + doc.page_content) <= 64
+        assert len(prefix + doc.page_content) <= MAX_CHUNK_CHARS
+
+
+def test_fit_token_budget_keeps_short_chunks_as_is(tmp_path):
+    splitter = MarkdownDirSplitter(images_output_dir=str(tmp_path), max_workers=1)
+    doc = Document(page_content="short text", metadata={"Header 1": "Title", "embedding_type": "text"})
+
+    assert splitter.fit_token_budget([doc]) == [doc]
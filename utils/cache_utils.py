@@ -0,0 +1,319 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from utils.log_utils import log
+
+# 获得当前项目的绝对路径
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_dir = os.path.join(root_dir, "cache")  # 存放本地缓存的目录
+
+EMBEDDING_CACHE_PATH = os.path.join(cache_dir, "embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 嵌入缓存体积上限 2GB，超过后按 LRU 淘汰
+
+DESCRIPTION_CACHE_PATH = os.path.join(cache_dir, "image_descriptions.sqlite3")
+DESCRIPTION_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 图片描述缓存体积上限 256MB，超过后按 LRU 淘汰
+
+_SQLITE_MAX_VARIABLES = 500  # 单条 IN 查询最多携带的参数个数
+EVICT_LOW_WATERMARK = 0.9  # 淘汰时一次降到上限的 90%，避免达到上限后每次写入都触发淘汰
+ACCESS_UPDATE_INTERVAL = 60.0  # 访问时间的刷新粒度（秒），更近期刷新过的命中项不再写库
+
+
+class SqliteLRUCache:
+    """基于 SQLite 的持久化键值缓存（值为二进制），按最近访问时间做体积受限的 LRU 淘汰
+
+    多线程共享同一个连接，所有读写都在锁内完成；WAL 模式下多个进程也可以同时读写同一个缓存文件。
+    总体积在内存中维护（打开时统计一次，写入/删除时增减），淘汰时再与表中实际值对齐，兼顾其他进程的写入。
+    访问时间按 access_update_interval 的粒度刷新，热点键的重复命中不会每次都触发写库和提交。
+    """
+
+    def __init__(self, db_path: str, max_bytes: int, table: str = "cache",
+                 access_update_interval: float = ACCESS_UPDATE_INTERVAL):
+        """
+        :param db_path: SQLite 文件路径
+        :param max_bytes: 缓存值的总体积上限（字节）
+        :param table: 表名
+        :param access_update_interval: 访问时间的刷新粒度（秒），0 表示每次命中都刷新
+        """
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.table = table
+        self.access_update_interval = access_update_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_access ON {table}(last_access)")
+            self._conn.commit()
+            self._total_bytes = self._sum_sizes()
+
+    def _sum_sizes(self) -> int:
+        """统计表中所有值的总体积（调用方持有锁）"""
+        return self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取单个键，命中时刷新访问时间"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """批量读取（预取），返回命中的键值对，并批量刷新命中项中访问时间已过期的那些"""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, bytes] = {}
+        stale: List[str] = []  # 访问时间早于刷新粒度、需要写回的命中项
+        with self._lock:
+            now = time.time()
+            for start in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+                chunk = keys[start:start + _SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, last_access FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value, last_access in rows:
+                    found[key] = value
+                    if now - last_access >= self.access_update_interval:
+                        stale.append(key)
+            if stale:
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key = ?", [(now, k) for k in stale]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: bytes):
+        """写入单个键值"""
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]):
+        """批量写入键值，写入后按需淘汰最久未访问的条目"""
+        now = time.time()
+        rows = list({key: (key, value, len(value), now) for key, value in items}.values())
+        if not rows:
+            return
+        with self._lock:
+            # 被覆盖的旧值不再占用体积
+            keys = [row[0] for row in rows]
+            replaced = 0
+            for start in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+                chunk = keys[start:start + _SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchone()[0]
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access) VALUES (?, ?, ?, ?)", rows
+            )
+            self._total_bytes += sum(row[2] for row in rows) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """总体积超过上限时，从最久未访问的条目开始删除，降到上限的 EVICT_LOW_WATERMARK（调用方持有锁）"""
+        self._total_bytes = self._sum_sizes()  # 与表中实际值对齐（其他进程可能也写入了）
+        if self._total_bytes <= self.max_bytes:
+            return
+        to_free = self._total_bytes - int(self.max_bytes * EVICT_LOW_WATERMARK)
+        victims = []
+        for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access"):
+            victims.append((key,))
+            to_free -= size
+            self._total_bytes -= size
+            if to_free <= 0:
+                break
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+        log.info(f"[缓存] {self.table} 超过 {self.max_bytes} 字节，淘汰 {len(victims)} 条最久未访问的记录")
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中/未命中次数、命中率以及当前条目数和体积"""
+        with self._lock:
+            count, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": count,
+                "bytes": total,
+            }
+
+
+def _content_digest(input_item: Dict) -> str:
+    """计算一条嵌入输入的内容哈希：文本按 utf-8，图片按解码后的字节（URL 则按 URL 本身）"""
+    sha = hashlib.sha256()
+    for field in sorted(input_item):
+        value = input_item[field] or ""
+        if field == "image" and value.startswith("data:") and "base64," in value:
+            data = base64.b64decode(value.split("base64,", 1)[1])
+        else:
+            data = str(value).encode("utf-8")
+        sha.update(field.encode("utf-8") + b"\0")
+        sha.update(hashlib.sha256(data).digest())
+    return sha.hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    """计算文件内容的 sha256，文件不存在或读取失败时返回 None"""
+    sha = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+    except OSError:
+        return None
+    return sha.hexdigest()
+
+
+# 向量按 float32 存储（与 Milvus 的 FLOAT_VECTOR 精度一致），编码方式写入缓存键，旧格式的条目自然失效
+VECTOR_FORMAT = "f32"
+
+
+def _encode_vector(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _decode_vector(value: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(value)
+    return vector.tolist()
+
+
+class EmbeddingCache(SqliteLRUCache):
+    """内容寻址的嵌入向量缓存，键为 (模型名, 模型版本, 输入内容的 sha256)"""
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        super().__init__(db_path, max_bytes, table="embeddings")
+
+    @staticmethod
+    def make_key(model: str, version: str, input_item: Dict) -> str:
+        """
+        :param model: 嵌入模型名称
+        :param version: 模型版本（模型升级后修改版本号即可让旧缓存失效）
+        :param input_item: 嵌入输入，如 {"text": "..."}、{"image": "data:image/png;base64,...", "text": "..."}
+        """
+        return f"{model}:{version}:{VECTOR_FORMAT}:{_content_digest(input_item)}"
+
+    def get_embeddings(self, model: str, version: str, input_data: List[Dict]) -> List[Optional[List[float]]]:
+        """批量查询嵌入向量，返回与 input_data 一一对应的结果，未命中为 None"""
+        keys = [self.make_key(model, version, item) for item in input_data]
+        found = self.get_many(keys)
+        return [_decode_vector(found[key]) if key in found else None for key in keys]
+
+    def put_embeddings(self, model: str, version: str, input_data: List[Dict], embeddings: List[List[float]]):
+        """批量写入嵌入向量，空向量（失败项）不写入"""
+        self.set_many(
+            (self.make_key(model, version, item), _encode_vector(embedding))
+            for item, embedding in zip(input_data, embeddings)
+            if embedding
+        )
+
+
+class CachedEmbeddings(Embeddings):
+    """为 LangChain 嵌入对象加一层持久化缓存，只对未命中的文本调用底层模型"""
+
+    def __init__(self, underlying: Embeddings, model_name: str, version: str = "1",
+                 cache: Optional[EmbeddingCache] = None):
+        """
+        :param underlying: 被包装的 LangChain 嵌入对象
+        :param model_name: 模型名称，作为缓存键的一部分
+        :param version: 模型版本，作为缓存键的一部分
+        :param cache: 使用的缓存实例，默认使用全局嵌入缓存
+        """
+        self.underlying = underlying
+        self.model_name = model_name
+        self.version = version
+        self.cache = cache or get_embedding_cache()
+
+    def _embed(self, texts: List[str], text_type: str) -> List[List[float]]:
+        # 文档与查询在部分模型中使用不同的 text_type，分开缓存
+        input_data = [{"text": text, "text_type": text_type} for text in texts]
+        results = self.cache.get_embeddings(self.model_name, self.version, input_data)
+        missing = [i for i, emb in enumerate(results) if emb is None]
+        if missing:
+            if text_type == "query":
+                computed = [self.underlying.embed_query(texts[i]) for i in missing]
+            else:
+                computed = self.underlying.embed_documents([texts[i] for i in missing])
+            self.cache.put_embeddings(self.model_name, self.version, [input_data[i] for i in missing], computed)
+            for i, embedding in zip(missing, computed):
+                results[i] = embedding
+        return results
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+
+class DescriptionCache(SqliteLRUCache):
+    """图片描述缓存，键为 (模型名, 提示词模板的 sha256, 图片内容的 sha256)
+
+    同一张图片（logo、跨页重复的图、重复入库的文档）只调用一次多模态模型。
+    """
+
+    def __init__(self, db_path: str = DESCRIPTION_CACHE_PATH, max_bytes: int = DESCRIPTION_CACHE_MAX_BYTES):
+        super().__init__(db_path, max_bytes, table="image_descriptions")
+
+    @staticmethod
+    def make_key(model: str, prompt_digest: str, image_digest: str) -> str:
+        """
+        :param model: 多模态模型名称
+        :param prompt_digest: 提示词模板的哈希（模板修改后旧缓存自动失效）
+        :param image_digest: 图片内容的 sha256
+        """
+        return f"{model}:{prompt_digest}:{image_digest}"
+
+    def get_descriptions(self, keys: Iterable[str]) -> Dict[str, str]:
+        """批量查询图片描述，返回命中的 键 → 描述"""
+        return {key: value.decode("utf-8") for key, value in self.get_many(keys).items()}
+
+    def put_descriptions(self, descriptions: Dict[str, str]):
+        """批量写入图片描述，空描述（失败项）不写入"""
+        self.set_many((key, text.encode("utf-8")) for key, text in descriptions.items() if text)
+
+
+# 全局嵌入缓存实例（单例模式）
+_embedding_cache_instance: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取全局嵌入缓存实例（单例）"""
+    global _embedding_cache_instance
+    with _embedding_cache_lock:
+        if _embedding_cache_instance is None:
+            _embedding_cache_instance = EmbeddingCache()
+        return _embedding_cache_instance
+
+
+# 全局图片描述缓存实例（单例模式）
+_description_cache_instance: Optional[DescriptionCache] = None
+_description_cache_lock = threading.Lock()
+
+
+def get_description_cache() -> DescriptionCache:
+    """获取全局图片描述缓存实例（单例）"""
+    global _description_cache_instance
+    with _description_cache_lock:
+        if _description_cache_instance is None:
+            _description_cache_instance = DescriptionCache()
+        return _description_cache_instance
@@ -1,7 +1,7 @@
 import os
 import re
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import shutil
 
 def get_filename(file_path, with_extension=True):
@@ -40,6 +40,17 @@ def get_sorted_md_files(input_dir: str) -> List[str]:
     return sorted_files
 
 
+def build_title_path(metadata: Dict) -> str:
+    """
+    按层级拼接 metadata 中非空的 Header（'Header 1' --> 'Header 2' --> ...），作为文本块的标题前缀
+    """
+    header_keys = [key for key in metadata.keys() if key.startswith('Header')]
+    # 按 Header 后的数字排序，确保层级顺序
+    header_keys_sorted = sorted(header_keys, key=lambda x: int(x.split()[1]) if x.split()[1].isdigit() else x)
+    headers = [metadata.get(key, '').strip() for key in header_keys_sorted]
+    return ' --> '.join(header for header in headers if header)
+
+
 def delete_directory_if_non_empty(dir_path):
     """
     删除指定目录（如果该目录存在且非空）
@@ -91,7 +102,7 @@ def get_surrounding_text_content(data_list, index):
     # 查找前一个文本字典
     i = index - 1
     while i >= 0:
-        if 'text' in data_list[i] and data_list[i].get('image_path') is None: # 检查是否为文本字典
+        if 'text' in data_list[i] and not data_list[i].get('image_path'): # 检查是否为文本字典
             prev_text = data_list[i].get('text')
             break
         i -= 1
@@ -99,7 +110,7 @@ def get_surrounding_text_content(data_list, index):
     # 查找后一个文本字典
     j = index + 1
     while j < len(data_list):
-        if 'text' in data_list[j] and data_list[j].get('image_path') is None: # 检查是否为文本字典
+        if 'text' in data_list[j] and not data_list[j].get('image_path'): # 检查是否为文本字典
             next_text = data_list[j].get('text')
             break
         j += 1
@@ -107,6 +118,35 @@ def get_surrounding_text_content(data_list, index):
     return prev_text, next_text
 
 
+def find_surrounding_texts(data_list) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    一次线性扫描，求出每个条目前后最近的文本字典的文本内容（结果与逐个调用 get_surrounding_text_content 相同）。
+
+    参数:
+        data_list: 包含字典的列表，每个字典有'text'和'image_path'键
+
+    返回:
+        与 data_list 一一对应的 (prev_text, next_text) 列表
+    """
+    is_text = ['text' in item and not item.get('image_path') for item in data_list]
+
+    prev_texts: List[Optional[str]] = []
+    last = None
+    for item, text_flag in zip(data_list, is_text):
+        prev_texts.append(last)
+        if text_flag:
+            last = item.get('text')
+
+    next_texts: List[Optional[str]] = [None] * len(data_list)
+    last = None
+    for i in range(len(data_list) - 1, -1, -1):
+        next_texts[i] = last
+        if is_text[i]:
+            last = data_list[i].get('text')
+
+    return list(zip(prev_texts, next_texts))
+
+
 def draw_graph(graph, file_name: str):
 
     mermaid_code = graph.get_graph().draw_mermaid_png()
@@ -0,0 +1,183 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.common_utils import build_title_path
+from utils.log_utils import log
+
+# ========= 配置区 =========
+DEDUP_THRESHOLD = 0.85  # 建议的近重复判定阈值（入库时去重默认关闭，需显式传入）：字符 shingle 集合的 Jaccard 相似度（MinHash 估计）不低于该值即视为重复
+DEDUP_SCOPE = "document"  # 去重范围：document 只在同一文件（metadata['source']）内去重；global 跨文件去重；两者都只在同一标题路径下比较
+NUM_PERM = 128  # MinHash 签名长度
+SHINGLE_SIZE = 4  # 字符 shingle 长度（去掉空白、转小写后计算，中英文通用）
+REPORT_EXAMPLES = 10  # 报告中列出的重复组数量
+# ======== 配置区结束 =========
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    """去掉空白、转小写后取字符 shingle，返回各 shingle 的 32 位哈希（去重）"""
+    normalized = _WHITESPACE.sub('', text).lower()
+    if len(normalized) <= shingle_size:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + shingle_size] for i in range(len(normalized) - shingle_size + 1)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """选择 bands × rows = num_perm，使 LSH 的 S 曲线拐点 (1/b)^(1/r) 最接近阈值"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateFilter:
+    """
+    基于 MinHash + LSH 的近重复文本块过滤器（页眉页脚、running title、版权声明、重复的参考文献片段等）
+
+    按输入顺序处理，保留第一次出现的文本块，丢弃之后与其相似度不低于阈值的文本块；图片块不参与去重。
+    只有标题路径（Header 1 --> Header 2 --> ...）相同的文本块之间才会判为重复，不同章节下的相同文本各自保留。
+    状态跨多次 filter 调用保留，逐页流式处理时对同一个实例依次传入各页即可跨页去重。
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, scope: str = DEDUP_SCOPE,
+                 num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        """
+        :param threshold: 近重复判定阈值（Jaccard 相似度，0~1）
+        :param scope: document：只在同一文件内去重；global：跨文件去重
+        :param num_perm: MinHash 签名长度
+        :param shingle_size: 字符 shingle 长度
+        :param seed: MinHash 置换参数的随机种子
+        """
+        if scope not in ("document", "global"):
+            raise ValueError(f"未知的去重范围: {scope}，可选 document / global")
+        self.threshold = threshold
+        self.scope = scope
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._exact: Dict[Tuple[Tuple[str, str], str], int] = {}  # (范围, 文本) → 保留块的编号
+        self._buckets: Dict[Tuple[Tuple[str, str], int, bytes], List[int]] = defaultdict(list)  # (范围, band, band 签名) → 保留块的编号
+        self._signatures: List[np.ndarray] = []
+        self._previews: List[str] = []
+
+        self.total = 0
+        self.dropped: List[Dict] = []
+
+    def signature(self, text: str) -> np.ndarray:
+        """计算文本的 MinHash 签名"""
+        hashes = _shingle_hashes(text, self.shingle_size)
+        # 与 datasketch 相同的置换：(a * h + b) mod p，取低 32 位；对所有置换和 shingle 一次算完
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def _scope_key(self, doc: Document) -> Tuple[str, str]:
+        """(文件, 标题路径)：global 范围不区分文件，但仍区分标题路径"""
+        source = doc.metadata.get('source', '') if self.scope == "document" else ""
+        return source, build_title_path(doc.metadata)
+
+    def _find_duplicate(self, scope_key: Tuple[str, str], signature: np.ndarray) -> Tuple[Optional[int], float]:
+        """在 LSH 桶中查找相似度不低于阈值的已保留块，返回 (编号, 估计相似度)"""
+        best, best_similarity = None, 0.0
+        seen = set()
+        for band in range(self.bands):
+            key = (scope_key, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for candidate in self._buckets.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold and similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+        return best, best_similarity
+
+    def _keep(self, scope_key: Tuple[str, str], text: str, signature: np.ndarray) -> int:
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._previews.append(text[:80])
+        self._exact[(scope_key, text)] = index
+        for band in range(self.bands):
+            self._buckets[(scope_key, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())].append(index)
+        return index
+
+    def filter(self, documents: List[Document]) -> List[Document]:
+        """过滤一批 Document，返回保留的 Document（保持原顺序）"""
+        kept = []
+        for doc in documents:
+            if doc.metadata.get('embedding_type', 'text') != 'text' or not doc.page_content.strip():
+                kept.append(doc)
+                continue
+            self.total += 1
+            scope_key = self._scope_key(doc)
+            text = doc.page_content.strip()
+
+            duplicate_of, similarity = self._exact.get((scope_key, text)), 1.0
+            if duplicate_of is None:
+                signature = self.signature(text)
+                duplicate_of, similarity = self._find_duplicate(scope_key, signature)
+                if duplicate_of is None:
+                    self._keep(scope_key, text, signature)
+                    kept.append(doc)
+                    continue
+            self.dropped.append({
+                "text": text[:80],
+                "source": doc.metadata.get('source', ''),
+                "duplicate_of": self._previews[duplicate_of],
+                "similarity": round(similarity, 3),
+            })
+        return kept
+
+    def report(self) -> Dict:
+        """
+        去重统计：文本块总数、丢弃数，以及丢弃最多的重复组（保留块的开头、被丢弃的次数）
+        """
+        groups: Dict[str, int] = defaultdict(int)
+        for item in self.dropped:
+            groups[item["duplicate_of"]] += 1
+        top = sorted(groups.items(), key=lambda kv: kv[1], reverse=True)[:REPORT_EXAMPLES]
+        return {
+            "total": self.total,
+            "dropped": len(self.dropped),
+            "kept": self.total - len(self.dropped),
+            "top_duplicates": [{"text": text, "count": count} for text, count in top],
+        }
+
+    def log_report(self):
+        report = self.report()
+        log.info(f"🧹 近重复去重（阈值 {self.threshold}，范围 {self.scope}）：文本块 {report['total']} 条，"
+                 f"丢弃 {report['dropped']} 条")
+        for group in report["top_duplicates"]:
+            log.info(f"   ×{group['count']}  {group['text']!r}")
+
+
+def dedup_documents(documents: List[Document], threshold: float = DEDUP_THRESHOLD,
+                    scope: str = DEDUP_SCOPE) -> Tuple[List[Document], Dict]:
+    """
+    对切分后的 Document 列表做近重复去重，保留第一次出现的文本块
+    :param threshold: 近重复判定阈值（Jaccard 相似度，0~1）
+    :param scope: document：只在同一文件内去重；global：跨文件去重（均只比较同一标题路径下的文本块）
+    :return: (保留的 Document 列表, 去重报告，见 NearDuplicateFilter.report)
+    """
+    dedup_filter = NearDuplicateFilter(threshold=threshold, scope=scope)
+    kept = dedup_filter.filter(documents)
+    dedup_filter.log_report()
+    return kept, dedup_filter.report()
@@ -1,15 +1,23 @@
+import asyncio
 import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from http import HTTPStatus
 from typing import Tuple, List, Dict, Optional
 
 import dashscope
 
+from utils.cache_utils import get_embedding_cache
 from utils.env_utils import ALIBABA_API_KEY
 from utils.log_utils import log
+from utils.rate_limiter import get_rate_limiter
 
 # ========= 配置区 =========
 DASHSCOPE_MODEL = "multimodal-embedding-v1"  # 指定使用的达摩院多模态嵌入模型名称
+DASHSCOPE_MODEL_VERSION = "1"  # 模型版本，服务端模型更新后修改此值即可让旧的嵌入缓存失效
+
+EMBEDDING_CACHE_ENABLED = True  # 是否启用本地持久化嵌入缓存（相同内容不重复调用 API）
 
 RPM_LIMIT = 120  # 每分钟最多调用次数（Requests Per Minute）
 WINDOW_SECONDS = 60  # 限流时间窗口（秒），与RPM_LIMIT配合实现每分钟限流
@@ -20,6 +28,14 @@ BASE_BACKOFF = 2.0  # 指数退避算法的基础等待时间（秒）
 
 # 图片最大体积（URL HEAD 检查），若超过则跳过图片项
 MAX_IMAGE_BYTES = 3 * 1024 * 1024  # 3MB
+
+# 批量调用限制：一次请求打包多条文本/图片，按条数、图片数和请求体积切分子批次
+MAX_BATCH_ITEMS = 20  # 单次请求最多包含的内容条数
+MAX_BATCH_IMAGES = 1  # 单次请求最多包含的图片条数（保守设置，按服务端限制调整）
+MAX_BATCH_BYTES = 6 * 1024 * 1024  # 单次请求体积上限（按 base64 字符串长度估算）
+
+# 并发控制：同时在途的嵌入请求数（所有线程共享同一个限流器）
+EMBED_CONCURRENCY = 4
 # ======== 配置区结束 =========
 
 
@@ -27,46 +43,8 @@ MAX_IMAGE_BYTES = 3 * 1024 * 1024  # 3MB
 all_data: List[Dict] = []
 
 
-class FixedWindowRateLimiter:
-    """固定窗口速率限制器类，用于控制API调用频率"""
-
-    def __init__(self, limit: int, window_seconds: int):
-        """初始化速率限制器
-
-        Args:
-            limit: 时间窗口内允许的最大请求数
-            window_seconds: 时间窗口长度（秒）
-        """
-        self.limit = limit
-        self.window_seconds = window_seconds
-        self.window_start = time.monotonic()  # 当前时间窗口的开始时间
-        self.count = 0  # 当前时间窗口内的请求计数
-
-    def acquire(self):
-        """获取请求许可，如果需要会阻塞直到可以继续请求"""
-        now = time.monotonic()
-        elapsed = now - self.window_start  # 计算当前时间窗口已过去的时间
-
-        # 如果已超过时间窗口，重置计数器和窗口开始时间
-        if elapsed >= self.window_seconds:
-            self.window_start = now
-            self.count = 0
-
-        # 如果当前窗口内请求数已达到限制，需要等待
-        if self.count >= self.limit:
-            sleep_sec = self.window_seconds - elapsed  # 计算需要等待的时间
-            if sleep_sec > 0:
-                print(f"[限速] 达到 {self.limit} 次请求，等待 {sleep_sec:.2f}s...")
-                time.sleep(sleep_sec)  # 阻塞等待
-            # 等待后重置计数器和窗口开始时间
-            self.window_start = time.monotonic()
-            self.count = 0
-
-        self.count += 1  # 增加请求计数
-
-
-# 创建全局速率限制器实例
-limiter = FixedWindowRateLimiter(RPM_LIMIT, WINDOW_SECONDS)
+# 全局速率限制器：按模型共享配额，API 请求与入库任务在同一进程内平滑共享
+limiter = get_rate_limiter(DASHSCOPE_MODEL, RPM_LIMIT, WINDOW_SECONDS)
 
 
 def image_to_base64(img: str) -> Tuple[str, str]:
@@ -140,18 +118,15 @@ def normalize_image(img: str) -> Tuple[str, str]:
     return "", ""
 
 
-def call_dashscope_once(input_data: List[Dict]) -> Tuple[bool, List[float], Optional[int], Optional[float]]:
-    """调用达摩院多模态嵌入API一次
+def _request_dashscope(input_data: List[Dict]) -> Tuple[bool, List[List[float]], Optional[int], Optional[float]]:
+    """发送一次达摩院多模态嵌入请求（不含限流），返回与 input_data 一一对应的嵌入向量列表
 
     Args:
-        input_data: 输入数据列表，包含文本或图像数据
+        input_data: 输入数据列表，每个元素为一条文本或图像数据
 
     Returns:
-        Tuple: (成功标志, 嵌入向量, HTTP状态码, 重试等待时间)
+        Tuple: (成功标志, 嵌入向量列表, HTTP状态码, 重试等待时间)
     """
-    # 应用速率限制
-    limiter.acquire()
-
     try:
         # 调用达摩院多模态嵌入API
         response = dashscope.MultiModalEmbedding.call(
@@ -179,6 +154,12 @@ def call_dashscope_once(input_data: List[Dict]) -> Tuple[bool, List[float], Opti
         pass
         # log.exception(e)
 
+    # 把服务端的限流信号反馈给限流器，自动降速
+    if status == HTTPStatus.TOO_MANY_REQUESTS:
+        limiter.on_throttled(retry_after)
+    elif status == HTTPStatus.OK:
+        limiter.on_success()
+
     # 获取API返回的代码和消息
     resp_code = getattr(response, "code", "")
     resp_msg = getattr(response, "message", "")
@@ -186,9 +167,15 @@ def call_dashscope_once(input_data: List[Dict]) -> Tuple[bool, List[float], Opti
     # 处理成功响应
     if status == HTTPStatus.OK:
         try:
-            # 提取嵌入向量
-            embedding = response.output['embeddings'][0]['embedding']
-            return True, embedding, status, retry_after
+            # 按返回的 index 把嵌入向量映射回输入位置（同一 index 只取第一条）
+            embeddings: List[Optional[List[float]]] = [None] * len(input_data)
+            for pos, emb in enumerate(response.output['embeddings']):
+                idx = emb.get('index', pos)
+                if 0 <= idx < len(embeddings) and embeddings[idx] is None:
+                    embeddings[idx] = emb['embedding']
+            if any(emb is None for emb in embeddings):
+                raise ValueError(f"返回的嵌入数量不足，期望 {len(input_data)} 条")
+            return True, embeddings, status, retry_after
         except Exception as e:
             print(f"解析嵌入失败：{e}")
             log.exception(e)
@@ -199,41 +186,269 @@ def call_dashscope_once(input_data: List[Dict]) -> Tuple[bool, List[float], Opti
         return False, [], status, retry_after
 
 
-def process_item_with_guard(item: Dict) -> Dict:
-    """处理单个数据项（文本或图像），生成嵌入向量
-    mode = 'text'：文本项：把 content 向量化；
-    mode = 'image'：图片项：向量化图片
+def _call_dashscope(input_data: List[Dict]) -> Tuple[bool, List[List[float]], Optional[int], Optional[float]]:
+    """限流后调用达摩院多模态嵌入API一次，返回与 input_data 一一对应的嵌入向量列表"""
+    # 应用速率限制：一次请求（无论包含多少条内容）只消耗一个令牌
+    limiter.acquire()
+    return _request_dashscope(input_data)
+
+
+def _lookup_cache(input_data: List[Dict]) -> List[Optional[List[float]]]:
+    """批量查询嵌入缓存，返回与 input_data 一一对应的结果，未命中（或未启用缓存）为 None"""
+    if not EMBEDDING_CACHE_ENABLED or not input_data:
+        return [None] * len(input_data)
+    try:
+        return get_embedding_cache().get_embeddings(DASHSCOPE_MODEL, DASHSCOPE_MODEL_VERSION, input_data)
+    except Exception as e:
+        log.exception(e)
+        return [None] * len(input_data)
+
+
+def _store_cache(input_data: List[Dict], embeddings: List[List[float]]):
+    """把成功的嵌入结果写入缓存"""
+    if not EMBEDDING_CACHE_ENABLED or not input_data:
+        return
+    try:
+        get_embedding_cache().put_embeddings(DASHSCOPE_MODEL, DASHSCOPE_MODEL_VERSION, input_data, embeddings)
+    except Exception as e:
+        log.exception(e)
+
+
+def call_dashscope_once(input_data: List[Dict]) -> Tuple[bool, List[float], Optional[int], Optional[float]]:
+    """调用达摩院多模态嵌入API一次（命中本地缓存时不发请求）
 
     Args:
-        item: 原始数据项
-        mode: 处理模式（'text'或'image'）
-        api_image: 当mode为'image'时使用的图像数据
+        input_data: 输入数据列表，包含文本或图像数据
 
     Returns:
-        Dict: 处理后的数据项，包含嵌入向量
+        Tuple: (成功标志, 嵌入向量, HTTP状态码, 重试等待时间)
+    """
+    cached = _lookup_cache(input_data[:1])[0]
+    if cached:
+        return True, cached, HTTPStatus.OK, None
+
+    ok, embeddings, status, retry_after = _call_dashscope(input_data)
+    if ok:
+        _store_cache(input_data[:1], embeddings[:1])
+        return True, embeddings[0], status, retry_after
+    return False, [], status, retry_after
+
+
+async def acall_dashscope_once(input_data: List[Dict]) -> Tuple[bool, List[float], Optional[int], Optional[float]]:
+    """call_dashscope_once 的异步版本：限流等待不阻塞事件循环，请求在线程中执行
+
+    Args:
+        input_data: 输入数据列表，包含文本或图像数据
+
+    Returns:
+        Tuple: (成功标志, 嵌入向量, HTTP状态码, 重试等待时间)
     """
-    # 创建原始项的副本以避免修改原数据
-    new_item = item.copy()
-    # raw_content = (new_item.get('text') or '').strip()
-    raw_content = (new_item.get('text') or '').strip()  # 获取文本内容
-    image_raw = (new_item.get('image_path') or '').strip()  # 获取原始图像路径
+    cached = (await asyncio.to_thread(_lookup_cache, input_data[:1]))[0]
+    if cached:
+        return True, cached, HTTPStatus.OK, None
+
+    await limiter.aacquire()
+    ok, embeddings, status, retry_after = await asyncio.to_thread(_request_dashscope, input_data)
+    if ok:
+        await asyncio.to_thread(_store_cache, input_data[:1], embeddings[:1])
+        return True, embeddings[0], status, retry_after
+    return False, [], status, retry_after
+
+
+def _estimate_input_bytes(input_item: Dict) -> int:
+    """估算单条输入在请求体中的体积（文本按 utf-8 字节，图片按 base64/URL 字符串长度）"""
+    return sum(len(str(value).encode("utf-8")) for value in input_item.values())
+
+
+def split_into_batches(input_data: List[Dict], max_batch: int = MAX_BATCH_ITEMS) -> List[List[int]]:
+    """按条数、图片数和请求体积把输入切分为多个子批次
+
+    Args:
+        input_data: 输入数据列表
+        max_batch: 每个子批次最多包含的条数
+
+    Returns:
+        List[List[int]]: 每个子批次包含的输入下标
+    """
+    max_batch = max(1, min(max_batch, MAX_BATCH_ITEMS))
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_images = 0
+    current_bytes = 0
+
+    for idx, input_item in enumerate(input_data):
+        is_image = bool(input_item.get("image"))
+        size = _estimate_input_bytes(input_item)
+        # 当前批次放不下这一条时，先收尾当前批次
+        if current and (
+            len(current) >= max_batch
+            or (is_image and current_images >= MAX_BATCH_IMAGES)
+            or current_bytes + size > MAX_BATCH_BYTES
+        ):
+            batches.append(current)
+            current, current_images, current_bytes = [], 0, 0
+        current.append(idx)
+        current_images += int(is_image)
+        current_bytes += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_retryable(status: Optional[int]) -> bool:
+    """429、5xx 以及网络异常（status 为 None）视为可重试的临时错误"""
+    return status is None or status == HTTPStatus.TOO_MANY_REQUESTS or status >= 500
+
+
+def _embed_sub_batch(input_data: List[Dict]) -> List[List[float]]:
+    """向量化一个子批次，失败时只重试该子批次
+
+    - 429/5xx/网络异常：指数退避（优先使用服务端返回的 Retry-After）后重试
+    - 其他错误：将子批次二分后分别请求，避免一条坏数据拖垮整批
+    - 最终失败的条目返回空列表
+    """
+    attempts = 0
+    while True:
+        ok, embeddings, status, retry_after = _call_dashscope(input_data)
+        if ok:
+            return embeddings
+
+        if not _is_retryable(status):
+            if len(input_data) > 1:
+                mid = len(input_data) // 2
+                print(f"[批量嵌入] 子批次（{len(input_data)} 条）请求失败，状态码 {status}，二分后重试")
+                return _embed_sub_batch(input_data[:mid]) + _embed_sub_batch(input_data[mid:])
+            return [[]]
+
+        attempts += 1
+        if not RETRY_ON_429 or attempts > MAX_429_RETRIES:
+            print(f"[批量嵌入] 超过最大重试次数，跳过该子批次（{len(input_data)} 条）")
+            return [[] for _ in input_data]
+        if status == HTTPStatus.TOO_MANY_REQUESTS:
+            # 429 已反馈给限流器，由限流器统一暂停并降速，下一次 acquire 会自动等待
+            print(f"[批量嵌入] 触发限流，第{attempts}次重试 …")
+            continue
+        # 抖动退避只阻塞当前工作线程，其他线程的子批次照常请求
+        backoff = (retry_after or BASE_BACKOFF * (2 ** (attempts - 1))) * (0.8 + random.random() * 0.4)
+        print(f"[批量嵌入] 状态码 {status}，第{attempts}次重试，sleep {backoff:.2f}s …")
+        time.sleep(backoff)
+
+
+def call_dashscope_batch(
+    input_data: List[Dict],
+    max_batch: int = MAX_BATCH_ITEMS,
+    max_workers: int = EMBED_CONCURRENCY,
+) -> List[List[float]]:
+    """批量调用达摩院多模态嵌入API
+
+    把多条文本/图片打包进同一次请求，按服务端条数/体积限制切分子批次，
+    并按下标把嵌入向量映射回输入；只有失败的子批次会被重试。
+    子批次由线程池并发请求，在途请求数不超过 max_workers，且共享全局限流器；
+    命中本地嵌入缓存的条目不会发起请求。
+
+    Args:
+        input_data: 输入数据列表，每个元素为一条文本或图像数据，如 {"text": "..."}、{"image": "...", "text": "..."}
+        max_batch: 每个子批次最多包含的条数
+        max_workers: 同时在途的请求数
+
+    Returns:
+        List[List[float]]: 与 input_data 一一对应的嵌入向量，失败的条目为空列表
+    """
+    # 批量预取缓存，只有未命中的条目才需要请求 API
+    cached = _lookup_cache(input_data)
+    results: List[List[float]] = [emb or [] for emb in cached]
+    missing = [i for i, emb in enumerate(cached) if emb is None]
+    if len(missing) < len(input_data):
+        print(f"[嵌入缓存] 命中 {len(input_data) - len(missing)}/{len(input_data)} 条")
+    if not missing:
+        return results
+
+    missing_data = [input_data[i] for i in missing]
+    batches = [[missing[j] for j in batch] for batch in split_into_batches(missing_data, max_batch)]
+
+    start = time.monotonic()
+    done_items = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = {
+            executor.submit(_embed_sub_batch, [input_data[i] for i in indices]): indices
+            for indices in batches
+        }
+        for batch_no, future in enumerate(as_completed(futures), 1):
+            indices = futures[future]
+            embeddings = future.result()
+            # 按下标写回，保证输出顺序与输入一致
+            for i, embedding in zip(indices, embeddings):
+                results[i] = embedding
+            _store_cache([input_data[i] for i in indices], embeddings)
+            done_items += len(indices)
+
+            # 进度打印
+            if batch_no % 20 == 0 or batch_no == len(batches):
+                elapsed = max(time.monotonic() - start, 1e-6)
+                print(f"[进度] 已处理 {done_items}/{len(missing)} 条，{done_items / elapsed:.2f} 条/秒")
+
+    return results
+
+
+def build_input_data(item: Dict) -> Dict:
+    """把单个数据项（文本或图像）转换为 DashScope 的输入元素
+
+    Args:
+        item: 原始数据项，包含 text / image_path 字段
 
+    Returns:
+        Dict: 文本项为 {"text": ...}，图片项为 {"image": ..., "text": ...}
+    """
+    raw_content = (item.get('text') or '').strip()  # 获取文本内容
+    image_raw = (item.get('image_path') or '').strip()  # 获取原始图像路径
 
     if image_raw:
         img = normalize_image(image_raw)[0]
-        input_data = [{"image": img, "text": raw_content}]
         log.info(f'图片：{image_raw}, 所对应的描述为{raw_content}')
-    else:
-        input_data = [{"text": raw_content}]
+        return {"image": img, "text": raw_content}
+    return {"text": raw_content}
 
-    ok, embedding, status, retry_after = call_dashscope_once(input_data)
-    if ok:
-        new_item['dense'] = embedding
-    else:
-        new_item['dense'] = []
+
+def process_items_with_guard(
+    items: List[Dict],
+    max_batch: int = MAX_BATCH_ITEMS,
+    max_workers: int = EMBED_CONCURRENCY,
+) -> List[Dict]:
+    """批量处理数据项（文本或图像），生成嵌入向量
+
+    Args:
+        items: 原始数据项列表
+        max_batch: 每次请求最多打包的条数
+        max_workers: 同时在途的请求数
+
+    Returns:
+        List[Dict]: 处理后的数据项（原始项的副本），嵌入向量写入 text_content_dense 字段，失败时为空列表
+    """
+    input_data = [build_input_data(item) for item in items]
+    embeddings = call_dashscope_batch(input_data, max_batch=max_batch, max_workers=max_workers)
+
+    processed = []
+    for item, embedding in zip(items, embeddings):
+        # 创建原始项的副本以避免修改原数据
+        new_item = item.copy()
+        new_item['text_content_dense'] = embedding
+        processed.append(new_item)
+    return processed
 
 
-    return new_item
+def process_item_with_guard(item: Dict) -> Dict:
+    """处理单个数据项（文本或图像），生成嵌入向量
+    mode = 'text'：文本项：把 content 向量化；
+    mode = 'image'：图片项：向量化图片
+
+    Args:
+        item: 原始数据项
+
+    Returns:
+        Dict: 处理后的数据项，包含嵌入向量
+    """
+    return process_items_with_guard([item], max_workers=1)[0]
 
 
 
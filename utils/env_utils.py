@@ -17,4 +17,7 @@ MINIMAX_BASE_URL = os.getenv('MINIMAX_BASE_URL')
 OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
 DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL')
 
-LOCAL_BASE_URL = os.getenv('LOCAL_BASE_URL')
\ No newline at end of file
+LOCAL_BASE_URL = os.getenv('LOCAL_BASE_URL')
+
+# 本地分词器（HuggingFace tokenizer 目录或 tokenizer.json），用于按嵌入模型 token 数切分文本块
+EMBEDDING_TOKENIZER_PATH = os.getenv('EMBEDDING_TOKENIZER_PATH')
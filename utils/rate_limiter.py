@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.log_utils import log
+
+
+class TokenBucketRateLimiter:
+    """线程安全的令牌桶（GCRA）速率限制器，同时支持同步与异步获取许可
+
+    - 按 limit / window_seconds 的速率匀速发放令牌，burst 控制允许的瞬时突发量，
+      任意一个时间窗口内的请求数不会超过 limit + burst（避免固定窗口边界处的 2 倍突发）
+    - 遇到 429 / Retry-After 时暂停发放并降低速率，之后随成功请求逐步恢复
+    - 记录当前令牌数、等待次数与等待时长，便于观察 API 请求与入库任务对配额的争用
+    """
+
+    def __init__(self, limit: int, window_seconds: float, burst: Optional[int] = None,
+                 min_rate_factor: float = 0.25, default_backoff: float = 2.0):
+        """初始化速率限制器
+
+        Args:
+            limit: 时间窗口内允许的最大请求数
+            window_seconds: 时间窗口长度（秒）
+            burst: 允许的瞬时突发请求数，默认取 limit 的 1/20（至少为 1）
+            min_rate_factor: 被限流后速率最多降低到的比例
+            default_backoff: 429 响应未携带 Retry-After 时暂停的秒数
+        """
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.burst = burst or max(1, limit // 20)
+        self.min_rate_factor = min_rate_factor
+        self.default_backoff = default_backoff
+
+        self._rate_factor = 1.0  # 当前速率相对配额的比例，被限流后降低
+        self._tat = time.monotonic()  # GCRA 的理论到达时间（theoretical arrival time）
+        self._lock = threading.Lock()
+
+        # 统计指标
+        self._acquired = 0
+        self._waited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._throttled = 0
+
+    @property
+    def interval(self) -> float:
+        """当前两次请求之间的最小间隔（秒）"""
+        return self.window_seconds / (self.limit * self._rate_factor)
+
+    @property
+    def tokens(self) -> float:
+        """当前可立即使用的令牌数"""
+        with self._lock:
+            return self._tokens(time.monotonic())
+
+    def _tokens(self, now: float) -> float:
+        interval = self.interval
+        available = self.burst - max(0.0, self._tat - now) / interval
+        return max(0.0, min(float(self.burst), available))
+
+    def _reserve(self) -> float:
+        """预占一个令牌，返回调用方需要等待的秒数（加锁时间极短，等待在锁外进行）"""
+        with self._lock:
+            now = time.monotonic()
+            interval = self.interval
+            tolerance = (self.burst - 1) * interval
+            tat = max(self._tat, now)
+            wait = max(0.0, tat - tolerance - now)
+            self._tat = tat + interval
+
+            self._acquired += 1
+            if wait > 0:
+                self._waited += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            return wait
+
+    def acquire(self):
+        """获取请求许可，如果需要会阻塞当前线程直到可以继续请求"""
+        wait = self._reserve()
+        if wait > 0:
+            if wait >= 1:
+                print(f"[限速] 令牌不足，等待 {wait:.2f}s...")
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """异步获取请求许可，等待期间不阻塞事件循环"""
+        wait = self._reserve()
+        if wait > 0:
+            if wait >= 1:
+                print(f"[限速] 令牌不足，等待 {wait:.2f}s...")
+            await asyncio.sleep(wait)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        """收到 429 时调用：暂停发放令牌 retry_after 秒，并把速率减半"""
+        with self._lock:
+            now = time.monotonic()
+            delay = retry_after if retry_after else self.default_backoff
+            self._rate_factor = max(self.min_rate_factor, self._rate_factor * 0.5)
+            self._tat = max(self._tat, now + delay + (self.burst - 1) * self.interval)
+            self._throttled += 1
+        log.warning(f"[限速] 触发服务端限流，暂停 {delay:.2f}s，速率降至 {self._rate_factor:.0%}")
+
+    def on_success(self):
+        """请求成功时调用：逐步恢复被降低的速率"""
+        if self._rate_factor < 1.0:
+            with self._lock:
+                self._rate_factor = min(1.0, self._rate_factor + 0.05)
+
+    def stats(self) -> Dict[str, float]:
+        """返回当前令牌数与等待耗时等统计指标"""
+        with self._lock:
+            return {
+                "tokens": round(self._tokens(time.monotonic()), 2),
+                "rate_per_minute": round(60 / self.interval, 2),
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "total_wait_seconds": round(self._total_wait, 3),
+                "max_wait_seconds": round(self._max_wait, 3),
+                "avg_wait_seconds": round(self._total_wait / self._waited, 3) if self._waited else 0.0,
+                "throttled": self._throttled,
+            }
+
+
+# 每个模型/接口一份配额，进程内所有调用方（API 请求、入库任务）共享
+_limiters: Dict[str, TokenBucketRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, limit: int, window_seconds: float = 60, burst: Optional[int] = None) -> TokenBucketRateLimiter:
+    """获取（不存在时创建）指定模型/接口的全局速率限制器
+
+    Args:
+        name: 配额名称，通常为模型名或接口地址
+        limit: 时间窗口内允许的最大请求数（仅在首次创建时生效）
+        window_seconds: 时间窗口长度（秒）
+        burst: 允许的瞬时突发请求数
+
+    Returns:
+        TokenBucketRateLimiter: 该配额对应的限流器
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = TokenBucketRateLimiter(limit, window_seconds, burst=burst)
+        return _limiters[name]
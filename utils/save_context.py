@@ -6,11 +6,14 @@ from pymilvus import MilvusClient
 
 from env_utils import CONTEXT_COLLECTION_NAME, MILVUS_URI
 from llm_utils import qwen_embeddings
+from utils.cache_utils import CachedEmbeddings
 from utils.log_utils import log
 
 client=MilvusClient(uri=MILVUS_URI, user='root', password='Milvus')
 # 全局线程池用于异步操作        更新用户的上下文数据库 如果生成了最终的回答 存入
 thread_pool = ThreadPoolExecutor(max_workers=5) # 创建一个线程池
+# 带持久化缓存的嵌入模型，相同文本不重复调用 API
+cached_qwen_embeddings = CachedEmbeddings(qwen_embeddings, model_name=qwen_embeddings.model)
 
 class OptimizedMilvusAsyncWriter:
     def __init__(self,
@@ -24,7 +27,7 @@ class OptimizedMilvusAsyncWriter:
         """异步生成稠密向量"""
         try:
 
-            dense_vector = qwen_embeddings.embed_query(text)
+            dense_vector = cached_qwen_embeddings.embed_query(text)
             return dense_vector
 
         except Exception as e:
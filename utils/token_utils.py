@@ -0,0 +1,106 @@
+import math
+import os
+import re
+import threading
+from typing import Callable, List, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from utils.env_utils import EMBEDDING_TOKENIZER_PATH
+from utils.log_utils import log
+
+# ========= 配置区 =========
+EMBEDDING_MAX_TOKENS = 512  # 嵌入模型（multimodal-embedding-v1）单条文本的 token 上限
+
+# 没有可用分词器时按字符数估算：CJK 字符按 1 个 token 计，其余字符按 CHARS_PER_TOKEN 个字符 1 个 token 计
+# 取值偏保守（实际分词通常更少），保证估算值不低于真实 token 数
+CHARS_PER_TOKEN = 3.0
+# ======== 配置区结束 =========
+
+_CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+_counter: Optional[Callable[[str], int]] = None
+_counter_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符比例估算 token 数（没有可用分词器时使用）"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def _load_counter() -> Callable[[str], int]:
+    """使用本地 HuggingFace 分词器（EMBEDDING_TOKENIZER_PATH），未配置或加载失败时按字符比例估算"""
+    if EMBEDDING_TOKENIZER_PATH:
+        try:
+            if os.path.isfile(EMBEDDING_TOKENIZER_PATH):
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_file(EMBEDDING_TOKENIZER_PATH)
+                log.info(f"使用本地分词器统计 token: {EMBEDDING_TOKENIZER_PATH}")
+                return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_TOKENIZER_PATH, local_files_only=True)
+            log.info(f"使用本地分词器统计 token: {EMBEDDING_TOKENIZER_PATH}")
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            log.warning(f"⚠️ 加载本地分词器失败（{EMBEDDING_TOKENIZER_PATH}）：{e}")
+    log.info("没有可用的本地分词器，按字符比例估算 token 数")
+    return estimate_tokens
+
+
+def count_tokens(text: str) -> int:
+    """统计文本的 token 数；分词器在第一次调用时加载，进程内共享"""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = _load_counter()
+    return _counter(text)
+
+
+def _fits(text: str, max_tokens: int, max_chars: Optional[int]) -> bool:
+    return (max_chars is None or len(text) <= max_chars) and count_tokens(text) <= max_tokens
+
+
+def _hard_split(text: str, max_tokens: int, max_chars: Optional[int]) -> List[str]:
+    """按字符二分查找不超过预算的最长前缀，逐段切开（兜底：分隔符切分后仍超长的片段）"""
+    pieces = []
+    while text and not _fits(text, max_tokens, max_chars):
+        lo, hi = 1, len(text) if max_chars is None else min(len(text), max_chars)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if _fits(text[:mid], max_tokens, max_chars):
+                lo = mid
+            else:
+                hi = mid - 1
+        pieces.append(text[:lo])
+        text = text[lo:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_text_by_tokens(text: str, max_tokens: int, overlap_tokens: int = 0, max_chars: Optional[int] = None) -> List[str]:
+    """
+    按 token 数切分文本，保证每一段都不超过 max_tokens 个 token（以及 max_chars 个字符）
+    先按段落 / 换行 / 空格递归切分，仍超长的片段再按字符硬切
+    :param max_tokens: 每段的 token 上限
+    :param overlap_tokens: 相邻两段的重叠 token 数
+    :param max_chars: 每段的字符数上限，None 表示不限制
+    """
+    max_tokens = max(1, max_tokens)
+    if _fits(text, max_tokens, max_chars):
+        return [text]
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=max_tokens,
+        chunk_overlap=min(overlap_tokens, max_tokens // 2),
+        length_function=count_tokens,
+        is_separator_regex=False,
+    )
+    pieces = []
+    for piece in splitter.split_text(text):
+        if _fits(piece, max_tokens, max_chars):
+            pieces.append(piece)
+        else:
+            pieces.extend(_hard_split(piece, max_tokens, max_chars))
+    return pieces